@@ -1,11 +1,30 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import streamlit as st
-import plotly.graph_objects as go
-import plotly.express as px
-import plotly.graph_objects as go
+
+# Il motore (caricamento, unione, KPI) non dipende da Streamlit; le librerie dei grafici
+# sono importate solo dalle funzioni che disegnano un grafico
+from archivio_storico import ArchivioStorico, anno_su_anno, data_da_periodo, periodo_da_data, ultimi_12_mesi
+from cache_arrow import ArrowCache
+from cache_parquet import DEFAULT_CACHE_DIR, ParquetCache
+from caricamento import MAX_CARICAMENTI, CaricamentoDataset
+from dataset import chiave_dataset
+from grafici import CacheFigure
+from indici import TUTTI
+from limite_calcoli import LimiteCalcoli
+from prestazioni import REGISTRO, inizia_rerun, misura, termina_rerun
+from kpi import (INCREMENTI_GRIGLIA, SCONTI_GRIGLIA, calcolo_griglia_scenari, calcolo_KPI_base, calcolo_KPI_scenario,
+                 classifica_clienti, curva_pareggio, interroga_cubo_KPI)
+from registro_dataset import RegistroDataset
 
 st.set_page_config(layout="wide")  # Configura il layout per occupare tutta la larghezza della pagina
 
+# Le misure dei tempi di questo rerun sono associate alla sessione (vedi la pagina "Prestazioni")
+inizia_rerun(st.session_state.setdefault('id_sessione', uuid.uuid4().hex[:8]))
+
 st.sidebar.title("Navigazione")
 
 
@@ -13,9 +32,13 @@ st.sidebar.title("Navigazione")
 if "pagina" not in st.session_state:
     st.session_state["pagina"] = "Caricamento File"
 
+# 🔹 La pagina "Prestazioni" è nascosta: compare solo aprendo il cruscotto con `?prestazioni=1`
+pagine = ["Caricamento File", "Dashboard"] + (["Prestazioni"] if "prestazioni" in st.query_params else [])
+if st.session_state["pagina"] not in pagine:
+    st.session_state["pagina"] = "Caricamento File"
+
 # 🔹 Usa `st.session_state["pagina"]` come valore iniziale della selectbox
-pagina = st.sidebar.selectbox("Seleziona una pagina", ["Caricamento File", "Dashboard"], 
-                              index=["Caricamento File", "Dashboard"].index(st.session_state["pagina"]))
+pagina = st.sidebar.selectbox("Seleziona una pagina", pagine, index=pagine.index(st.session_state["pagina"]))
 
 # 🔹 Solo se l'utente cambia pagina, aggiorna lo stato della sessione
 if pagina != st.session_state["pagina"]:
@@ -23,331 +46,264 @@ if pagina != st.session_state["pagina"]:
     st.rerun()  # 🔥 Forza l'aggiornamento della UI
 
 
-
-
-#Funzione per leggere il primo file excel
-def process_excel_to_dataframe(uploaded_file):
+@st.cache_resource
+def get_cache():
     """
-    Elabora un singolo file Excel e restituisce un DataFrame consolidato.
-
-    Args:
-        uploaded_file (UploadedFile): File caricato dall'utente.
-
-    Returns:
-        pd.DataFrame: DataFrame con i dati elaborati.
+    Restituisce la cache Parquet dei file elaborati, condivisa da tutte le sessioni del server.
     """
-    try:
-        # Legge tutti i fogli del file Excel
-        excel_data = pd.read_excel(uploaded_file, sheet_name=None)
-        first_sheet = list(excel_data.keys())[0]  # Recupera il primo foglio
-        metadata = excel_data[first_sheet]
-
-        # Estrai informazioni principali
-        cliente = metadata.iloc[0, 0]  
-        anno = int(float(str(metadata.iloc[0, 1]).replace(",", "").strip()))  
-        sconto_secondo_livello = float(metadata.iloc[0, 2]) if metadata.shape[1] > 2 else 0
-        sconto_primo_livello = float(metadata.iloc[0, 3]) if metadata.shape[1] > 3 else 0
-
-        # Inizializza il DataFrame consolidato
-        consolidated_data = pd.DataFrame()
+    return ParquetCache()
 
-        # Itera su tutti i fogli eccetto il primo (che è per i metadati)
-        for sheet_name, sheet_data in excel_data.items():
-            if sheet_name == first_sheet:
-                continue
 
-            sheet_data = sheet_data.iloc[:, :5]  # Prendi solo le prime 5 colonne
-            sheet_data['Cliente'] = cliente
-            sheet_data['Anno'] = anno
-            sheet_data['Mese'] = sheet_name
-            sheet_data['Sconto secondo livello'] = sconto_secondo_livello
-            sheet_data['Sconto primo livello'] = sconto_primo_livello
-
-            # Accoda i dati
-            consolidated_data = pd.concat([consolidated_data, sheet_data], ignore_index=True)
-
-        return consolidated_data
-
-    except Exception as e:
-        print(f"Errore durante l'elaborazione del file Excel: {e}")
-        return pd.DataFrame()
+@st.cache_resource
+def get_archivio():
     """
-    Elabora i file caricati, salvandoli in st.session_state per renderli accessibili alla dashboard.
-
-    Args:
-        uploaded_files (list): Lista di file caricati dall'utente.
+    Restituisce l'archivio Arrow dei dataset consolidati, condiviso da tutte le sessioni del server.
     """
-    dataframes = []
-    details_dataframe = None
-
-    for uploaded_file in uploaded_files:
-        filename = uploaded_file.name.lower()
-        df = pd.read_excel(uploaded_file, sheet_name=None)  # Legge tutti i fogli
-        
-        if filename == "dettagli_referenze.xlsx":
-            details_dataframe = process_second_excel_to_dataframe(df)
-        else:
-            dataframes.append(process_excel_to_dataframe(df))
-    
-    # Combina tutti i DataFrame in un unico DataFrame
-    if dataframes:
-        main_dataframe = pd.concat(dataframes, ignore_index=True)
-    else:
-        main_dataframe = pd.DataFrame()
-
-    # Memorizza i DataFrame nella sessione di Streamlit
-    st.session_state['main_dataframe'] = main_dataframe
-    st.session_state['details_dataframe'] = details_dataframe
+    return ArrowCache()
 
-    st.success("File caricati con successo! Ora puoi accedere alla Dashboard.")
 
+@st.cache_resource
+def get_registro():
     """
-    Legge un file Excel con dati organizzati su più fogli e restituisce un DataFrame consolidato con informazioni
-    sul cliente, anno, mese e le prime 5 colonne dei fogli mensili.
-
-    Args:
-        file_path (str): Il percorso del file Excel.
-
-    Returns:
-        pd.DataFrame: DataFrame consolidato con i dati richiesti.
+    Restituisce il registro dei dataset, condiviso da tutte le sessioni del server.
     """
-    try:
-        # Legge tutti i fogli del file Excel
-        excel_data = pd.read_excel(file_path, sheet_name=None) if isinstance(file_path, str) else file_path
+    return RegistroDataset()
 
-        
-        # Recupera il primo foglio per ottenere informazioni sul cliente e sull'anno
-        first_sheet = list(excel_data.keys())[0]
-        metadata = excel_data[first_sheet]
-        metadata.columns = metadata.columns.str.strip()  # Rimuove spazi dai nomi delle colonne
-        cliente = metadata.iloc[0, 0]  # Prima colonna, prima riga (Nome cliente)
-        
-        
 
+@st.cache_resource
+def get_limite_calcoli():
+    """
+    Restituisce il limite ai calcoli degli scenari eseguiti contemporaneamente, condiviso da tutte le sessioni.
+    """
+    return LimiteCalcoli()
 
 
-        # Corregge l'anno, rimuovendo caratteri non numerici e assicurandosi che sia un intero
-        anno = str(metadata.iloc[0, 1]).replace(",", "").strip()  # Rimuove virgole o spazi
-        anno = int(float(anno))  # Converte in intero per evitare errori
-        
-        # Controlla se la colonna dello sconto di secondo livello è disponibile
-        if metadata.shape[1] > 2:
-            sconto_secondo_livello = float(metadata.iloc[0, 2])
-        else:
-            sconto_secondo_livello = 0  # Valore predefinito
-            
-        # Controlla se la colonna dello sconto di primo livello è disponibile   
-        if metadata.shape[1] > 3:
-            sconto_primo_livello = float(metadata.iloc[0, 3])
-        else:
-            sconto_primo_livello = 0  # Valore predefinito
-        
-                
+@st.cache_resource
+def get_esecutore_caricamenti():
+    """
+    Restituisce il pool di thread che esegue i caricamenti dei file in background, condiviso da tutte le sessioni.
+    """
+    return ThreadPoolExecutor(max_workers=MAX_CARICAMENTI, thread_name_prefix="caricamento")
 
 
+@st.cache_resource
+def get_storico():
+    """
+    Restituisce l'archivio pluriennale delle vendite, condiviso da tutte le sessioni del server.
+    """
+    return ArchivioStorico()
 
-        # Inizializza un DataFrame vuoto per i dati consolidati
-        consolidated_data = pd.DataFrame()
 
-        # Itera su tutti i fogli eccetto il primo (che è per i metadati)
-        for sheet_name, sheet_data in excel_data.items():
-            if sheet_name == first_sheet:
-                continue
+@st.cache_resource
+def get_prestazioni():
+    """
+    Restituisce il registro delle misure dei tempi, condiviso da tutte le sessioni, con il log strutturato
+    nella cartella della cache.
+    """
+    REGISTRO.configura_log(os.path.join(DEFAULT_CACHE_DIR, "prestazioni.jsonl"))
+    return REGISTRO
 
-            # Estrae le prime 5 colonne del foglio
-            sheet_data = sheet_data.iloc[:, :5]
 
-            # Converte i valori numerici con virgola come separatore decimale
-            numeric_columns = ['Fatturato_Anno_Prec', 'Cartoni_Venduti_Prec', 'Fatturato', 'Cartoni_Venduti']
-            for col in numeric_columns:
-                if col in sheet_data.columns:
-                    sheet_data[col] = pd.to_numeric(sheet_data[col].replace(",", ".", regex=True), errors='coerce')
+def interrompi_se_superato():
+    """
+    Punto di interruzione dei calcoli: se la sessione ha già chiesto un nuovo rerun (ad esempio spostando
+    di nuovo un cursore), Streamlit interrompe qui l'esecuzione corrente, ormai superata.
+    """
+    # Ogni accesso allo stato della sessione è un punto in cui Streamlit gestisce le richieste di rerun
+    "pagina" in st.session_state
 
-            # Aggiunge colonne per cliente, anno, mese sconto di primo e secondo livello
-            sheet_data['Cliente'] = cliente
-            sheet_data['Anno'] = anno
-            sheet_data['Mese'] = sheet_name
-            sheet_data['Sconto secondo livello'] = sconto_secondo_livello
-            sheet_data['Sconto primo livello'] = sconto_primo_livello
-            
 
-            # Accoda i dati al DataFrame consolidato
-            consolidated_data = pd.concat([consolidated_data, sheet_data], ignore_index=True)
-            
-        # Specifica la colonna in cui vuoi eliminare le righe con valori nulli
-        colonna_target = 'Referente'
+# 🔹 Contatore degli accessi alla cache dei file elaborati e occupazione del registro dei dataset
+cache = get_cache()
+st.sidebar.caption(f"🗄️ Cache file: {cache.hits} hit / {cache.misses} miss")
+n_dataset, n_riferimenti, byte_dataset = get_registro().statistiche()
+st.sidebar.caption(f"📦 Dataset condivisi: {n_dataset} ({n_riferimenti} sessioni, {byte_dataset / 2**20:.1f} MB)")
+in_corso, in_attesa, annullati = get_limite_calcoli().statistiche()
+st.sidebar.caption(f"⏱️ Calcoli scenari: {in_corso} in corso / {in_attesa} in attesa / {annullati} annullati")
+# Attiva il log strutturato delle misure dei tempi al primo rerun del server
+get_prestazioni()
 
-        # Elimina le righe con valore nullo nella colonna specificata
-        consolidated_data = consolidated_data[consolidated_data[colonna_target].notna()]
 
-        # Trasforma 'Mese' e 'Anno' in 'Data'
-        consolidated_data = combine_month_year_to_date(consolidated_data)
 
-        return consolidated_data
-
-    except Exception as e:
-        print(f"Errore durante l'elaborazione del file Excel: {e}")
-        return pd.DataFrame()
+def process_uploaded_files(uploaded_files, n_processi=1, su_disco=False, incrementale=False, storico=True):
+    """
+    Avvia l'elaborazione in background dei file caricati dall'utente e apre la Dashboard.
 
+    Il dataset risultante è condiviso con le altre sessioni che hanno caricato gli stessi file:
+    se esiste già nel registro, i file non vengono rielaborati. Altrimenti il caricamento viene eseguito
+    dal pool condiviso e il suo avanzamento è mostrato da `mostra_avanzamento_caricamento`.
 
-def process_uploaded_files(uploaded_files):
-    """
-    Processa i file caricati dall'utente e li salva in `st.session_state`.
-    
     Args:
         uploaded_files (list): Lista di file caricati dall'utente.
+        n_processi (int): Numero di processi per l'elaborazione parallela dei file (1 = in sequenza).
+        su_disco (bool): Se True il dataset consolidato è conservato nell'archivio Arrow in memoria mappata.
+        incrementale (bool): Se True vengono elaborati solo i fogli mensili nuovi o modificati.
+        storico (bool): Se True le vendite caricate vengono aggiunte all'archivio pluriennale.
     """
-    dataframes = []
-    details_dataframe = None
-
-    for uploaded_file in uploaded_files:
-        filename = uploaded_file.name.lower()
-        df = pd.read_excel(uploaded_file, sheet_name=None)
-
-        if filename == "dettagli_referenze.xlsx":
-            details_dataframe = process_second_excel_to_dataframe(df)
+    precedente = st.session_state.get('dataset')
+    chiave = chiave_dataset(uploaded_files, precedente, incrementale)
+
+    # Se gli stessi file sono già in elaborazione il caricamento in corso prosegue
+    caricamento = st.session_state.get('caricamento')
+    if caricamento is None or caricamento.chiave != chiave:
+        annulla_caricamento()
+        esistente = get_registro().acquisisci_esistente(chiave)
+        if esistente is not None:
+            imposta_dataset(esistente, esistente.errori)
         else:
-            dataframes.append(process_excel_to_dataframe(uploaded_file))
-
-    if dataframes:
-        st.session_state['main_dataframe'] = pd.concat(dataframes, ignore_index=True)
-    if details_dataframe is not None:
-        st.session_state['details_dataframe'] = details_dataframe
+            st.session_state['caricamento'] = CaricamentoDataset(
+                chiave, uploaded_files, n_processi, None if precedente is None else precedente.dataset,
+                cache=get_cache(), archivio=get_archivio() if su_disco else None, incrementale=incrementale,
+                storico=get_storico() if storico else None,
+            ).avvia(get_esecutore_caricamenti())
 
     st.session_state["pagina"] = "Dashboard"
     st.rerun()
 
 
-def carica_file():
-    """
-    Interfaccia di caricamento file con Streamlit.
+def imposta_dataset(riferimento, errori):
     """
-    st.title("Caricamento File Excel")
-
-    # 🔹 Correzione principale: definire uploaded_files qui
-    uploaded_files = st.file_uploader("Carica i file Excel", type=["xlsx"], accept_multiple_files=True, key="file_upload")
-
-    if uploaded_files:
-        process_uploaded_files(uploaded_files)
-        st.success("File caricati con successo! Ora puoi accedere alla Dashboard.")
-
+    Sostituisce il dataset della sessione con un dataset del registro, rilasciando il precedente.
 
-
-#legge il secondo file excel
-
-def process_second_excel_to_dataframe(file_path):
+    Args:
+        riferimento (RiferimentoDataset): Riferimento al nuovo dataset.
+        errori (dict): Errori di elaborazione del caricamento, per nome del file.
     """
-    Legge un secondo file Excel e restituisce un DataFrame con le prime 5 colonne richieste.
+    precedente = st.session_state.get('dataset')
+    st.session_state['dataset'] = riferimento
+    if precedente is not None:
+        precedente.rilascia()
+    st.session_state.pop('memo_KPI_base', None)
+    st.session_state['errori_caricamento'] = errori
 
-    Args:
-        file_path (str): Il percorso del secondo file Excel.
 
-    Returns:
-        pd.DataFrame: DataFrame contenente le prime 6 colonne.
+def annulla_caricamento():
+    """
+    Annulla il caricamento in corso della sessione, se presente, e scarta il suo dataset parziale.
     """
-    try:
-        # Legge il file Excel e seleziona le prime 5 colonne
-        second_data = pd.read_excel(file_path, usecols=range(6)) if isinstance(file_path, str) else file_path[list(file_path.keys())[0]].iloc[:, :6]
+    caricamento = st.session_state.pop('caricamento', None)
+    if caricamento is not None:
+        caricamento.annulla()
+    if st.session_state.pop('dataset_parziale', None) is not None:
+        st.session_state.pop('memo_KPI_base', None)
 
 
-        # Rinomina le colonne per uniformità
-        second_data.columns = ['Referente', 'Nome', 'Quantita in grammi', 'Pezzi in un cartone', 'Ricetta', 'Listino']
+def dataset_corrente():
+    """
+    Restituisce il dataset da mostrare: quello parziale di un caricamento in corso, se presente,
+    altrimenti quello della sessione.
+    """
+    parziale = st.session_state.get('dataset_parziale')
+    return parziale if parziale is not None else st.session_state.get('dataset')
 
-        
-        return second_data
 
-    except Exception as e:
-        print(f"Errore durante l'elaborazione del secondo file Excel: {e}")
-        return pd.DataFrame()
+# Secondi tra due aggiornamenti dell'avanzamento di un caricamento in corso
+INTERVALLO_AVANZAMENTO = 1.0
 
 
-    #Funzione per combinare mesi e anni e assegnare a ogni riga la data mm/aa
-def combine_month_year_to_date(dataframe):
+@st.fragment(run_every=INTERVALLO_AVANZAMENTO)
+def mostra_avanzamento_caricamento():
     """
-    Combina le colonne 'Mese' e 'Anno' in una singola colonna datetime 'Data' nel formato mm/aaaa.
+    Mostra l'avanzamento del caricamento in background e lo conclude.
 
-    Args:
-        dataframe (pd.DataFrame): Il DataFrame con le colonne 'Mese' e 'Anno'.
-
-    Returns:
-        pd.DataFrame: Il DataFrame aggiornato con una singola colonna 'Data'.
+    Il frammento viene rieseguito a intervalli senza rieseguire la pagina; la pagina viene rieseguita
+    solo quando è disponibile un nuovo dataset parziale o quando il caricamento termina.
     """
-    try:
-        # Traduzione dei mesi dall'italiano all'inglese
-        months_translation = {
-            "GENNAIO": "January", "FEBBRAIO": "February", "MARZO": "March",
-            "APRILE": "April", "MAGGIO": "May", "GIUGNO": "June",
-            "LUGLIO": "July", "AGOSTO": "August", "SETTEMBRE": "September",
-            "OTTOBRE": "October", "NOVEMBRE": "November", "DICEMBRE": "December"
-        }
-        dataframe['Mese'] = dataframe['Mese'].map(months_translation)
-     
-        # Creazione della colonna 'Data' combinando 'Mese' e 'Anno'
-        dataframe['Data'] = pd.to_datetime(
-            dataframe['Mese'].str.strip() + ' ' + dataframe['Anno'].astype(str),
-            format='%B %Y',
-            errors='coerce'
-        ).dt.strftime('%m/%Y')
-
-        # Verifica se ci sono errori nella conversione
-        if dataframe['Data'].isna().any():
-            print("Alcuni valori di 'Mese' o 'Anno' non sono stati convertiti correttamente.")
-
-        # Rimuove le colonne 'Mese' e 'Anno'
-        dataframe.drop(columns=['Mese', 'Anno'], inplace=True)
+    caricamento = st.session_state.get('caricamento')
+    if caricamento is None:
+        return
 
-        return dataframe
+    if caricamento.terminato:
+        st.session_state.pop('caricamento', None)
+        st.session_state.pop('dataset_parziale', None)
+        st.session_state.pop('memo_KPI_base', None)
+        if caricamento.risultato is not None:
+            imposta_dataset(get_registro().acquisisci(caricamento.chiave, lambda: caricamento.risultato),
+                            caricamento.risultato.errori)
+        elif caricamento.eccezione is not None:
+            st.session_state['errori_caricamento'] = {
+                **caricamento.errori, "Caricamento interrotto": f"{type(caricamento.eccezione).__name__}: "
+                                                                f"{caricamento.eccezione}"}
+        st.rerun()
+
+    completati, totale = caricamento.avanzamento()
+    st.progress(completati / totale if totale else 0.0,
+                text=f"⏳ Caricamento in corso: {completati}/{totale} file elaborati")
+    if caricamento.versione and caricamento.parziale is not None:
+        st.caption("La dashboard mostra i clienti già elaborati.")
+    if st.button("Annulla caricamento"):
+        annulla_caricamento()
+        st.rerun()
+
+    # Un nuovo dataset parziale aggiorna l'intera pagina
+    if caricamento.versione != st.session_state.get('versione_parziale', 0) and caricamento.parziale is not None:
+        st.session_state['versione_parziale'] = caricamento.versione
+        st.session_state['dataset_parziale'] = caricamento.parziale
+        st.session_state.pop('memo_KPI_base', None)
+        st.rerun()
+
+
+def mostra_errori_caricamento():
+    """
+    Mostra l'elenco dei file che non è stato possibile elaborare durante l'ultimo caricamento
+    e dei codici 'Referente' venduti ma assenti dal catalogo.
+    """
+    errori = st.session_state.get('errori_caricamento')
+    if errori:
+        with st.expander(f"⚠️ {len(errori)} file non elaborati", expanded=True):
+            for nome_file, errore in errori.items():
+                st.error(f"**{nome_file}**: {errore}")
 
-    except Exception as e:
-        print(f"Errore durante la conversione delle colonne 'Mese' e 'Anno' in 'Data': {e}")
-        return dataframe
+    # Codici venduti ma assenti dal catalogo: entrerebbero nei KPI con costi e listini a zero
+    dataset = dataset_corrente()
+    non_trovate = None if dataset is None else dataset.referenze_non_trovate
+    if non_trovate is not None and not non_trovate.empty:
+        with st.expander(f"⚠️ {len(non_trovate)} codici Referente non presenti nel catalogo", expanded=False):
+            st.dataframe(non_trovate, width="stretch", hide_index=True)
 
 
-#funzione per combinare i due dataframe 
-def merge_with_second_dataframe(main_dataframe, second_dataframe):
+def carica_file():
     """
-    Unisce il DataFrame principale con il secondo DataFrame utilizzando la colonna 'Referente' come chiave.
+    Interfaccia di caricamento file con Streamlit.
+    """
+    st.title("Caricamento File Excel")
 
-    Args:
-        main_dataframe (pd.DataFrame): Il DataFrame principale contenente la colonna 'Referente'.
-        second_dataframe (pd.DataFrame): Il secondo DataFrame contenente i dettagli delle referenze.
+    # Numero di processi usati per elaborare i file in parallelo
+    n_processi = st.number_input("Processi per l'elaborazione dei file", min_value=1,
+                                 max_value=os.cpu_count() or 1, value=1,
+                                 help="Con più di un processo i file vengono elaborati in parallelo.")
+    su_disco = st.checkbox("Conserva il dataset su disco (memoria mappata)", value=False,
+                           help="Il dataset consolidato viene salvato in formato Arrow e letto senza copiarlo in memoria: "
+                                "i processi del server che lo aprono ne condividono le pagine.")
+    incrementale = st.checkbox("Aggiornamento incrementale", value=False,
+                               help="Vengono elaborati solo i fogli mensili nuovi o modificati rispetto all'ultimo "
+                                    "caricamento; le altre righe restano quelle già caricate.")
+    storico = st.checkbox("Aggiungi allo storico pluriennale", value=False,
+                          help="Le vendite vengono conservate su disco in un archivio per anno e mese, così che la "
+                               "Dashboard possa confrontare periodi di anni caricati in momenti diversi. L'archivio "
+                               "cresce a ogni caricamento e non viene svuotato automaticamente.")
 
-    Returns:
-        pd.DataFrame: DataFrame aggiornato con le colonne 'Nome', 'Quantita in grammi' e 'Pezzi in un cartone' aggiunte.
-    """
-    try:
-        # Verifica se le colonne richieste esistono nel secondo DataFrame
-        required_columns = ['Referente', 'Nome', 'Quantita in grammi', 'Pezzi in un cartone', 'Ricetta', 'Listino']
-        for col in required_columns:
-            if col not in second_dataframe.columns:
-                raise KeyError(f"La colonna '{col}' non è presente nel secondo DataFrame.")
-        
-        # Forza entrambi i DataFrame a trattare 'Referente' come stringa
-        main_dataframe['Referente'] = main_dataframe['Referente'].astype(str)
-        second_dataframe['Referente'] = second_dataframe['Referente'].astype(str)
-
-        # Unione dei DataFrame basata sulla colonna 'Referente'
-        merged_dataframe = main_dataframe.merge(
-            second_dataframe[required_columns],
-            on='Referente',
-            how='left'
-        )
+    # 🔹 Correzione principale: definire uploaded_files qui
+    uploaded_files = st.file_uploader("Carica i file Excel", type=["xlsx"], accept_multiple_files=True, key="file_upload")
+
+    if uploaded_files:
+        process_uploaded_files(uploaded_files, n_processi=int(n_processi), su_disco=su_disco,
+                               incrementale=incrementale, storico=storico)
+        st.success("File caricati con successo! Ora puoi accedere alla Dashboard.")
 
-        
-        
 
-        return merged_dataframe
 
-    except KeyError as e:
-        print(f"Errore di colonna: {e}")
-        return main_dataframe
+def figure_sessione():
+    """
+    Restituisce la cache delle figure Plotly della sessione.
 
-    except Exception as e:
-        print(f"Errore durante l'unione dei DataFrame: {e}")
-        return main_dataframe
+    Le figure vengono aggiornate sul posto a ogni rerun, quindi ogni sessione ha le proprie.
+    """
+    return st.session_state.setdefault('cache_figure', CacheFigure())
 
 
 #funzione per creare grafico ad anello
+@misura("grafico_ad_anello")
 def grafico_ad_anello(percentuale, titolo="Percentuale"):
     """
     Crea un grafico ad anello con un valore percentuale al centro.
@@ -365,47 +321,49 @@ def grafico_ad_anello(percentuale, titolo="Percentuale"):
     elif percentuale > 100:
         percentuale = 100
 
-    # Dati del grafico
-    valori = [percentuale, 100 - percentuale]
-    etichette = ["", ""]
-
-    # Creazione del grafico
-    fig = go.Figure(data=[
-        go.Pie(
-            values=valori,
-            labels=etichette,
-            hole=0.7,  # Rende il grafico un anello
-            marker=dict(colors=["#636EFA", "#E5ECF6"]),
-            showlegend=False,
-            textinfo="none"
+    def modello():
+        import plotly.graph_objects as go
+
+        # Creazione del grafico
+        fig = go.Figure(data=[
+            go.Pie(
+                labels=["", ""],
+                hole=0.7,  # Rende il grafico un anello
+                marker=dict(colors=["#636EFA", "#E5ECF6"]),
+                showlegend=False,
+                textinfo="none"
+            )
+        ])
+
+        # Aggiunta del testo al centro dell'anello
+        fig.add_annotation(
+            x=0.5, y=0.5,
+            font=dict(size=20, color="#000"),
+            showarrow=False
         )
-    ])
 
-    # Aggiunta del testo al centro dell'anello
-    fig.add_annotation(
-        text=f"<b>{percentuale:.2f}%</b>",
-        x=0.5, y=0.5,
-        font=dict(size=20, color="#000"),
-        showarrow=False
-    )
-
-    # Impostazioni del layout
-    fig.update_layout(
-        title=dict(
-            text=titolo,
-            x=0.5,
-            font=dict(size=15)
-        ),
-        margin=dict(t=20, b=20, l=20, r=20),
-        height=300,
-        width=300
-    )
+        # Impostazioni del layout
+        fig.update_layout(
+            title=dict(
+                text=titolo,
+                x=0.5,
+                font=dict(size=15)
+            ),
+            margin=dict(t=20, b=20, l=20, r=20),
+            height=300,
+            width=300
+        )
+        return fig
 
-    return fig
+    # Dati del grafico: solo valori e testo centrale cambiano tra un rerun e l'altro
+    return figure_sessione().figura(("anello", titolo), modello,
+                                    [{'values': [percentuale, 100 - percentuale]}],
+                                    {'annotations[0].text': f"<b>{percentuale:.2f}%</b>"})
 
 
 
 #funzione per creare grafico a barre orizzontali 
+@misura("grafico_margine_totale_e_promozione")
 def grafico_margine_totale_e_promozione(margine1, margine2):
     """
     Funzione per visualizzare un grafico a barre orizzontali con margini in euro utilizzando Plotly e Streamlit.
@@ -414,36 +372,102 @@ def grafico_margine_totale_e_promozione(margine1, margine2):
     - margine1 (float): Primo margine.
     - margine2 (float): Secondo margine.
     """
-    
-    # Etichette delle categorie e valori
-    categorie = ['Margine A.P.', 'Margine Promozione']
-    valori = [margine1, margine2]
-
-    # Creazione del grafico a barre orizzontali
-    fig = go.Figure(go.Bar(
-        x=valori,
-        y=categorie,
-        orientation='h',  # Barre orizzontali
-        marker_color=['#1f77b4', '#ff7f0e']  # Colori delle barre
-    ))
-
-    # Layout del grafico
-    fig.update_layout(
-        title="",
-        xaxis_title="Margine in euro (€)",
-        yaxis_title="",
-        xaxis=dict(
-            tickformat="€,",  # Formatta l'asse x con il simbolo dell'euro
-            showgrid=True,  # Linee della griglia
-        ),
-        template="plotly_white",  # Tema chiaro
-        height=300,
-    )
+    def modello():
+        import plotly.graph_objects as go
+
+        # Creazione del grafico a barre orizzontali
+        fig = go.Figure(go.Bar(
+            y=['Margine A.P.', 'Margine Promozione'],  # Etichette delle categorie
+            orientation='h',  # Barre orizzontali
+            marker_color=['#1f77b4', '#ff7f0e']  # Colori delle barre
+        ))
+
+        # Layout del grafico
+        fig.update_layout(
+            title="",
+            xaxis_title="Margine in euro (€)",
+            yaxis_title="",
+            xaxis=dict(
+                tickformat="€,",  # Formatta l'asse x con il simbolo dell'euro
+                showgrid=True,  # Linee della griglia
+            ),
+            template="plotly_white",  # Tema chiaro
+            height=300,
+        )
+        return fig
+
+    fig = figure_sessione().figura(("margine_totale_e_promozione",), modello, [{'x': [margine1, margine2]}])
 
     # Mostra il grafico nella dashboard Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(fig, width="stretch")
+
 
+#funzione per creare la mappa di calore degli scenari di promozione
+@misura("grafico_mappa_scenari")
+def grafico_mappa_scenari(griglia, sconti, incrementi, pareggio, sconto=None, incremento=None):
+    """
+    Funzione per visualizzare la mappa di calore del margine promozione per ogni sconto e incremento,
+    con la curva di pareggio rispetto al margine dell'anno precedente.
 
+    Parametri:
+    - griglia (dict): Griglia dei KPI restituita da `calcolo_griglia_scenari`.
+    - sconti (array): Valori di sconto della griglia.
+    - incrementi (array): Valori di incremento della griglia.
+    - pareggio (array): Incremento di pareggio per ogni sconto (`curva_pareggio`).
+    - sconto (float): Sconto selezionato, evidenziato sul grafico.
+    - incremento (float): Incremento selezionato, evidenziato sul grafico.
+    """
+    margine = griglia['margine_totale_scontato_con_incremento_e_sconto_secondo_livello']
+    con_scenario = sconto is not None and incremento is not None
+
+    def modello():
+        import plotly.graph_objects as go
+
+        fig = go.Figure(go.Heatmap(
+            colorscale="RdYlGn",
+            colorbar=dict(title="€", tickformat="€,"),
+            hovertemplate="Sconto %{x}%<br>Incremento %{y}%<br>Margine € %{z:,.0f}<extra></extra>"
+        ))
+
+        # Curva di pareggio: incremento minimo per non perdere margine rispetto all'anno precedente
+        fig.add_trace(go.Scatter(
+            mode="lines",
+            line=dict(color="#000", width=2),
+            name="Pareggio con A.P.",
+            hovertemplate="Sconto %{x}%<br>Incremento di pareggio %{y}%<extra></extra>"
+        ))
+
+        if con_scenario:
+            fig.add_trace(go.Scatter(
+                mode="markers",
+                marker=dict(color="#fff", size=12, line=dict(color="#000", width=2)),
+                name="Scenario selezionato"
+            ))
+
+        fig.update_layout(
+            xaxis_title="Sconto promozione (%)",
+            yaxis_title="Incremento cartoni venduti (%)",
+            template="plotly_white",
+            legend=dict(orientation="h", y=1.1),
+            height=450,
+        )
+        return fig
+
+    tracce = [
+        {'x': sconti, 'y': incrementi,
+         'z': margine.T,  # Righe = incrementi, colonne = sconti
+         'zmid': griglia['margine_totale_con_sconto_secondo_livello'][0, 0]},  # Il giallo corrisponde al margine A.P.
+        {'x': sconti, 'y': pareggio},
+    ]
+    if con_scenario:
+        tracce.append({'x': [sconto], 'y': [incremento]})
+    fig = figure_sessione().figura(("mappa_scenari", con_scenario), modello, tracce)
+
+    # Mostra il grafico nella dashboard Streamlit
+    st.plotly_chart(fig, width="stretch")
+
+
+@misura("grafico_andamentoo_del_margine")
 def grafico_andamentoo_del_margine(margine1, margine2, margine3, margine4, fatturato1, fatturato2):
     """
     Funzione per visualizzare un grafico a barre orizzontali con margini in euro utilizzando Plotly e Streamlit.
@@ -452,100 +476,233 @@ def grafico_andamentoo_del_margine(margine1, margine2, margine3, margine4, fattu
     - margine1 (float): Primo margine.
     - margine2 (float): Secondo margine.
     """
-    
-    # Etichette delle categorie e valori
-    categorie = ['Margine I° Liv. A.P.','Margine II° liv. A.P.', 'Fatturato A.P.', 'Margine Promozione', 'Margine promozione II° Liv.', 'Fatturato Promozione']
-    valori = [margine1, margine2, fatturato1, margine3, margine4, fatturato2]
+    def modello():
+        import plotly.graph_objects as go
+
+        # Creazione del grafico a barre orizzontali
+        fig = go.Figure(go.Bar(
+            x=['Margine I° Liv. A.P.','Margine II° liv. A.P.', 'Fatturato A.P.', 'Margine Promozione', 'Margine promozione II° Liv.', 'Fatturato Promozione'],
+            marker_color=['#1f77b4', '#ff7f0e']  # Colori delle barre
+        ))
+
+        # Layout del grafico
+        fig.update_layout(
+            title="",
+            xaxis_title="",
+            yaxis_title="(€)",
+            yaxis=dict(
+                tickformat="€,",  # Formatta l'asse x con il simbolo dell'euro
+                showgrid=True,  # Linee della griglia
+            ),
+            template="plotly_white",  # Tema chiaro
+            height=300,
+        )
+        return fig
 
-    # Creazione del grafico a barre orizzontali
-    fig = go.Figure(go.Bar(
-        x=categorie,
-        y=valori,
-        marker_color=['#1f77b4', '#ff7f0e']  # Colori delle barre
-    ))
-
-    # Layout del grafico
-    fig.update_layout(
-        title="",
-        xaxis_title="",
-        yaxis_title="(€)",
-        yaxis=dict(
-            tickformat="€,",  # Formatta l'asse x con il simbolo dell'euro
-            showgrid=True,  # Linee della griglia
-        ),
-        template="plotly_white",  # Tema chiaro
-        height=300,
-    )
+    valori = [margine1, margine2, fatturato1, margine3, margine4, fatturato2]
+    fig = figure_sessione().figura(("andamento_del_margine",), modello, [{'y': valori}])
 
     # Mostra il grafico nella dashboard Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(fig, width="stretch")
 
 
 
-#funzione per visualizzare dashboard interattiva
-def show_dashboard(dataframe):
+# Numero massimo di selezioni dei filtri di cui la sessione memorizza i KPI di base
+MAX_SELEZIONI_MEMORIZZATE = 64
+
+
+def KPI_base_per_selezione(cubo, indice, cliente, nome, grammatura, data_inizio, data_fine):
+    """
+    Restituisce i KPI di base per la selezione dei filtri, calcolandoli dal cubo solo la prima volta.
+
+    Args:
+        cubo (pd.DataFrame): Cubo dei KPI della sessione.
+        indice (IndiceFiltri): Indice delle celle del cubo.
+        cliente (str): Cliente selezionato, oppure "Tutti".
+        nome (str): Nome del prodotto selezionato, oppure "Tutti".
+        grammatura: Grammatura selezionata, oppure "Tutti".
+        data_inizio (pd.Timestamp): Data di inizio selezionata.
+        data_fine (pd.Timestamp): Data di fine selezionata.
+
+    Returns:
+        KPIBase: KPI di base restituiti da `calcolo_KPI_base`.
+    """
+    memo = st.session_state.setdefault('memo_KPI_base', {})
+    chiave = (cliente, nome, grammatura, data_inizio, data_fine)
+
+    if chiave not in memo:
+        # Elimina la selezione memorizzata da più tempo se si supera il limite
+        if len(memo) >= MAX_SELEZIONI_MEMORIZZATE:
+            memo.pop(next(iter(memo)))
+        with misura("filtro"):
+            memo[chiave] = calcolo_KPI_base(
+                interroga_cubo_KPI(cubo, cliente, nome, grammatura, data_inizio, data_fine, indice=indice))
+
+    return memo[chiave]
+
+
+# Modalità di confronto con lo storico pluriennale
+CONFRONTO_ANNO_SU_ANNO = "Anno su anno"
+CONFRONTO_ULTIMI_12_MESI = "Ultimi 12 mesi"
+
+
+def KPI_storico_per_selezione(storico, corrente, riferimento, cliente, nome, grammatura):
+    """
+    Restituisce i KPI dei due periodi da confrontare, leggendo dall'archivio solo la prima volta
+    e di nuovo solo dopo un suo aggiornamento.
+
+    Args:
+        storico (ArchivioStorico): Archivio pluriennale delle vendite.
+        corrente (tuple): (inizio, fine) del periodo corrente.
+        riferimento (tuple): (inizio, fine) del periodo di confronto.
+        cliente (str): Cliente selezionato, oppure "Tutti".
+        nome (str): Nome del prodotto selezionato, oppure "Tutti".
+        grammatura: Grammatura selezionata, oppure "Tutti".
+
+    Returns:
+        tuple: KPI del periodo corrente e del periodo di confronto (vedi `ArchivioStorico.confronta_periodi`).
+    """
+    memo = st.session_state.setdefault('memo_KPI_storico', {})
+    chiave = (corrente, riferimento, cliente, nome, grammatura, storico.versione)
+
+    if chiave not in memo:
+        if len(memo) >= MAX_SELEZIONI_MEMORIZZATE:
+            memo.pop(next(iter(memo)))
+        with misura("storico_confronto"):
+            memo[chiave] = storico.confronta_periodi(corrente, riferimento, cliente=cliente, nome=nome,
+                                                     grammatura=grammatura)
+
+    return memo[chiave]
+
+
+def mostra_confronto_storico(modalita, cliente, nome, grammatura, data_inizio, data_fine):
     """
-    Mostra una dashboard interattiva utilizzando Streamlit per visualizzare il DataFrame.
+    Mostra i KPI del periodo selezionato confrontati con un periodo precedente dell'archivio pluriennale.
 
     Args:
-        dataframe (pd.DataFrame): Il DataFrame da visualizzare nella dashboard.
+        modalita (str): `CONFRONTO_ANNO_SU_ANNO` oppure `CONFRONTO_ULTIMI_12_MESI`.
+        cliente (str): Cliente selezionato, oppure "Tutti".
+        nome (str): Nome del prodotto selezionato, oppure "Tutti".
+        grammatura: Grammatura selezionata, oppure "Tutti".
+        data_inizio (pd.Timestamp): Data di inizio selezionata.
+        data_fine (pd.Timestamp): Data di fine selezionata.
+    """
+    storico = get_storico()
+    st.write("### 📅 Confronto con lo storico")
+
+    periodi = storico.periodi()
+    if not periodi:
+        st.info("Lo storico pluriennale è vuoto: carica i file con l'opzione \"Aggiungi allo storico pluriennale\".")
+        return
+    st.caption(f"Storico disponibile da {data_da_periodo(periodi[0]):%m/%Y} a {data_da_periodo(periodi[-1]):%m/%Y}")
+
+    if modalita == CONFRONTO_ULTIMI_12_MESI:
+        corrente, riferimento = ultimi_12_mesi(periodo_da_data(data_fine))
+    else:
+        corrente, riferimento = anno_su_anno(periodo_da_data(data_inizio), periodo_da_data(data_fine))
+    kpi_corrente, kpi_riferimento = KPI_storico_per_selezione(storico, corrente, riferimento, cliente, nome, grammatura)
+
+    def etichetta(periodo):
+        return f"{data_da_periodo(periodo[0]):%m/%Y} - {data_da_periodo(periodo[1]):%m/%Y}"
+
+    if kpi_corrente is None or kpi_riferimento is None:
+        mancante = etichetta(corrente) if kpi_corrente is None else etichetta(riferimento)
+        st.info(f"Lo storico non contiene vendite del periodo {mancante}.")
+        return
+
+    st.write(f"##### {etichetta(corrente)} rispetto a {etichetta(riferimento)}")
+    colonne = st.columns(4)
+    for colonna, (titolo, attributo, formato) in zip(colonne, [
+            ("💰 Fatturato", 'fatturato', "€ {:,.0f}"),
+            ("📈 Cartoni venduti", 'cartoni_venduti', "{:,.0f}"),
+            ("📈 Margine dopo sconto canale", 'margine_totale', "€ {:,.0f}"),
+            ("📈 Margine Totale con sconto di secondo livello", 'margine_totale_con_sconto_secondo_livello', "€ {:,.0f}")]):
+        valore = getattr(kpi_corrente, attributo)
+        differenza = valore - getattr(kpi_riferimento, attributo)
+        # La differenza inizia con il segno, da cui Streamlit ricava il colore della variazione
+        colonna.metric(titolo, formato.format(valore), delta=f"{differenza:+,.0f}")
+
+
+# Numero di clienti mostrati in ciascuna delle due classifiche per margine
+N_CLIENTI_CLASSIFICA = 5
+
+
+#funzione per visualizzare dashboard interattiva
+def show_dashboard():
+    """
+    Mostra una dashboard interattiva utilizzando Streamlit per visualizzare il dataset della sessione.
+
+    I KPI vengono letti dal cubo e dal suo indice, non dalle righe di vendita.
     """
    
     st.title("Calcolatore Promozioni clienti")
     
-    # Controlla se i dati sono stati caricati
-    if 'main_dataframe' not in st.session_state or st.session_state['main_dataframe'].empty:
+    # Controlla se i dati sono stati caricati (anche solo in parte, durante un caricamento in corso)
+    dataset = dataset_corrente()
+    if dataset is None or dataset.main_dataframe is None or dataset.main_dataframe.empty:
         st.warning("Carica i file prima di accedere alla Dashboard.")
         return
-    
-    dataframe = st.session_state['main_dataframe']
+
+    if dataset.cubo is None:
+        st.error("La colonna 'Nome' non è presente nel DataFrame. Verificare l'unione dei dati.")
+        return
+
+    # Il cubo dei KPI e il suo indice sono costruiti al caricamento e condivisi in sola lettura tra le sessioni
+    cubo = dataset.cubo
+    indice = dataset.indice
     
     with st.sidebar:
         st.markdown("### 🔍 Filtro Dati")
         
+        # Le opzioni vengono dall'indice e sono a cascata: solo i Nome del cliente scelto,
+        # solo le grammature del cliente e del Nome scelti
         # Filtro Cliente
-        cliente_options = ["Tutti"] + list(dataframe['Cliente'].dropna().unique())
+        cliente_options = [TUTTI] + indice.opzioni('Cliente')
         cliente_filter = st.selectbox("Seleziona un cliente:", options=cliente_options)
         
         # Filtro Nome
-        nome_options = ["Tutti"] + list(dataframe['Nome'].dropna().unique())
+        nome_options = [TUTTI] + indice.opzioni('Nome', {'Cliente': cliente_filter})
         nome_filter = st.selectbox("Seleziona un Nome:", options=nome_options)
         
         # Filtro Grammatura
-        quantita_options = ["Tutti"] + list(dataframe['Quantita in grammi'].dropna().unique())
+        quantita_options = [TUTTI] + indice.opzioni('Quantita in grammi', {'Cliente': cliente_filter, 'Nome': nome_filter})
         quantita_gr = st.selectbox("Seleziona grammatura(gr):", options=quantita_options)
         
         # Filtro Date
         start_date = st.date_input("Seleziona la data di inizio:", value=pd.to_datetime("2024-01-01")).strftime('%Y-%m-%d')
         end_date = st.date_input("Seleziona la data di fine:", value=pd.to_datetime("2024-12-31")).strftime('%Y-%m-%d')
 
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
+        # Con il pulsante i cursori non avviano un rerun a ogni spostamento: lo scenario viene
+        # ricalcolato una sola volta alla conferma, con gli ultimi valori scelti
+        con_pulsante = st.toggle("Applica lo scenario con un pulsante", value=True)
 
-    dataframe['Data_datetime'] = pd.to_datetime(dataframe['Data'], format='%m/%Y', errors='coerce')
+        # Il confronto legge l'archivio pluriennale, limitandosi ai mesi dei due periodi confrontati
+        confronto_storico = st.toggle("Confronto con lo storico", value=False)
+        if confronto_storico:
+            modalita_confronto = st.radio("Periodo di confronto", [CONFRONTO_ANNO_SU_ANNO, CONFRONTO_ULTIMI_12_MESI])
 
-    # Applicazione dei filtri con l'opzione "Tutti"
-    filtered_data = dataframe[
-        ((dataframe['Cliente'] == cliente_filter) | (cliente_filter == "Tutti")) &
-        ((dataframe['Nome'] == nome_filter) | (nome_filter == "Tutti")) &
-        ((dataframe['Quantita in grammi'] == quantita_gr) | (quantita_gr == "Tutti")) &
-        (dataframe['Data_datetime'] >= start_date) &
-        (dataframe['Data_datetime'] <= end_date)
-    ]
+    start_date = pd.to_datetime(start_date)
+    end_date = pd.to_datetime(end_date)
 
-    if 'Nome' not in dataframe.columns:
-        st.error("La colonna 'Nome' non è presente nel DataFrame. Verificare l'unione dei dati.")
-        return
+    # Applicazione dei filtri con l'opzione "Tutti": i KPI di base sono memorizzati per selezione,
+    # così lo spostamento dei cursori di sconto e incremento non accede più ai dati
+    base = KPI_base_per_selezione(cubo, indice, cliente_filter, nome_filter, quantita_gr, start_date, end_date)
     
     
     # **Aggiungi il selettore di sconto con layout a colonne**
     sconto = 0
-    
-    col01, col02, col03, col4 = st.columns([1, 1, 1, 1])  # Configura la larghezza delle colonne
+
+    scenario = st.form("scenario", border=False) if con_pulsante else st.container()
+    with scenario:
+        col01, col02, col03, col4 = st.columns([1, 1, 1, 1])  # Configura la larghezza delle colonne
+        if con_pulsante:
+            with col03:
+                st.write("### Scenario")
+                st.form_submit_button("Applica scenario", type="primary")
 
     with col01:  # Posiziona il selettore nella colonna 
         st.write("### Sconto Applicabile")
-        sconto = st.slider("Seleziona lo sconto da applicare (%)", min_value=-70, max_value=70, value=0)
+        sconto = st.slider("Seleziona lo sconto da applicare (%)", min_value=-70, max_value=70, value=0, key="sconto")
     
     
     # **Aggiungi il selettore di sconto con layout a colonne**
@@ -556,7 +713,8 @@ def show_dashboard(dataframe):
         st.markdown("### 🔽 elimina promozione A.p.")
         azione_promozione = st.selectbox(
             "Seleziona un'azione per la promozione:",
-            options=["No", "Si"]
+            options=["No", "Si"],
+            key="azione_promozione"
         )
 
         
@@ -566,80 +724,70 @@ def show_dashboard(dataframe):
     with col4:  # Posiziona il selettore nella colonna 
     
         st.write("### Incremento Vendite")    
-        incremento = st.slider("Seleziona l'icremento di cartoni venduti(%)", min_value=0, max_value=200, value=0)
+        incremento = st.slider("Seleziona l'icremento di cartoni venduti(%)", min_value=0, max_value=200, value=0,
+                               key="incremento")
 
     st.divider()
     
     
-    # Calcola i KPI usando la funzione calcolo_KPI
-    (filtered_data, fatturato, margine_pezzo, margine_pezzo_ap, margine_cartone, margine_cartone_ap,
-     margine_totale, margine_totale_ap, cartoni_venduti, cartoni_venduti_ap,
-     pezzi_venduti, pezzi_venduti_ap, prezzo_cartone, prezzo_pezzo,
-     costo_cartone, costo_pezzo, costo_totale, prezzo_listino, sconto_applicato, sconto_secondo_livello,
-     prezzo_cartone_scontato, prezzo_pezzo_scontato, fatturato_scontato, sconto_prezzo_listino, 
-     margine_pezzo_scontato, margine_cartone_scontato, 
-     margine_totale_scontato, fatturato_con_sconto_incremento, 
-     cartoni_venduti_con_incremento, 
-     margine_totale_scontato_con_incremento, fatturato_sconto_secondo_livello,
-     margine_totale_con_sconto_secondo_livello, fatturato_con_sconto_incremento_e_sconto_secondo_livello,
-     margine_totale_scontato_con_incremento_e_sconto_secondo_livello, 
-     sconto_primo_livello,fatturato_ap_eliminata_promo,
-     margine_ap_eliminata_promo, fatturato_ap_eliminata_promo_con_sconto_secondo_liv, 
-     margine_ap_eliminata_promo_con_sconto_secondo_liv) = calcolo_KPI(filtered_data, sconto, incremento)
-    
-    # Prima riga: Margine totale, Margine totale AP, Grafico a barre
+    # KPI dello scenario a partire dai KPI di base, senza accedere ai dati: ogni KPI viene calcolato
+    # alla prima lettura, quindi la misura "kpi_scenario" comprende la prima riga di metriche che li legge
+    kpi = calcolo_KPI_scenario(base, sconto, incremento)
+
+    with misura("kpi_scenario"):
+        # Prima riga: Margine totale, Margine totale AP, Grafico a barre
     
-    col1, col2, col3 = st.columns([1,1,2])
-
-    # Colonna 1: Metriche A.p. 
-    # Aggiunta della visualizzazione condizionale nella colonna 1
-    with col1:
-        if azione_promozione == "No":
-            st.write("##### Anno precedente")
-            st.metric("💰 Fatturato", f"€ {fatturato:,.0f}")
-            st.metric("📈 Cartoni venduti", f" {cartoni_venduti:,.0f}")
-            st.metric("📈 Margine dopo sconto canale", f"€ {margine_totale:,.0f}")
-            st.metric("💰 Fatturato con sconto di secondo livello", f"€ {fatturato_sconto_secondo_livello:,.0f}")
-            st.metric("📈 Margine Totale con sconto di secondo livello", f"€ {margine_totale_con_sconto_secondo_livello:,.0f}")
-        elif azione_promozione == "Si":
-            st.write("##### Dati A.p. senza promozione")
-            st.metric("💰 Fatturato A.p. senza promozione", f"€ {fatturato_ap_eliminata_promo:,.0f}")
-            st.metric("📈 Cartoni venduti senza promozione", f" {cartoni_venduti_ap:,.0f}")
-            st.metric("📈 Margine A.p. senza promozione", f"€ {margine_ap_eliminata_promo:,.0f}")
-            st.metric("💰 Fatturato con sconto di secondo livello", f"€ {fatturato_ap_eliminata_promo_con_sconto_secondo_liv:,.0f}")
-            st.metric("📈 Margine Totale con sconto di secondo livello", f"€ {margine_ap_eliminata_promo_con_sconto_secondo_liv:,.0f}")
-
-
-    # Colonna 2: Metriche Promozione
-    with col2:
-        st.write("##### Promozione")
-        st.metric("💰 Fatturato", f"€ {fatturato_con_sconto_incremento:,.0f}")    
-        st.metric("📈 Cartoni venduti", f" {cartoni_venduti_con_incremento:,.0f}")
-        st.metric("📈 Margine dopo promozione", f"€ {margine_totale_scontato_con_incremento:,.0f}")
-        st.metric("💰 Fatturato con sconto di secondo livello", f"€ {fatturato_con_sconto_incremento_e_sconto_secondo_livello:,.0f}")
-        st.metric("📈 Margine Totale con sconto di secondo livello", f"€ {margine_totale_scontato_con_incremento_e_sconto_secondo_livello:,.0f}")
+        col1, col2, col3 = st.columns([1,1,2])
+
+        # Colonna 1: Metriche A.p. 
+        # Aggiunta della visualizzazione condizionale nella colonna 1
+        with col1:
+            if azione_promozione == "No":
+                st.write("##### Anno precedente")
+                st.metric("💰 Fatturato", f"€ {kpi.fatturato:,.0f}")
+                st.metric("📈 Cartoni venduti", f" {kpi.cartoni_venduti:,.0f}")
+                st.metric("📈 Margine dopo sconto canale", f"€ {kpi.margine_totale:,.0f}")
+                st.metric("💰 Fatturato con sconto di secondo livello", f"€ {kpi.fatturato_sconto_secondo_livello:,.0f}")
+                st.metric("📈 Margine Totale con sconto di secondo livello", f"€ {kpi.margine_totale_con_sconto_secondo_livello:,.0f}")
+            elif azione_promozione == "Si":
+                st.write("##### Dati A.p. senza promozione")
+                st.metric("💰 Fatturato A.p. senza promozione", f"€ {kpi.fatturato_ap_eliminata_promo:,.0f}")
+                st.metric("📈 Cartoni venduti senza promozione", f" {kpi.cartoni_venduti_ap:,.0f}")
+                st.metric("📈 Margine A.p. senza promozione", f"€ {kpi.margine_ap_eliminata_promo:,.0f}")
+                st.metric("💰 Fatturato con sconto di secondo livello", f"€ {kpi.fatturato_ap_eliminata_promo_con_sconto_secondo_liv:,.0f}")
+                st.metric("📈 Margine Totale con sconto di secondo livello", f"€ {kpi.margine_ap_eliminata_promo_con_sconto_secondo_liv:,.0f}")
+
+
+        # Colonna 2: Metriche Promozione
+        with col2:
+            st.write("##### Promozione")
+            st.metric("💰 Fatturato", f"€ {kpi.fatturato_con_sconto_incremento:,.0f}")    
+            st.metric("📈 Cartoni venduti", f" {kpi.cartoni_venduti_con_incremento:,.0f}")
+            st.metric("📈 Margine dopo promozione", f"€ {kpi.margine_totale_scontato_con_incremento:,.0f}")
+            st.metric("💰 Fatturato con sconto di secondo livello", f"€ {kpi.fatturato_con_sconto_incremento_e_sconto_secondo_livello:,.0f}")
+            st.metric("📈 Margine Totale con sconto di secondo livello", f"€ {kpi.margine_totale_scontato_con_incremento_e_sconto_secondo_livello:,.0f}")
 
         
         
-    with col3:
-        col01, col02, col03 = st.columns([1,1,1])
-        with col01:
-            st.metric("📉 Sconto anno prec. (I° Livello)", f"{sconto_applicato:,.2f} %")
-            st.metric("📉 Sconto canale standard", f"{sconto_primo_livello:,.2f} %")
+        with col3:
+            col01, col02, col03 = st.columns([1,1,1])
+            with col01:
+                st.metric("📉 Sconto anno prec. (I° Livello)", f"{kpi.sconto_applicato:,.2f} %")
+                st.metric("📉 Sconto canale standard", f"{kpi.sconto_primo_livello:,.2f} %")
             
-        with col02:
-            st.metric("📉 Sconto Promozione (I° Livello)", f"{sconto_prezzo_listino:,.2f} %")
-        with col03:
-            st.metric("📉 Sconto di II° livello", f"{sconto_secondo_livello:,.2f} %")
+            with col02:
+                st.metric("📉 Sconto Promozione (I° Livello)", f"{kpi.sconto_prezzo_listino:,.2f} %")
+            with col03:
+                st.metric("📉 Sconto di II° livello", f"{kpi.sconto_secondo_livello:,.2f} %")
    
-        #fig = grafico_ad_anello(sconto_applicato, titolo="Sconto Applicato")
-        #st.plotly_chart(fig, use_container_width=True)
-        grafico_margine_totale_e_promozione(margine_totale_con_sconto_secondo_livello, 
-                                            margine_totale_scontato_con_incremento_e_sconto_secondo_livello)
-        #grafico_andamentoo_del_margine(margine_totale, margine_totale_con_sconto_secondo_livello,
-                                       #margine_totale_scontato_con_incremento,
-                                       #margine_totale_scontato_con_incremento_e_sconto_secondo_livello, 
-                                       #fatturato, fatturato_con_sconto_incremento)
+            #fig = grafico_ad_anello(kpi.sconto_applicato, titolo="Sconto Applicato")
+            #st.plotly_chart(fig, use_container_width=True)
+            grafico_margine_totale_e_promozione(kpi.margine_totale_con_sconto_secondo_livello, 
+                                                kpi.margine_totale_scontato_con_incremento_e_sconto_secondo_livello)
+            #grafico_andamentoo_del_margine(kpi.margine_totale, kpi.margine_totale_con_sconto_secondo_livello,
+                                           #kpi.margine_totale_scontato_con_incremento,
+                                           #kpi.margine_totale_scontato_con_incremento_e_sconto_secondo_livello, 
+                                           #kpi.fatturato, kpi.fatturato_con_sconto_incremento)
         
     st.divider()
 
@@ -649,152 +797,105 @@ def show_dashboard(dataframe):
     # Seconda riga: Prezzi e costi
     st.write("### Prezzi e Costi")
     col4, col5, col6, col7 = st.columns(4)
-    col4.metric("📦 Prezzo Cartone", f"€ {prezzo_cartone:,.2f}")
-    col5.metric("🛒 Prezzo Pezzo", f"€ {prezzo_pezzo:,.2f}")
-    col6.metric("💸 Costo Cartone", f"€ {costo_cartone:,.2f}")
-    col7.metric("💳 Costo Pezzo", f"€ {costo_pezzo:,.2f}")
+    col4.metric("📦 Prezzo Cartone", f"€ {kpi.prezzo_cartone:,.2f}")
+    col5.metric("🛒 Prezzo Pezzo", f"€ {kpi.prezzo_pezzo:,.2f}")
+    col6.metric("💸 Costo Cartone", f"€ {kpi.costo_cartone:,.2f}")
+    col7.metric("💳 Costo Pezzo", f"€ {kpi.costo_pezzo:,.2f}")
 
     # Terza riga: Margini
     st.write("### Margini e Vendite")
     col8, col9, col10, col11 = st.columns(4)
-    col8.metric("📦 Margine Cartone", f"€ {margine_cartone:,.2f}")
-    col9.metric("🛒 Margine Pezzo", f"€ {margine_pezzo:,.2f}")
-    col10.metric("📦 Cartoni Venduti", f"{cartoni_venduti:,.0f}")
-    col11.metric("🛒 Pezzi Venduti", f"{pezzi_venduti:,.0f}")
+    col8.metric("📦 Margine Cartone", f"€ {kpi.margine_cartone:,.2f}")
+    col9.metric("🛒 Margine Pezzo", f"€ {kpi.margine_pezzo:,.2f}")
+    col10.metric("📦 Cartoni Venduti", f"{kpi.cartoni_venduti:,.0f}")
+    col11.metric("🛒 Pezzi Venduti", f"{kpi.pezzi_venduti:,.0f}")
 
     # Quarta riga: Margini anno precedente
     st.write("### Vendite Anno Precedente")
     col12, col13, col14, col15 = st.columns(4)
-    col12.metric("📦 Margine Cartone AP", f"€ {margine_cartone_ap:,.2f}")
-    col13.metric("🛒 Margine Pezzo AP", f"€ {margine_pezzo_ap:,.2f}")
-    col14.metric("📦 Cartoni Venduti AP", f"{cartoni_venduti_ap:,.0f}")
-    col15.metric("🛒 Pezzi Venduti AP", f"{pezzi_venduti_ap:,.0f}")
-
-
-#Funzione per il calcolo dei KPI
-def calcolo_KPI(dataframe, sconto, incremento):
+    col12.metric("📦 Margine Cartone AP", f"€ {kpi.margine_cartone_ap:,.2f}")
+    col13.metric("🛒 Margine Pezzo AP", f"€ {kpi.margine_pezzo_ap:,.2f}")
+    col14.metric("📦 Cartoni Venduti AP", f"{kpi.cartoni_venduti_ap:,.0f}")
+    col15.metric("🛒 Pezzi Venduti AP", f"{kpi.pezzi_venduti_ap:,.0f}")
+
+    if confronto_storico:
+        mostra_confronto_storico(modalita_confronto, cliente_filter, nome_filter, quantita_gr, start_date, end_date)
+
+    # Classifica dei clienti per margine con lo scenario corrente, calcolata per tutti i clienti insieme
+    st.write("### 🏆 Top/Bottom clienti per margine")
+    # I calcoli degli scenari sono limitati tra tutte le sessioni; quelli superati da un nuovo rerun
+    # vengono annullati mentre attendono il loro turno
+    with get_limite_calcoli().calcolo(interrompi_se_superato), misura("classifica_clienti"):
+        classifica = classifica_clienti(cubo, indice, nome_filter, quantita_gr, start_date, end_date, sconto,
+                                        incremento, senza_promo_ap=azione_promozione == "Si")
+    formato = {col: st.column_config.NumberColumn(format="€ %.0f")
+               for col in ['Fatturato promozione', 'Margine A.p.', 'Margine promozione', 'Differenza']}
+    col16, col17 = st.columns(2)
+    with col16:
+        st.write(f"##### Top {N_CLIENTI_CLASSIFICA}")
+        st.dataframe(classifica.head(N_CLIENTI_CLASSIFICA), column_config=formato, hide_index=True, width="stretch")
+    with col17:
+        st.write(f"##### Bottom {N_CLIENTI_CLASSIFICA}")
+        st.dataframe(classifica.tail(N_CLIENTI_CLASSIFICA).iloc[::-1], column_config=formato, hide_index=True,
+                     width="stretch")
+
+    # Quinta riga: tutti gli scenari di sconto e incremento calcolati in un'unica passata
+    with st.expander("🗺️ Analisi scenari di promozione"):
+        with get_limite_calcoli().calcolo(interrompi_se_superato), misura("griglia_scenari"):
+            griglia = calcolo_griglia_scenari(base)
+        grafico_mappa_scenari(griglia, SCONTI_GRIGLIA, INCREMENTI_GRIGLIA, curva_pareggio(griglia),
+                              sconto=sconto, incremento=incremento)
+
+
+def mostra_prestazioni():
     """
-    Calcola i KPI principali e restituisce i risultati aggregati.
-
-    Args:
-        dataframe (pd.DataFrame): Il DataFrame contenente i dati.
-        sconto (float): Percentuale di sconto da applicare.
-
-    Returns:
-        tuple: Valori calcolati dei KPI.
+    Pagina nascosta con i tempi delle fasi misurate in tutte le sessioni: percentili per fase
+    e ripartizione degli ultimi rerun.
     """
-    # Creare una copia esplicita del DataFrame
-    dataframe = dataframe.copy()
-
-    # Conversione delle colonne necessarie in valori numerici
-    colonne_da_convertire = [
-        'Pezzi in un cartone', 'Cartoni_Venduti', 'Cartoni_Venduti_Prec',
-        'Fatturato', 'Fatturato_Anno_Prec', 'Ricetta', 'Listino'
-    ]
-    for col in colonne_da_convertire:
-        if col in dataframe.columns:
-            dataframe[col] = pd.to_numeric(dataframe[col], errors='coerce').fillna(0)
-
-    # Modifiche al DataFrame usando `.loc`
-    dataframe.loc[:, 'pezzi_venduti'] = dataframe['Pezzi in un cartone'] * dataframe['Cartoni_Venduti']
-    dataframe.loc[:, 'pezzi_venduti_ap'] = dataframe['Pezzi in un cartone'] * dataframe['Cartoni_Venduti_Prec']
-
-    dataframe.loc[:, 'prezzo_pezzo_venduto'] = dataframe['Fatturato'] / dataframe['pezzi_venduti'].replace(0, 1)
-    dataframe.loc[:, 'prezzo_pezzo_venduto_ap'] = dataframe['Fatturato_Anno_Prec'] / dataframe['pezzi_venduti_ap'].replace(0, 1)
-
-    dataframe.loc[:, 'prezzo_cartone_venduto'] = dataframe['Fatturato'] / dataframe['Cartoni_Venduti'].replace(0, 1)
-    dataframe.loc[:, 'prezzo_cartone_venduto_ap'] = dataframe['Fatturato_Anno_Prec'] / dataframe['Cartoni_Venduti_Prec'].replace(0, 1)
-
-    dataframe.loc[:, 'costo_cartone'] = dataframe['Pezzi in un cartone'] * dataframe['Ricetta']
-    dataframe.loc[:, 'costo_totale'] = dataframe['pezzi_venduti'] * dataframe['Ricetta']
-
-    dataframe.loc[:, 'margine_pezzo'] = dataframe['prezzo_pezzo_venduto'] - dataframe['Ricetta']
-    dataframe.loc[:, 'margine_cartone'] = dataframe['prezzo_cartone_venduto'] - dataframe['costo_cartone']
-    dataframe.loc[:, 'margine_totale'] = dataframe['Fatturato'] - dataframe['costo_totale']
-
-    dataframe.loc[:, 'margine_pezzo_ap'] = dataframe['prezzo_pezzo_venduto_ap'] - dataframe['Ricetta']
-    dataframe.loc[:, 'margine_cartone_ap'] = dataframe['prezzo_cartone_venduto_ap'] - dataframe['costo_cartone']
-    dataframe.loc[:, 'margine_totale_ap'] = dataframe['Fatturato_Anno_Prec'] - dataframe['costo_totale']
-
-    # Calcolo dei risultati aggregati
-    fatturato = dataframe['Fatturato'].sum()
-    margine_pezzo = dataframe['margine_pezzo'].mean()
-    margine_pezzo_ap = dataframe['margine_pezzo_ap'].mean()
-    margine_cartone = dataframe['margine_cartone'].mean()
-    margine_cartone_ap = dataframe['margine_cartone_ap'].mean()
-    margine_totale = dataframe['margine_totale'].sum()
-    margine_totale_ap = dataframe['margine_totale_ap'].sum()
-    cartoni_venduti = dataframe['Cartoni_Venduti'].sum()
-    cartoni_venduti_ap = dataframe['Cartoni_Venduti_Prec'].sum()
-    pezzi_venduti = dataframe['pezzi_venduti'].sum()
-    pezzi_venduti_ap = dataframe['pezzi_venduti_ap'].sum()
-    prezzo_cartone = dataframe['prezzo_cartone_venduto'].mean()
-    prezzo_pezzo = dataframe['prezzo_pezzo_venduto'].mean()
-    costo_cartone = dataframe['costo_cartone'].mean()
-    costo_pezzo = dataframe['Ricetta'].mean()
-    costo_totale = dataframe['costo_totale'].sum()
-    prezzo_listino = dataframe['Listino'].mean()
-    sconto_secondo_livello = dataframe['Sconto secondo livello'].mean()
-    sconto_primo_livello = dataframe['Sconto primo livello'].mean()
+    prestazioni = get_prestazioni()
+    st.write("## ⏱️ Prestazioni")
+    st.caption(f"Log strutturato: {prestazioni.percorso_log or 'non attivo'}")
 
+    percentili = prestazioni.percentili()
+    if percentili.empty:
+        st.info("Nessuna misura registrata.")
+        return
 
-    
+    st.write("### Durata per fase (tutte le sessioni)")
+    formato = {col: st.column_config.NumberColumn(format="%.1f ms")
+               for col in percentili.columns if col.endswith('_ms')}
+    st.dataframe(percentili, column_config=formato, hide_index=True, width="stretch")
 
-    # Calcolo sconto e margini con sconto e incremento del numero di cartoni
-    prezzo_pezzo = fatturato / pezzi_venduti
-    prezzo_cartone = fatturato / cartoni_venduti
-    costo_pezzo = costo_totale / pezzi_venduti
-    costo_cartone = costo_totale / cartoni_venduti
-    sconto_applicato = (1 - prezzo_pezzo / prezzo_listino) * 100   #sconto di primo livello
-    prezzo_cartone_scontato = prezzo_cartone * (100 - sconto) / 100
-    prezzo_pezzo_scontato = prezzo_pezzo * (100 - sconto) / 100   #prezzo scontato con lo sconto inserito nella dashboard
-    fatturato_scontato = fatturato * (100 - sconto) / 100
-    sconto_prezzo_listino = (1 - prezzo_pezzo_scontato / prezzo_listino) * 100   #sconto finale di primo livello sul fatturato
-    margine_pezzo_scontato = prezzo_pezzo_scontato - costo_pezzo
-    margine_cartone_scontato = prezzo_cartone_scontato - costo_cartone
-    margine_totale_scontato = fatturato_scontato - costo_totale
-    cartoni_venduti_con_incremento = cartoni_venduti * (100 + incremento) / 100
-    fatturato_con_sconto_incremento = cartoni_venduti_con_incremento * prezzo_cartone_scontato
-    margine_totale_scontato_con_incremento = fatturato_con_sconto_incremento - (costo_cartone * cartoni_venduti_con_incremento)
-    
-    
-    #KPI A.p. senza promozioni 
-    fatturato_ap_eliminata_promo = (100-sconto_primo_livello)/100 * (pezzi_venduti * prezzo_listino)
-    margine_ap_eliminata_promo = fatturato_ap_eliminata_promo - costo_totale
-    
-    
-    #KPI con sconto di secondo livello
-    fatturato_sconto_secondo_livello = fatturato * (100 - sconto_secondo_livello) / 100
-    margine_totale_con_sconto_secondo_livello = fatturato_sconto_secondo_livello - costo_totale
-    fatturato_con_sconto_incremento_e_sconto_secondo_livello = fatturato_con_sconto_incremento * (100 - sconto_secondo_livello) / 100
-    margine_totale_scontato_con_incremento_e_sconto_secondo_livello = fatturato_con_sconto_incremento_e_sconto_secondo_livello - (costo_cartone * cartoni_venduti_con_incremento)
-    fatturato_ap_eliminata_promo_con_sconto_secondo_liv = fatturato_ap_eliminata_promo * (100 - sconto_secondo_livello) / 100
-    margine_ap_eliminata_promo_con_sconto_secondo_liv = fatturato_ap_eliminata_promo_con_sconto_secondo_liv - costo_totale
-
-    return (dataframe, fatturato, margine_pezzo, margine_pezzo_ap, margine_cartone, margine_cartone_ap, margine_totale, 
-            margine_totale_ap, cartoni_venduti, cartoni_venduti_ap, pezzi_venduti, pezzi_venduti_ap, prezzo_cartone, 
-            prezzo_pezzo, costo_cartone, costo_pezzo, costo_totale, prezzo_listino, sconto_applicato, sconto_secondo_livello, 
-            prezzo_cartone_scontato, prezzo_pezzo_scontato, fatturato_scontato, sconto_prezzo_listino, 
-            margine_pezzo_scontato, margine_cartone_scontato, margine_totale_scontato, fatturato_con_sconto_incremento, 
-            cartoni_venduti_con_incremento, margine_totale_scontato_con_incremento, fatturato_sconto_secondo_livello,
-            margine_totale_con_sconto_secondo_livello, fatturato_con_sconto_incremento_e_sconto_secondo_livello,
-            margine_totale_scontato_con_incremento_e_sconto_secondo_livello, sconto_primo_livello, fatturato_ap_eliminata_promo,
-            margine_ap_eliminata_promo, fatturato_ap_eliminata_promo_con_sconto_secondo_liv, 
-            margine_ap_eliminata_promo_con_sconto_secondo_liv)
+    st.write("### Ultimi rerun")
+    ripartizione = prestazioni.ripartizione_rerun()
+    if not ripartizione.empty:
+        # La durata complessiva comprende le fasi, che vengono mostrate separatamente
+        fasi = ripartizione.drop(columns='rerun', errors='ignore').droplevel('sessione')
+        st.bar_chart(fasi, y_label="ms")
+        st.dataframe(ripartizione, width="stretch")
 
 
 # MAIN
 st.title("Caricamento File Excel")
 
+# 🔹 Avanzamento del caricamento in background, su tutte le pagine: il frammento si riesegue a intervalli,
+# quindi viene mostrato solo durante un caricamento (al termine il suo `st.rerun()` lo rimuove)
+if 'caricamento' in st.session_state:
+    mostra_avanzamento_caricamento()
+
 
 # 🔹 Controlla quale pagina deve essere mostrata
 if st.session_state["pagina"] == "Caricamento File":
     carica_file()
 elif st.session_state["pagina"] == "Dashboard":
-    if "main_dataframe" in st.session_state and not st.session_state["main_dataframe"].empty:
-        show_dashboard(st.session_state["main_dataframe"])
+    mostra_errori_caricamento()
+    dataset = dataset_corrente()
+    if dataset is not None and dataset.main_dataframe is not None and not dataset.main_dataframe.empty:
+        show_dashboard()
     else:
         st.warning("⚠️ Carica almeno un file per continuare.")
+elif st.session_state["pagina"] == "Prestazioni":
+    mostra_prestazioni()
 
         
 
@@ -820,3 +921,6 @@ else:
 
 
 
+
+# Durata complessiva del rerun, per la pagina "Prestazioni"
+termina_rerun()
@@ -0,0 +1,280 @@
+"""
+Archivio pluriennale delle vendite, partizionato per anno e mese, senza dipendenze da Streamlit.
+
+Ogni caricamento copre un anno per cliente, confrontato solo con le colonne "anno precedente" dei fogli.
+L'archivio conserva invece le vendite di tutti i caricamenti in una cartella per mese
+(`anno=AAAA/mese=MM/`), con le righe unite al catalogo (`vendite.parquet`) e il cubo dei KPI del mese
+(`cubo.parquet`). Le letture aprono solo le partizioni dei mesi richiesti, così che i KPI di due periodi
+qualsiasi (anno su anno, ultimi 12 mesi) si calcolino senza leggere gli anni fuori dall'intervallo.
+
+A differenza di `StoricoVendite`, che tiene in memoria le vendite dell'ultimo caricamento per aggiornarle
+foglio per foglio, l'archivio resta su disco e accumula i caricamenti di tutti gli anni.
+"""
+import os
+import re
+import threading
+import uuid
+
+import pandas as pd
+
+from cache_parquet import DEFAULT_CACHE_DIR
+from indici import TUTTI
+from ingestione import CATEGORICAL_COLUMNS, INVALID_PERIOD, concat_normalized
+from kpi import calcolo_KPI_da_aggregati, costruisci_cubo_KPI, interroga_cubo_KPI
+
+# Cartella predefinita dell'archivio, dentro la cartella della cache dei file
+DEFAULT_STORICO_DIR = os.path.join(DEFAULT_CACHE_DIR, "storico")
+
+# File di ogni partizione mensile
+FILE_VENDITE = "vendite.parquet"
+FILE_CUBO = "cubo.parquet"
+
+# Nomi delle cartelle delle partizioni
+_CARTELLA_ANNO = re.compile(r"anno=(\d{4})$")
+_CARTELLA_MESE = re.compile(r"mese=(\d{2})$")
+
+
+def periodo_da_data(data):
+    """
+    Restituisce il periodo (anno * 12 + mese - 1, come la colonna 'Periodo') di una data.
+
+    Args:
+        data (pd.Timestamp | str): Una data qualsiasi del mese.
+
+    Returns:
+        int: Il periodo del mese.
+    """
+    data = pd.Timestamp(data)
+    return data.year * 12 + data.month - 1
+
+
+def data_da_periodo(periodo):
+    """
+    Restituisce il primo giorno del mese di un periodo.
+
+    Args:
+        periodo (int): Periodo (anno * 12 + mese - 1).
+
+    Returns:
+        pd.Timestamp: Primo giorno del mese.
+    """
+    anno, mese = divmod(int(periodo), 12)
+    return pd.Timestamp(year=anno, month=mese + 1, day=1)
+
+
+def anno_su_anno(inizio, fine):
+    """
+    Confronto anno su anno: l'intervallo scelto e lo stesso intervallo dell'anno prima.
+
+    Args:
+        inizio (int): Primo periodo dell'intervallo.
+        fine (int): Ultimo periodo dell'intervallo (incluso).
+
+    Returns:
+        tuple: ((inizio, fine) corrente, (inizio, fine) di riferimento).
+    """
+    return (inizio, fine), (inizio - 12, fine - 12)
+
+
+def ultimi_12_mesi(fine):
+    """
+    Confronto degli ultimi 12 mesi fino a `fine` con i 12 mesi precedenti.
+
+    Args:
+        fine (int): Ultimo periodo incluso.
+
+    Returns:
+        tuple: ((inizio, fine) corrente, (inizio, fine) di riferimento).
+    """
+    return (fine - 11, fine), (fine - 23, fine - 12)
+
+
+def _leggi(percorso, colonne=None):
+    """
+    Legge un file Parquet dell'archivio, oppure restituisce None se non esiste o non è leggibile.
+    """
+    try:
+        return pd.read_parquet(percorso, columns=colonne)
+    except Exception:
+        return None
+
+
+def _scrivi(dataframe, percorso):
+    """
+    Scrive un file Parquet dell'archivio in modo atomico: i lettori non vedono mai file parziali.
+    """
+    temporaneo = f"{percorso}.{uuid.uuid4().hex}.tmp"
+    try:
+        dataframe.to_parquet(temporaneo, index=False)
+        os.replace(temporaneo, percorso)
+    finally:
+        if os.path.exists(temporaneo):
+            os.remove(temporaneo)
+
+
+class ArchivioStorico:
+    """
+    Vendite di tutti gli anni caricati, una partizione Parquet per mese.
+
+    L'archivio presuppone un solo processo che scrive: `aggiungi` legge, unisce e riscrive ogni partizione
+    sotto un lock che serializza solo i thread dello stesso processo. Più processi del server che scrivono
+    nella stessa cartella possono perdere gli aggiornamenti l'uno dell'altro; le letture restano sicure
+    perché ogni file viene sostituito in modo atomico.
+
+    Args:
+        directory (str): Cartella dell'archivio.
+    """
+
+    def __init__(self, directory=DEFAULT_STORICO_DIR):
+        self.directory = directory
+        self.versione = 0  # Incrementata a ogni aggiornamento dell'archivio da questo processo
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _cartella(self, periodo):
+        anno, mese = divmod(int(periodo), 12)
+        return os.path.join(self.directory, f"anno={anno}", f"mese={mese + 1:02d}")
+
+    def periodi(self):
+        """
+        Restituisce i periodi presenti nell'archivio, leggendo solo i nomi delle cartelle.
+
+        Returns:
+            list: Periodi (anno * 12 + mese - 1) in ordine crescente.
+        """
+        periodi = []
+        for cartella_anno in os.scandir(self.directory):
+            anno = _CARTELLA_ANNO.match(cartella_anno.name)
+            if anno is None or not cartella_anno.is_dir():
+                continue
+            for cartella_mese in os.scandir(cartella_anno.path):
+                mese = _CARTELLA_MESE.match(cartella_mese.name)
+                if mese is not None and os.path.exists(os.path.join(cartella_mese.path, FILE_VENDITE)):
+                    periodi.append(int(anno.group(1)) * 12 + int(mese.group(1)) - 1)
+        return sorted(periodi)
+
+    def _partizioni(self, periodi):
+        """
+        Periodi richiesti che sono presenti nell'archivio (tutti se `periodi` è None).
+        """
+        presenti = self.periodi()
+        return presenti if periodi is None else sorted(set(presenti).intersection(periodi))
+
+    def aggiungi(self, vendite):
+        """
+        Salva le vendite nelle partizioni dei rispettivi mesi.
+
+        In ogni mese le righe dei clienti presenti in `vendite` sostituiscono quelle già archiviate per gli stessi
+        clienti; le righe degli altri clienti restano invariate. Le righe senza data non vengono archiviate.
+
+        Args:
+            vendite (pd.DataFrame): Vendite normalizzate e unite al catalogo, con le colonne 'Cliente' e 'Periodo'.
+
+        Returns:
+            int: Numero di partizioni scritte.
+        """
+        vendite = vendite[vendite['Periodo'] != INVALID_PERIOD]
+        scritte = 0
+        with self._lock:
+            for periodo, righe in vendite.groupby('Periodo', sort=True):
+                cartella = self._cartella(periodo)
+                esistenti = _leggi(os.path.join(cartella, FILE_VENDITE))
+                if esistenti is not None:
+                    esistenti = esistenti[~esistenti['Cliente'].isin(righe['Cliente'].unique())]
+                    if len(esistenti):
+                        righe = concat_normalized([esistenti, righe])
+
+                # Ogni partizione conserva solo le categorie dei propri valori
+                righe = righe.reset_index(drop=True)
+                for col in CATEGORICAL_COLUMNS:
+                    if col in righe.columns and isinstance(righe[col].dtype, pd.CategoricalDtype):
+                        righe[col] = righe[col].cat.remove_unused_categories()
+
+                os.makedirs(cartella, exist_ok=True)
+                _scrivi(righe, os.path.join(cartella, FILE_VENDITE))
+                if 'Nome' in righe.columns:
+                    _scrivi(costruisci_cubo_KPI(righe), os.path.join(cartella, FILE_CUBO))
+                scritte += 1
+            self.versione += 1
+        return scritte
+
+    def carica(self, periodi=None, colonne=None):
+        """
+        Legge le vendite dei soli mesi richiesti.
+
+        Args:
+            periodi (iterable): Periodi da leggere (per default tutti quelli dell'archivio).
+            colonne (list): Colonne da leggere (per default tutte).
+
+        Returns:
+            pd.DataFrame: Vendite dei mesi richiesti, oppure None se nessuno è presente nell'archivio.
+        """
+        parti = [_leggi(os.path.join(self._cartella(periodo), FILE_VENDITE), colonne)
+                 for periodo in self._partizioni(periodi)]
+        parti = [parte for parte in parti if parte is not None]
+        return concat_normalized(parti) if parti else None
+
+    def cubo(self, periodi=None):
+        """
+        Legge il cubo dei KPI dei soli mesi richiesti.
+
+        Args:
+            periodi (iterable): Periodi da leggere (per default tutti quelli dell'archivio).
+
+        Returns:
+            pd.DataFrame: Celle del cubo dei mesi richiesti (vedi `costruisci_cubo_KPI`), oppure None.
+        """
+        parti = [_leggi(os.path.join(self._cartella(periodo), FILE_CUBO)) for periodo in self._partizioni(periodi)]
+        parti = [parte for parte in parti if parte is not None]
+        if not parti:
+            return None
+
+        # Le categorie delle partizioni vengono unite come per le vendite: i valori mancanti
+        # (le referenze non trovate nel catalogo) restano NA e non diventano una categoria
+        cubo = concat_normalized(parti, normalize=False)
+        for col in ['Cliente', 'Nome']:
+            if not isinstance(cubo[col].dtype, pd.CategoricalDtype):
+                cubo[col] = cubo[col].astype('category')
+        return cubo
+
+    def calcolo_KPI_periodo(self, inizio, fine, sconto=0, incremento=0, cliente=TUTTI, nome=TUTTI, grammatura=TUTTI):
+        """
+        Calcola i KPI di un intervallo di mesi dal cubo delle sole partizioni dell'intervallo.
+
+        Le somme del cubo sono le stesse delle righe, quindi il risultato coincide con `calcolo_KPI`
+        sulle vendite dell'intervallo.
+
+        Args:
+            inizio (int): Primo periodo dell'intervallo.
+            fine (int): Ultimo periodo dell'intervallo (incluso).
+            sconto (float): Percentuale di sconto da applicare.
+            incremento (float): Percentuale di incremento dei cartoni venduti.
+            cliente (str): Cliente selezionato, oppure "Tutti".
+            nome (str): Nome del prodotto selezionato, oppure "Tutti".
+            grammatura: Grammatura selezionata, oppure "Tutti".
+
+        Returns:
+            RisultatoKPI: KPI dell'intervallo, oppure None se l'archivio non contiene nessuno dei mesi.
+        """
+        cubo = self.cubo(range(inizio, fine + 1))
+        if cubo is None:
+            return None
+        return calcolo_KPI_da_aggregati(interroga_cubo_KPI(cubo, cliente, nome, grammatura), sconto, incremento)
+
+    def confronta_periodi(self, corrente, riferimento, sconto=0, incremento=0, **filtri):
+        """
+        Calcola i KPI di due intervalli di mesi, ad esempio quelli di `anno_su_anno` o di `ultimi_12_mesi`.
+
+        Args:
+            corrente (tuple): (inizio, fine) dell'intervallo corrente.
+            riferimento (tuple): (inizio, fine) dell'intervallo di confronto.
+            sconto (float): Percentuale di sconto da applicare.
+            incremento (float): Percentuale di incremento dei cartoni venduti.
+            **filtri: Filtri `cliente`, `nome` e `grammatura` di `calcolo_KPI_periodo`.
+
+        Returns:
+            tuple: (KPI dell'intervallo corrente, KPI dell'intervallo di riferimento); ciascuno è None
+                se l'archivio non contiene nessuno dei mesi dell'intervallo.
+        """
+        return (self.calcolo_KPI_periodo(*corrente, sconto, incremento, **filtri),
+                self.calcolo_KPI_periodo(*riferimento, sconto, incremento, **filtri))
@@ -0,0 +1,73 @@
+"""
+Benchmark del tempo di avvio (import a freddo) dei moduli del cruscotto.
+
+Ogni import viene misurato in un nuovo interprete, così che nessun modulo sia già in memoria;
+per ciascuno viene riportata la mediana su più ripetizioni e quali librerie pesanti sono state caricate.
+Lo script della dashboard viene importato in modalità "bare" di Streamlit, cioè eseguito una volta
+senza server, come alla prima apertura della pagina.
+
+Per confrontare due versioni, indicare le cartelle dei sorgenti (ad esempio un `git worktree`
+della versione precedente):
+
+Uso:
+    python benchmarks/bench_avvio.py [cartella ...] [--ripetizioni N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+CARTELLA_PROGETTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Moduli misurati: il motore senza interfaccia e lo script della dashboard
+MODULI = ['ingestione', 'kpi', 'dataset', 'CruscottoV1']
+
+# Librerie di cui si verifica il caricamento all'import
+LIBRERIE_PESANTI = ['openpyxl', 'plotly.express', 'plotly.graph_objects', 'streamlit']
+
+_MISURA = """
+import sys, time
+sys.path.insert(0, {cartella!r})
+inizio = time.perf_counter()
+import {modulo}
+durata = time.perf_counter() - inizio
+print(durata, ','.join(m for m in {librerie!r} if m in sys.modules))
+"""
+
+
+def misura_import(cartella, modulo):
+    """
+    Importa il modulo in un nuovo interprete e restituisce la durata e le librerie pesanti caricate.
+
+    Returns:
+        tuple: (secondi, lista delle librerie caricate), oppure None se il modulo non esiste nella cartella.
+    """
+    if not os.path.exists(os.path.join(cartella, f"{modulo}.py")):
+        return None
+    codice = _MISURA.format(cartella=cartella, modulo=modulo, librerie=LIBRERIE_PESANTI)
+    risultato = subprocess.run([sys.executable, "-c", codice], cwd=cartella, capture_output=True, text=True,
+                               check=True)
+    durata, _, librerie = risultato.stdout.strip().splitlines()[-1].partition(" ")
+    return float(durata), [libreria for libreria in librerie.split(",") if libreria]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Misura il tempo di import a freddo dei moduli del cruscotto.")
+    parser.add_argument("cartelle", nargs="*", default=[CARTELLA_PROGETTO], help="Cartelle dei sorgenti da confrontare")
+    parser.add_argument("--ripetizioni", "-n", type=int, default=5, help="Ripetizioni per ogni modulo")
+    args = parser.parse_args()
+
+    print(f"{'Cartella':<24} {'Modulo':<12} {'Mediana (ms)':>13}  Librerie caricate")
+    for cartella in args.cartelle:
+        cartella = os.path.abspath(cartella)
+        for modulo in MODULI:
+            misure = [misura_import(cartella, modulo) for _ in range(args.ripetizioni)]
+            if misure[0] is None:
+                continue
+            mediana = statistics.median(durata for durata, _ in misure) * 1000
+            print(f"{os.path.basename(cartella):<24} {modulo:<12} {mediana:>13.0f}  {', '.join(misure[-1][1]) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
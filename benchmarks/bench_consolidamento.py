@@ -0,0 +1,73 @@
+"""
+Micro-benchmark del consolidamento dei fogli mensili di una cartella di lavoro cliente.
+
+Confronta l'accodamento con `pd.concat` a ogni foglio (costo quadratico nel numero di fogli)
+con la concatenazione unica usata da `process_excel_to_dataframe`, su cartelle di lavoro
+da 12 a 120 fogli già lette in memoria, così da escludere il costo di openpyxl e della
+conversione delle date.
+
+Uso:
+    python benchmarks/bench_consolidamento.py [righe_per_foglio]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestione import _stack_monthly_sheets  # noqa: E402
+from genera_dati import genera_fogli_cliente  # noqa: E402
+
+NUMERI_DI_FOGLI = [12, 24, 48, 96, 120]
+
+
+def consolida_con_accodamento(fogli):
+    """Consolidamento precedente: il DataFrame cresce con un `pd.concat` per ogni foglio."""
+    primo_foglio = list(fogli.keys())[0]
+    consolidated_data = pd.DataFrame()
+    for nome_foglio, foglio in fogli.items():
+        if nome_foglio == primo_foglio:
+            continue
+        foglio = foglio.iloc[:, :5].copy()
+        for col in ['Fatturato_Anno_Prec', 'Cartoni_Venduti_Prec', 'Fatturato', 'Cartoni_Venduti']:
+            foglio[col] = pd.to_numeric(foglio[col].replace(",", ".", regex=True), errors='coerce')
+        foglio['Cliente'] = 'Cliente'
+        foglio['Anno'] = 2024
+        foglio['Mese'] = nome_foglio
+        foglio['Sconto secondo livello'] = 0.0
+        foglio['Sconto primo livello'] = 0.0
+        consolidated_data = pd.concat([consolidated_data, foglio], ignore_index=True)
+    return consolidated_data
+
+
+def consolida_in_una_passata(fogli):
+    """Consolidamento attuale: i blocchi dei fogli vengono concatenati una sola volta."""
+    primo_foglio = list(fogli.keys())[0]
+    return _stack_monthly_sheets(fogli, primo_foglio, 'Cliente', 2024, 0.0, 0.0)
+
+
+def misura(funzione, fogli, ripetizioni=3):
+    """Restituisce il tempo migliore su alcune ripetizioni, in millisecondi."""
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione(fogli)
+        tempi.append(time.perf_counter() - inizio)
+    return min(tempi) * 1000
+
+
+def main():
+    righe_per_foglio = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print(f"{'Fogli':>6} {'Accodamento (ms)':>18} {'Concat. unica (ms)':>20} {'ms per foglio':>14}")
+    for n_fogli in NUMERI_DI_FOGLI:
+        fogli = genera_fogli_cliente(0, n_referenze=righe_per_foglio, n_fogli=n_fogli)
+        tempo_accodamento = misura(consolida_con_accodamento, fogli)
+        tempo_unico = misura(consolida_in_una_passata, fogli)
+        print(f"{n_fogli:>6} {tempo_accodamento:>18.1f} {tempo_unico:>20.1f} {tempo_unico / n_fogli:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
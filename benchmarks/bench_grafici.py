@@ -0,0 +1,74 @@
+"""
+Benchmark del costo lato server di un grafico a ogni rerun della dashboard.
+
+Confronta la costruzione completa della figura (`go.Figure` + `update_layout`) con `CacheFigure`,
+nel caso di dati cambiati (aggiornamento delle sole tracce) e di dati invariati (figura riutilizzata).
+Ogni misura include la serializzazione eseguita da `st.plotly_chart` e riporta la dimensione
+del messaggio JSON: se i dati non cambiano il messaggio è identico al precedente e Streamlit
+invia al browser solo il suo riferimento.
+
+Uso:
+    python benchmarks/bench_grafici.py [ripetizioni]
+"""
+import os
+import sys
+import time
+
+import plotly.graph_objects as go
+import plotly.io
+import plotly.tools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grafici import CacheFigure  # noqa: E402
+
+
+def costruisci_barre(margine1, margine2):
+    """Costruzione completa del grafico dei margini, come prima della cache delle figure."""
+    fig = go.Figure(go.Bar(x=[margine1, margine2], y=['Margine A.P.', 'Margine Promozione'], orientation='h',
+                           marker_color=['#1f77b4', '#ff7f0e']))
+    fig.update_layout(title="", xaxis_title="Margine in euro (€)", yaxis_title="",
+                      xaxis=dict(tickformat="€,", showgrid=True), template="plotly_white", height=300)
+    return fig
+
+
+def modello_barre():
+    """Figura del layout del grafico dei margini, senza dati."""
+    return costruisci_barre(None, None)
+
+
+def invia(figura):
+    """Serializzazione eseguita da `st.plotly_chart`; restituisce il JSON inviato al browser."""
+    return plotly.io.to_json(plotly.tools.return_figure_from_figure_or_data(figura, validate_figure=True),
+                             validate=False)
+
+
+def misura(funzione, ripetizioni):
+    """Restituisce il tempo medio per chiamata in millisecondi e il risultato dell'ultima chiamata."""
+    inizio = time.perf_counter()
+    for ripetizione in range(ripetizioni):
+        risultato = funzione(ripetizione)
+    return (time.perf_counter() - inizio) / ripetizioni * 1000, risultato
+
+
+def main():
+    ripetizioni = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    cache = CacheFigure()
+
+    casi = [
+        ("Costruzione completa", lambda i: invia(costruisci_barre(1000.0 + i, 2000.0))),
+        ("Cache, dati cambiati", lambda i: invia(cache.figura(("barre",), modello_barre,
+                                                              [{'x': [1000.0 + i, 2000.0]}]))),
+        ("Cache, dati invariati", lambda i: invia(cache.figura(("barre",), modello_barre,
+                                                               [{'x': [1000.0, 2000.0]}]))),
+    ]
+    riferimento = invia(costruisci_barre(1000.0, 2000.0))
+    print(f"{'Caso':<24} {'ms per rerun':>13} {'Byte JSON':>10}")
+    for nome, funzione in casi:
+        durata, spec = misura(funzione, ripetizioni)
+        print(f"{nome:<24} {durata:>13.2f} {len(spec):>10}")
+    assert invia(cache.figura(("barre",), modello_barre, [{'x': [1000.0, 2000.0]}])) == riferimento
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Suite di benchmark delle fasi di caricamento e di calcolo dei KPI, con confronto con una baseline salvata.
+
+Per ogni dimensione (righe di vendite) i dati vengono generati con `genera_dati` e vengono misurate:
+    lettura_excel        `ingest_files` sulle cartelle di lavoro .xlsx (solo fino a --max-righe-excel)
+    combine_month_year   `combine_month_year_to_date` sui fogli mensili impilati
+    consolidamento       `_consolidate_excel_data` sui fogli già letti di ogni cliente
+    merge                `merge_with_second_dataframe` con il catalogo delle referenze
+    normalizzazione      `normalize_schema` delle vendite unite al catalogo
+    cubo_e_indice        `costruisci_cubo_KPI` e `IndiceFiltri`, costruiti al caricamento della dashboard
+    filtro               una selezione dei filtri della dashboard (`interroga_cubo_KPI` + `calcolo_KPI_base`)
+    calcolo_KPI          `calcolo_KPI` su tutte le vendite, con tutti i KPI letti
+
+Per ogni fase sono riportati il tempo migliore, le righe al secondo e il picco di memoria allocata,
+misurato con tracemalloc in un'esecuzione separata per non alterare i tempi. Oltre --max-righe-tracemalloc
+tracemalloc richiederebbe troppa memoria per le sue tracce: il picco è allora la crescita massima della
+memoria residente del processo durante le esecuzioni cronometrate, campionata da un thread (solo su Linux),
+che sottostima la memoria riutilizzata dall'allocatore.
+Con --salva-baseline i risultati vengono salvati; altrimenti sono confrontati con la baseline
+e lo script termina con codice 1 se una fase è più lenta o usa più memoria oltre la tolleranza.
+La baseline dipende dalla macchina: va salvata di nuovo quando si cambia ambiente.
+
+Uso:
+    python benchmarks/bench_suite.py [--righe 1000 100000 10000000] [--salva-baseline]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indici import TUTTI, IndiceFiltri  # noqa: E402
+from ingestione import (_consolidate_excel_data, _customer_metadata, _stack_monthly_sheets,  # noqa: E402
+                        combine_month_year_to_date, ingest_files, merge_with_second_dataframe, normalize_schema)
+from kpi import NOMI_KPI, calcolo_KPI, calcolo_KPI_base, costruisci_cubo_KPI, interroga_cubo_KPI  # noqa: E402
+from genera_dati import dimensioni_per_righe, genera_catalogo, genera_file_per_righe, genera_fogli_per_righe  # noqa: E402
+
+RIGHE_PREDEFINITE = [1_000, 100_000, 10_000_000]
+BASELINE_PREDEFINITA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_suite.json")
+
+# Numero di selezioni dei filtri misurate per ogni dimensione
+N_SELEZIONI = 50
+
+# Intervallo (in secondi) tra due letture della memoria residente
+INTERVALLO_CAMPIONAMENTO = 0.005
+
+# Differenza minima (in secondi) perché un tempo più alto della baseline sia considerato una regressione
+SOGLIA_SECONDI = 0.005
+
+
+def _memoria_residente():
+    """Memoria residente del processo in byte, oppure None se /proc non è disponibile."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class CampionatoreMemoria:
+    """
+    Crescita massima della memoria residente durante un blocco, letta da un thread a intervalli regolari
+    (0 se la memoria residente non è disponibile).
+    """
+
+    def __enter__(self):
+        self.picco = 0
+        self._iniziale = _memoria_residente()
+        self._fine = threading.Event()
+        self._thread = threading.Thread(target=self._campiona, daemon=True)
+        if self._iniziale is not None:
+            self._thread.start()
+        return self
+
+    def _campiona(self):
+        while not self._fine.wait(INTERVALLO_CAMPIONAMENTO):
+            self.picco = max(self.picco, _memoria_residente() - self._iniziale)
+
+    def __exit__(self, *eccezione):
+        if self._iniziale is None:
+            return
+        self._fine.set()
+        self._thread.join()
+        self.picco = max(self.picco, _memoria_residente() - self._iniziale)
+
+
+def misura(funzione, prepara=None, ripetizioni=3, tracemalloc_attivo=True):
+    """
+    Misura una fase: tempo migliore su alcune ripetizioni e picco di memoria.
+
+    Args:
+        funzione (callable): Fase da misurare; riceve il risultato di `prepara`, se indicato.
+        prepara (callable): Crea l'input della fase fuori dalla misura (ad esempio una copia dei dati
+            per le funzioni che li modificano).
+        ripetizioni (int): Numero di esecuzioni cronometrate.
+        tracemalloc_attivo (bool): Se True il picco è misurato con tracemalloc in un'esecuzione in più,
+            altrimenti campionando la memoria residente durante le esecuzioni cronometrate.
+
+    Returns:
+        tuple: (secondi, picco di memoria in MB, risultato dell'ultima esecuzione).
+    """
+    tempi = []
+    picco = 0
+    for ripetizione in range(ripetizioni):
+        argomenti = () if prepara is None else (prepara(),)
+        gc.collect()
+        with CampionatoreMemoria() as memoria:
+            inizio = time.perf_counter()
+            risultato = funzione(*argomenti)
+            tempi.append(time.perf_counter() - inizio)
+        picco = max(picco, memoria.picco)
+        del argomenti
+        if ripetizione < ripetizioni - 1 or tracemalloc_attivo:
+            del risultato
+
+    if tracemalloc_attivo:
+        argomenti = () if prepara is None else (prepara(),)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            risultato = funzione(*argomenti)
+            picco = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return min(tempi), picco / 2**20, risultato
+
+
+def impila_fogli(fogli_clienti):
+    """Fogli mensili impilati come prima di `combine_month_year_to_date`, per tutti i clienti."""
+    blocchi = []
+    for fogli in fogli_clienti:
+        primo_foglio = next(iter(fogli))
+        cliente, anno, sconto_secondo_livello, sconto_primo_livello = _customer_metadata(fogli[primo_foglio].copy())
+        blocchi.append(_stack_monthly_sheets(fogli, primo_foglio, cliente, anno,
+                                             sconto_secondo_livello, sconto_primo_livello))
+    return pd.concat(blocchi, ignore_index=True)
+
+
+def selezioni_casuali(cubo, n_selezioni, seed=0):
+    """Combinazioni di filtri della dashboard estratte dal cubo, con "Tutti" per circa metà dei filtri."""
+    rng = np.random.default_rng(seed)
+    date = cubo['Data_datetime'].dropna()
+    selezioni = []
+    for _ in range(n_selezioni):
+        riga = cubo.iloc[int(rng.integers(len(cubo)))]
+        filtri = [riga[dimensione] if rng.random() < 0.5 else TUTTI
+                  for dimensione in ('Cliente', 'Nome', 'Quantita in grammi')]
+        selezioni.append(filtri + [date.min(), date.max()])
+    return selezioni
+
+
+def esegui_suite(n_righe, max_righe_excel, max_righe_tracemalloc):
+    """
+    Genera i dati per `n_righe` righe ed esegue tutte le fasi.
+
+    Returns:
+        dict: Per fase, {'righe', 'secondi', 'righe_al_secondo', 'picco_mb'}.
+    """
+    ripetizioni = 3 if n_righe <= 100_000 else 1
+    tracemalloc_attivo = n_righe <= max_righe_tracemalloc
+    n_clienti, n_referenze = dimensioni_per_righe(n_righe)
+    risultati = {}
+
+    def misura_fase(funzione, prepara=None):
+        return misura(funzione, prepara, ripetizioni, tracemalloc_attivo)
+
+    def registra(fase, righe, secondi, picco_mb):
+        risultati[fase] = {'righe': righe, 'secondi': secondi,
+                           'righe_al_secondo': righe / secondi if secondi > 0 else float('inf'),
+                           'picco_mb': picco_mb}
+
+    if n_righe <= max_righe_excel:
+        file_excel = genera_file_per_righe(n_righe)
+        secondi, picco, (vendite, _, _) = misura_fase(lambda: ingest_files(file_excel))
+        registra('lettura_excel', len(vendite), secondi, picco)
+        del file_excel, vendite
+
+    fogli_clienti = genera_fogli_per_righe(n_righe)
+    impilati = impila_fogli(fogli_clienti)
+    n_vendite = len(impilati)
+    secondi, picco, _ = misura_fase(combine_month_year_to_date, prepara=impilati.copy)
+    registra('combine_month_year', n_vendite, secondi, picco)
+    del impilati
+
+    secondi, picco, vendite = misura_fase(
+        lambda: pd.concat([_consolidate_excel_data({nome: foglio.copy() if posizione == 0 else foglio
+                                                    for posizione, (nome, foglio) in enumerate(fogli.items())})
+                           for fogli in fogli_clienti], ignore_index=True))
+    registra('consolidamento', n_vendite, secondi, picco)
+    del fogli_clienti
+
+    catalogo = genera_catalogo(n_referenze)
+    secondi, picco, unite = misura_fase(lambda: merge_with_second_dataframe(vendite, catalogo))
+    registra('merge', n_vendite, secondi, picco)
+    del vendite
+
+    secondi, picco, normalizzate = misura_fase(lambda: normalize_schema(unite))
+    registra('normalizzazione', n_vendite, secondi, picco)
+    del unite
+
+    secondi, picco, (cubo, indice) = misura_fase(lambda: (lambda cubo: (cubo, IndiceFiltri(cubo)))(
+        costruisci_cubo_KPI(normalizzate)))
+    registra('cubo_e_indice', n_vendite, secondi, picco)
+
+    selezioni = selezioni_casuali(cubo, N_SELEZIONI)
+    secondi, picco, _ = misura_fase(lambda: [calcolo_KPI_base(interroga_cubo_KPI(cubo, *selezione, indice=indice))
+                                             for selezione in selezioni])
+    # Tempo di una selezione; il throughput è riferito alle righe di vendite rappresentate dal cubo
+    registra('filtro', n_vendite, secondi / N_SELEZIONI, picco)
+
+    def tutti_i_KPI():
+        risultato = calcolo_KPI(normalizzate, 10, 20)
+        return [getattr(risultato, nome) for nome in NOMI_KPI]
+
+    secondi, picco, _ = misura_fase(tutti_i_KPI)
+    registra('calcolo_KPI', n_vendite, secondi, picco)
+
+    print(f"# {n_righe:,} righe richieste: {n_clienti} clienti x 12 mesi x {n_referenze} referenze = {n_vendite:,}")
+    return risultati
+
+
+def confronta(risultati, baseline, tolleranza):
+    """
+    Confronta i risultati con la baseline.
+
+    Returns:
+        dict: Per chiave "fase@righe", descrizione del confronto; le regressioni iniziano con "REGRESSIONE".
+    """
+    confronti = {}
+    for chiave, misura_attuale in risultati.items():
+        riferimento = baseline.get(chiave)
+        if riferimento is None:
+            confronti[chiave] = "nuova"
+            continue
+        rapporto_tempo = misura_attuale['secondi'] / riferimento['secondi'] if riferimento['secondi'] else 1.0
+        rapporto_memoria = misura_attuale['picco_mb'] / riferimento['picco_mb'] if riferimento['picco_mb'] else 1.0
+        lenta = (rapporto_tempo > 1 + tolleranza
+                 and misura_attuale['secondi'] - riferimento['secondi'] > SOGLIA_SECONDI)
+        pesante = rapporto_memoria > 1 + tolleranza and misura_attuale['picco_mb'] - riferimento['picco_mb'] > 1
+        descrizione = f"tempo x{rapporto_tempo:.2f}, memoria x{rapporto_memoria:.2f}"
+        confronti[chiave] = f"REGRESSIONE ({descrizione})" if lenta or pesante else descrizione
+    return confronti
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark delle fasi di caricamento e calcolo dei KPI.")
+    parser.add_argument("--righe", type=int, nargs="+", default=RIGHE_PREDEFINITE, help="Dimensioni da misurare")
+    parser.add_argument("--max-righe-excel", type=int, default=100_000,
+                        help="Dimensione massima per cui generare e leggere i file .xlsx")
+    parser.add_argument("--max-righe-tracemalloc", type=int, default=1_000_000,
+                        help="Dimensione massima per cui misurare la memoria con tracemalloc")
+    parser.add_argument("--baseline", default=BASELINE_PREDEFINITA, help="File JSON della baseline")
+    parser.add_argument("--salva-baseline", action="store_true", help="Salva i risultati come nuova baseline")
+    parser.add_argument("--tolleranza", type=float, default=0.25,
+                        help="Peggioramento relativo oltre il quale una fase è una regressione")
+    args = parser.parse_args()
+
+    risultati = {}
+    for n_righe in args.righe:
+        for fase, valori in esegui_suite(n_righe, args.max_righe_excel, args.max_righe_tracemalloc).items():
+            risultati[f"{fase}@{n_righe}"] = valori
+
+    baseline = {}
+    if not args.salva_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    confronti = confronta(risultati, baseline, args.tolleranza) if baseline else {}
+
+    print(f"{'Fase':<30} {'Righe':>11} {'Secondi':>10} {'Righe/s':>13} {'Picco MB':>9}  Baseline")
+    for chiave, valori in risultati.items():
+        print(f"{chiave:<30} {valori['righe']:>11,} {valori['secondi']:>10.4f} {valori['righe_al_secondo']:>13,.0f} "
+              f"{valori['picco_mb']:>9.1f}  {confronti.get(chiave, '-')}")
+
+    if args.salva_baseline:
+        # Le dimensioni non misurate in questa esecuzione restano quelle della baseline precedente
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                risultati = {**json.load(file), **risultati}
+        with open(args.baseline, "w") as file:
+            json.dump(risultati, file, indent=2, sort_keys=True)
+        print(f"Baseline salvata in {args.baseline}")
+        return 0
+
+    regressioni = [chiave for chiave, confronto in confronti.items() if confronto.startswith("REGRESSIONE")]
+    if regressioni:
+        print(f"{len(regressioni)} regressioni rispetto alla baseline: {', '.join(regressioni)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
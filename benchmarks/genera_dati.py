@@ -0,0 +1,190 @@
+"""
+Generatore di cartelle di lavoro sintetiche per i benchmark.
+
+Le cartelle di lavoro seguono il formato atteso da `process_excel_to_dataframe`
+(un foglio di metadati con Cliente/Anno/sconti seguito dai fogli mensili in italiano)
+e da `process_second_excel_to_dataframe` (il catalogo `dettagli_referenze.xlsx`).
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+MESI = [
+    "GENNAIO", "FEBBRAIO", "MARZO", "APRILE", "MAGGIO", "GIUGNO",
+    "LUGLIO", "AGOSTO", "SETTEMBRE", "OTTOBRE", "NOVEMBRE", "DICEMBRE"
+]
+
+# Numero massimo di referenze per foglio mensile nei dati generati per numero di righe
+MAX_REFERENZE = 1000
+
+
+class FileCaricato(io.BytesIO):
+    """
+    Imita l'`UploadedFile` di Streamlit: un buffer in memoria con l'attributo `name`.
+    """
+
+    def __init__(self, contenuto, name):
+        super().__init__(contenuto)
+        self.name = name
+
+
+def genera_fogli_cliente(indice, anno=2024, n_referenze=50, n_fogli=12, seed=None):
+    """
+    Crea i fogli di una cartella di lavoro cliente, come li restituisce `pd.read_excel(..., sheet_name=None)`.
+
+    Args:
+        indice (int): Indice del cliente, usato per il nome del cliente.
+        anno (int): Anno riportato nel foglio dei metadati.
+        n_referenze (int): Numero di righe (referenze) per ogni foglio mensile.
+        n_fogli (int): Numero di fogli mensili; oltre dodici i nomi dei mesi si ripetono con un suffisso.
+        seed (int): Seme del generatore casuale.
+
+    Returns:
+        dict: Dizionario `{nome foglio: DataFrame}` con il foglio dei metadati per primo.
+    """
+    rng = np.random.default_rng(indice if seed is None else seed)
+
+    fogli = {
+        "Info": pd.DataFrame({
+            "Cliente": [f"Cliente {indice:03d}"],
+            "Anno": [anno],
+            "Sconto secondo livello": [float(rng.integers(0, 10))],
+            "Sconto primo livello": [float(rng.integers(10, 40))],
+        })
+    }
+
+    for i in range(n_fogli):
+        nome_foglio = MESI[i % 12] if i < 12 else f"{MESI[i % 12]} {i // 12}"
+        fogli[nome_foglio] = pd.DataFrame({
+            "Referente": np.arange(1000, 1000 + n_referenze),
+            "Fatturato_Anno_Prec": rng.uniform(100, 5000, n_referenze).round(2),
+            "Cartoni_Venduti_Prec": rng.integers(1, 200, n_referenze),
+            "Fatturato": rng.uniform(100, 5000, n_referenze).round(2),
+            "Cartoni_Venduti": rng.integers(1, 200, n_referenze),
+        })
+
+    return fogli
+
+
+def genera_workbook_cliente(indice, anno=2024, n_referenze=50, n_fogli=12, seed=None):
+    """
+    Crea in memoria una cartella di lavoro cliente con un foglio di metadati e `n_fogli` fogli mensili.
+
+    Args:
+        indice (int): Indice del cliente, usato per il nome del cliente e del file.
+        anno (int): Anno riportato nel foglio dei metadati.
+        n_referenze (int): Numero di righe (referenze) per ogni foglio mensile.
+        n_fogli (int): Numero di fogli mensili; oltre dodici i nomi dei mesi si ripetono con un suffisso.
+        seed (int): Seme del generatore casuale.
+
+    Returns:
+        FileCaricato: Il file Excel generato.
+    """
+    return workbook_da_fogli(genera_fogli_cliente(indice, anno, n_referenze, n_fogli, seed), f"cliente_{indice:03d}.xlsx")
+
+
+def workbook_da_fogli(fogli, nome_file):
+    """
+    Scrive in memoria una cartella di lavoro con i fogli dati, ad esempio quelli di `genera_fogli_cliente` modificati.
+
+    Args:
+        fogli (dict): Dizionario `{nome foglio: DataFrame}`, nell'ordine dei fogli.
+        nome_file (str): Nome del file caricato.
+
+    Returns:
+        FileCaricato: Il file Excel generato.
+    """
+    buffer = io.BytesIO()
+
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        for nome_foglio, foglio in fogli.items():
+            foglio.to_excel(writer, sheet_name=nome_foglio, index=False)
+
+    return FileCaricato(buffer.getvalue(), nome_file)
+
+
+def genera_catalogo(n_referenze=50, seed=0):
+    """
+    Crea il catalogo delle referenze come lo restituisce `process_second_excel_to_dataframe`.
+
+    Args:
+        n_referenze (int): Numero di referenze del catalogo.
+        seed (int): Seme del generatore casuale.
+
+    Returns:
+        pd.DataFrame: Il catalogo, con i codici 'Referente' da 1000 in poi.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Referente": np.arange(1000, 1000 + n_referenze),
+        "Nome": [f"Prodotto {i % 20}" for i in range(n_referenze)],
+        "Quantita in grammi": rng.choice([250, 500, 1000], n_referenze),
+        "Pezzi in un cartone": rng.choice([6, 12, 24], n_referenze),
+        "Ricetta": rng.uniform(0.3, 2.0, n_referenze).round(3),
+        "Listino": rng.uniform(2.0, 6.0, n_referenze).round(2),
+    })
+
+
+def genera_dettagli_referenze(n_referenze=50, seed=0):
+    """
+    Crea in memoria il catalogo `dettagli_referenze.xlsx`.
+
+    Args:
+        n_referenze (int): Numero di referenze del catalogo.
+        seed (int): Seme del generatore casuale.
+
+    Returns:
+        FileCaricato: Il file Excel generato.
+    """
+    buffer = io.BytesIO()
+    genera_catalogo(n_referenze, seed).to_excel(buffer, index=False, engine="openpyxl")
+
+    return FileCaricato(buffer.getvalue(), "dettagli_referenze.xlsx")
+
+
+def dimensioni_per_righe(n_righe, max_referenze=MAX_REFERENZE):
+    """
+    Sceglie numero di clienti e di referenze perché dodici fogli mensili per cliente diano circa `n_righe` righe.
+
+    Args:
+        n_righe (int): Numero di righe desiderato per l'insieme delle vendite.
+        max_referenze (int): Numero massimo di referenze per foglio; oltre, crescono i clienti.
+
+    Returns:
+        tuple: (numero di clienti, numero di referenze per foglio).
+    """
+    n_referenze = max(1, min(max_referenze, -(-n_righe // 12)))
+    n_clienti = max(1, -(-n_righe // (12 * n_referenze)))
+    return n_clienti, n_referenze
+
+
+def genera_fogli_per_righe(n_righe, anno=2024):
+    """
+    Crea i fogli già letti di tutti i clienti necessari per circa `n_righe` righe di vendite.
+
+    Args:
+        n_righe (int): Numero di righe desiderato.
+        anno (int): Anno riportato nei fogli dei metadati.
+
+    Returns:
+        list: Un dizionario di fogli (vedi `genera_fogli_cliente`) per cliente.
+    """
+    n_clienti, n_referenze = dimensioni_per_righe(n_righe)
+    return [genera_fogli_cliente(i, anno, n_referenze) for i in range(n_clienti)]
+
+
+def genera_file_per_righe(n_righe, anno=2024):
+    """
+    Crea le cartelle di lavoro cliente e il catalogo per circa `n_righe` righe di vendite.
+
+    Args:
+        n_righe (int): Numero di righe desiderato.
+        anno (int): Anno riportato nei fogli dei metadati.
+
+    Returns:
+        list: I file cliente seguiti da `dettagli_referenze.xlsx`.
+    """
+    n_clienti, n_referenze = dimensioni_per_righe(n_righe)
+    return ([genera_workbook_cliente(i, anno, n_referenze) for i in range(n_clienti)]
+            + [genera_dettagli_referenze(n_referenze)])
@@ -0,0 +1,99 @@
+"""
+Archivio su disco dei dataset consolidati in formato Arrow IPC (Feather) non compresso.
+
+I file vengono riletti in memoria mappata: le colonne numeriche e categoriche non vengono copiate
+nella memoria del processo e le pagine lette restano nella cache del sistema operativo, condivise
+tra tutti i processi del server che aprono lo stesso dataset.
+"""
+import logging
+import os
+import uuid
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from cache_parquet import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, ParquetCache, _text_columns_as_string
+
+# Cartella predefinita dell'archivio, dentro la cartella della cache dei file
+DEFAULT_ARCHIVE_DIR = os.path.join(DEFAULT_CACHE_DIR, "dataset")
+
+logger = logging.getLogger(__name__)
+
+
+def _to_arrow_table(dataframe):
+    """
+    Converte il DataFrame in una tabella Arrow rileggibile senza copie.
+
+    I float vengono convertiti senza trasformare i NaN in valori nulli e la tabella è scritta
+    in un solo blocco: entrambe le condizioni servono perché la lettura non debba ricomporre le colonne.
+    """
+    columns = {}
+    for name, values in _text_columns_as_string(dataframe).items():
+        if values.dtype.kind == 'f':
+            columns[name] = pa.array(values.to_numpy(), from_pandas=False)
+        else:
+            columns[name] = pa.Array.from_pandas(values)
+    return pa.table(columns).combine_chunks()
+
+
+class ArrowCache(ParquetCache):
+    """
+    Archivio Arrow IPC con la stessa politica di eliminazione LRU di `ParquetCache`.
+
+    Args:
+        directory (str): Cartella in cui salvare i file dell'archivio.
+        max_bytes (int): Dimensione massima complessiva dei file dell'archivio.
+    """
+
+    EXTENSION = ".arrow"
+
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(directory, max_bytes)
+
+    def get(self, key, columns=None):
+        """
+        Apre in memoria mappata il DataFrame salvato per la chiave.
+
+        Args:
+            key (str): Chiave calcolata con `ArrowCache.key`.
+            columns (list): Colonne da leggere (tutte se None).
+
+        Returns:
+            pd.DataFrame: Il DataFrame mappato, oppure None se non presente.
+        """
+        path = self._path(key)
+        try:
+            table = feather.read_table(path, columns=columns, memory_map=True)
+            dataframe = table.to_pandas(split_blocks=True)
+            os.utime(path)
+        except Exception:
+            dataframe = None
+
+        with self._lock:
+            if dataframe is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return dataframe
+
+    def put(self, key, dataframe):
+        """
+        Salva il DataFrame per la chiave ed elimina le voci meno recenti oltre il limite di dimensione.
+
+        Args:
+            key (str): Chiave calcolata con `ArrowCache.key`.
+            dataframe (pd.DataFrame): Il DataFrame da salvare.
+        """
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            table = _to_arrow_table(dataframe)
+            feather.write_feather(table, temp_path, compression='uncompressed', chunksize=max(table.num_rows, 1))
+            os.replace(temp_path, path)
+        except Exception:
+            logger.warning("Impossibile salvare il dataset nell'archivio: %s", path, exc_info=True)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        self._evict()
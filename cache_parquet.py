@@ -0,0 +1,152 @@
+"""
+Cache su disco dei file Excel già elaborati, indirizzata dal contenuto dei file.
+
+Ogni risultato viene salvato in formato Parquet con il nome dato dall'hash dei byte caricati:
+un file identico a uno già visto viene riletto dalla cache invece di essere rielaborato con openpyxl.
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+import pandas as pd
+
+# Cartella predefinita della cache, relativa alla cartella di lavoro
+DEFAULT_CACHE_DIR = ".cache_cruscotto"
+
+# Dimensione massima predefinita della cache (512 MB)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _text_columns_as_string(dataframe):
+    """
+    Converte in stringhe le colonne di oggetti e le categorie non testuali, ad esempio un 'Referente'
+    con codici sia numerici sia testuali, che Parquet e Arrow non possono scrivere con tipi misti.
+
+    I valori mancanti restano tali; il catalogo viene comunque unito confrontando i codici come stringhe.
+    """
+    columns = {}
+    for name, values in dataframe.items():
+        if values.dtype == object:
+            columns[name] = values.astype("string")
+        elif isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.dtype == object \
+                and not pd.api.types.is_string_dtype(values.cat.categories):
+            columns[name] = values.astype("string").astype("category")
+    return dataframe.assign(**columns) if columns else dataframe
+
+
+class ParquetCache:
+    """
+    Cache Parquet con limite di dimensione ed eliminazione dei file usati meno di recente (LRU).
+
+    L'ultimo accesso a ciascuna voce è registrato nella data di modifica del file, così che l'ordine
+    LRU sopravviva al riavvio del server.
+
+    Args:
+        directory (str): Cartella in cui salvare i file della cache.
+        max_bytes (int): Dimensione massima complessiva dei file della cache.
+    """
+
+    # Estensione dei file della cache, usata anche per riconoscerli durante l'eliminazione
+    EXTENSION = ".parquet"
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(content, namespace=""):
+        """
+        Calcola la chiave di un file a partire dal suo contenuto.
+
+        Args:
+            content (bytes): Contenuto del file caricato.
+            namespace (str): Distingue elaborazioni diverse degli stessi byte (tipo di file, versione).
+
+        Returns:
+            str: Chiave esadecimale.
+        """
+        digest = hashlib.sha256(namespace.encode())
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.EXTENSION}")
+
+    def get(self, key):
+        """
+        Restituisce il DataFrame salvato per la chiave, aggiornandone l'ultimo accesso.
+
+        Args:
+            key (str): Chiave calcolata con `ParquetCache.key`.
+
+        Returns:
+            pd.DataFrame: Il DataFrame salvato, oppure None se non presente.
+        """
+        path = self._path(key)
+        try:
+            dataframe = pd.read_parquet(path)
+            os.utime(path)
+        except Exception:
+            # File assente, eliminato nel frattempo o illeggibile: equivale a un miss
+            dataframe = None
+
+        with self._lock:
+            if dataframe is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return dataframe
+
+    def put(self, key, dataframe):
+        """
+        Salva il DataFrame per la chiave ed elimina le voci meno recenti oltre il limite di dimensione.
+
+        Le colonne di oggetti vengono salvate come stringhe (vedi `_text_columns_as_string`). Il salvataggio
+        è facoltativo: se il DataFrame non può comunque essere scritto in Parquet la voce non viene salvata.
+
+        Args:
+            key (str): Chiave calcolata con `ParquetCache.key`.
+            dataframe (pd.DataFrame): Il DataFrame da salvare.
+        """
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            _text_columns_as_string(dataframe).to_parquet(temp_path, index=False)
+            os.replace(temp_path, path)  # Scrittura atomica: i lettori non vedono mai file parziali
+        except Exception:
+            logger.warning("Impossibile salvare il file nella cache: %s", path, exc_info=True)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Elimina le voci usate meno di recente finché la cache non rientra nel limite di dimensione.
+        """
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(self.EXTENSION):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Già eliminato, oppure ancora aperto da un'altra sessione su sistemi che non lo consentono
+                    pass
+                total -= size
@@ -0,0 +1,206 @@
+"""
+Caricamento dei file in background, senza dipendenze da Streamlit.
+
+Elaborare molti file richiede minuti: eseguito nello script della sessione bloccherebbe l'interfaccia
+fino alla fine. `CaricamentoDataset` costruisce il dataset in un thread di un pool condiviso e rende
+disponibili l'avanzamento file per file e, a intervalli, un dataset parziale con i clienti già elaborati,
+così che la dashboard sia utilizzabile prima della fine. Un caricamento annullato non elabora i file
+non ancora iniziati. Al termine, se richiesto, le vendite vengono aggiunte all'archivio pluriennale.
+"""
+import contextvars
+import threading
+import time
+
+from dataset import assembla_dataset, costruisci_dataset, dataset_archiviato
+from ingestione import combine_ingested_files, iter_ingested_files
+from prestazioni import misura
+
+# Numero massimo di caricamenti eseguiti contemporaneamente da tutte le sessioni del server
+MAX_CARICAMENTI = 2
+
+# Secondi minimi tra due dataset parziali
+INTERVALLO_PARZIALI = 2.0
+
+# Un dataset parziale viene ricostruito solo dopo un'attesa pari ad almeno questo multiplo
+# della durata della costruzione precedente, così che i parziali non rallentino il caricamento
+FATTORE_ATTESA_PARZIALI = 4
+
+
+class CaricamentoDataset:
+    """
+    Costruzione in background del dataset dei file caricati, con avanzamento, risultati parziali e annullamento.
+
+    Args:
+        chiave (str): Chiave del dataset nel registro.
+        uploaded_files (list): Lista di file caricati dall'utente.
+        n_processi (int): Numero di processi per l'elaborazione parallela dei file (1 = in sequenza).
+        precedente (DatasetCondiviso): Dataset del caricamento precedente della sessione, oppure None.
+        cache (ParquetCache): Cache dei file già elaborati, oppure None.
+        archivio (ArrowCache): Archivio Arrow in cui conservare il dataset consolidato, oppure None.
+        incrementale (bool): Se True vengono elaborati solo i fogli mensili nuovi o modificati;
+            l'aggiornamento incrementale non produce risultati parziali.
+        intervallo_parziali (float): Secondi minimi tra due dataset parziali.
+        storico (ArchivioStorico): Archivio pluriennale a cui aggiungere le vendite caricate, oppure None.
+    """
+
+    def __init__(self, chiave, uploaded_files, n_processi=1, precedente=None, cache=None, archivio=None,
+                 incrementale=False, intervallo_parziali=INTERVALLO_PARZIALI, storico=None):
+        self.chiave = chiave
+        self.uploaded_files = list(uploaded_files)
+        self.nomi_file = [uploaded_file.name for uploaded_file in self.uploaded_files]
+        self.n_processi = n_processi
+        self.precedente = precedente
+        self.cache = cache
+        self.archivio = archivio
+        self.incrementale = incrementale
+        self.intervallo_parziali = intervallo_parziali
+        self.storico = storico
+
+        self.file_completati = 0
+        self.errori = {}  # Errori di elaborazione per nome del file, nell'ordine in cui si verificano
+        self.parziale = None  # Ultimo dataset parziale, oppure None
+        self.versione = 0  # Numero di dataset parziali pubblicati
+        self.risultato = None  # Dataset completo, al termine del caricamento
+        self.eccezione = None  # Errore che ha interrotto il caricamento, oppure None
+
+        self._lock = threading.Lock()
+        self._annullato = threading.Event()
+        self._terminato = threading.Event()
+
+    def avvia(self, esecutore=None):
+        """
+        Avvia il caricamento in background.
+
+        Le misure dei tempi del caricamento restano associate al rerun che lo ha avviato.
+
+        Args:
+            esecutore (ThreadPoolExecutor): Pool condiviso su cui eseguire il caricamento; se None
+                il caricamento viene eseguito in un thread dedicato.
+
+        Returns:
+            CaricamentoDataset: Il caricamento stesso.
+        """
+        contesto = contextvars.copy_context()
+        if esecutore is None:
+            threading.Thread(target=contesto.run, args=(self._esegui,), daemon=True).start()
+        else:
+            esecutore.submit(contesto.run, self._esegui)
+        return self
+
+    def annulla(self):
+        """
+        Chiede l'annullamento: i file non ancora iniziati non vengono elaborati e il caricamento
+        termina senza risultato.
+        """
+        self._annullato.set()
+
+    @property
+    def annullato(self):
+        return self._annullato.is_set()
+
+    @property
+    def terminato(self):
+        return self._terminato.is_set()
+
+    def attendi(self, timeout=None):
+        """
+        Attende la fine del caricamento.
+
+        Args:
+            timeout (float): Secondi massimi di attesa, oppure None per attendere senza limite.
+
+        Returns:
+            bool: True se il caricamento è terminato.
+        """
+        return self._terminato.wait(timeout)
+
+    def avanzamento(self):
+        """
+        Restituisce il numero di file elaborati e il numero totale di file.
+
+        Returns:
+            tuple: (file elaborati, file totali).
+        """
+        with self._lock:
+            return self.file_completati, len(self.nomi_file)
+
+    def _esegui(self):
+        try:
+            with misura("caricamento", file=len(self.nomi_file)):
+                if self.incrementale:
+                    risultato = costruisci_dataset(self.chiave, self.uploaded_files, self.n_processi, self.precedente,
+                                                   cache=self.cache, incrementale=True)
+                else:
+                    risultato = dataset_archiviato(self.chiave, self.archivio) or self._elabora_file()
+            if not self.annullato:
+                self._archivia(risultato)
+                self.risultato = risultato
+        except Exception as e:
+            print(f"Errore durante il caricamento dei file: {e}")
+            self.eccezione = e
+        finally:
+            self._terminato.set()
+
+    def _archivia(self, risultato):
+        """
+        Aggiunge le vendite del dataset all'archivio pluriennale; un errore dell'archivio non interrompe il caricamento.
+        """
+        if self.storico is None or risultato is None or risultato.main_dataframe is None:
+            return
+        try:
+            with misura("storico", righe=len(risultato.main_dataframe)):
+                self.storico.aggiungi(risultato.main_dataframe)
+        except Exception as e:
+            print(f"Errore durante l'aggiornamento dello storico: {e}")
+
+    def _elabora_file(self):
+        """
+        Elabora i file man mano che sono pronti, pubblicando a intervalli il dataset parziale.
+
+        Returns:
+            DatasetCondiviso: Il dataset completo, oppure None se il caricamento è stato annullato.
+        """
+        risultati = [None] * len(self.nomi_file)
+        ultimo_parziale = time.perf_counter()
+        attesa = self.intervallo_parziali
+
+        file_elaborati = iter_ingested_files(self.uploaded_files, self.n_processi, self.cache)
+        try:
+            for posizione, risultato, errore in file_elaborati:
+                risultati[posizione] = risultato
+                with self._lock:
+                    self.file_completati += 1
+                    if errore is not None:
+                        self.errori[self.nomi_file[posizione]] = errore
+                    da_completare = len(self.nomi_file) - self.file_completati
+                if self.annullato:
+                    return None
+
+                if da_completare and time.perf_counter() - ultimo_parziale >= attesa:
+                    inizio = time.perf_counter()
+                    self._pubblica_parziale(risultati)
+                    ultimo_parziale = time.perf_counter()
+                    attesa = max(self.intervallo_parziali, FATTORE_ATTESA_PARZIALI * (ultimo_parziale - inizio))
+        finally:
+            # Chiude il pool di processi anche se il caricamento è stato annullato
+            file_elaborati.close()
+
+        main_dataframe, details_dataframe = combine_ingested_files(self.nomi_file, risultati)
+        # Gli errori sono riportati nell'ordine di caricamento dei file
+        errori = {nome: self.errori[nome] for nome in self.nomi_file if nome in self.errori}
+        return assembla_dataset(self.chiave, main_dataframe, details_dataframe, errori, self.precedente, self.archivio)
+
+    def _pubblica_parziale(self, risultati):
+        """
+        Costruisce il dataset dei file elaborati finora e lo rende disponibile, se contiene vendite unite al catalogo.
+        """
+        main_dataframe, details_dataframe = combine_ingested_files(self.nomi_file, risultati)
+        if main_dataframe is None:
+            return
+        with misura("dataset_parziale", righe=len(main_dataframe)):
+            parziale = assembla_dataset(None, main_dataframe, details_dataframe, dict(self.errori), self.precedente)
+        if parziale.cubo is None:
+            return
+        with self._lock:
+            self.parziale = parziale
+            self.versione += 1
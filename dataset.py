@@ -0,0 +1,223 @@
+"""
+Costruzione dei dataset della dashboard a partire dai file caricati, senza dipendenze da Streamlit.
+
+Un dataset raccoglie le vendite consolidate e unite al catalogo, il cubo dei KPI con il suo indice
+e gli errori di elaborazione; viene costruito una volta e condiviso in sola lettura tramite `RegistroDataset`.
+"""
+from indici import IndiceFiltri
+from ingestione import (DETAILS_FILENAME, INGESTION_VERSION, DetailsIndex, ingest_files, is_details_file,
+                        normalize_schema, unmatched_report)
+from kpi import costruisci_cubo_KPI
+from prestazioni import misura
+from registro_dataset import DatasetCondiviso, RegistroDataset
+from storico_vendite import StoricoVendite
+
+
+def chiave_dataset(uploaded_files, precedente=None, incrementale=False):
+    """
+    Calcola la chiave nel registro del dataset costruito dai file caricati.
+
+    Il nuovo dataset dipende dal precedente se i file caricati non contengono sia vendite sia catalogo,
+    e sempre in modo incrementale, dove il risultato dipende dallo storico precedente.
+
+    Args:
+        uploaded_files (list): Lista di file caricati dall'utente.
+        precedente (DatasetCondiviso | RiferimentoDataset): Dataset del caricamento precedente, oppure None.
+        incrementale (bool): Se True il dataset è un aggiornamento incrementale del precedente.
+
+    Returns:
+        str: Chiave del dataset.
+    """
+    nomi_file = [uploaded_file.name for uploaded_file in uploaded_files]
+    completo = any(map(is_details_file, nomi_file)) and not all(map(is_details_file, nomi_file))
+    chiave_precedente = None if (completo and not incrementale) or precedente is None else precedente.chiave
+    return RegistroDataset.chiave([uploaded_file.getvalue() for uploaded_file in uploaded_files], chiave_precedente)
+
+
+def costruisci_dataset(chiave, uploaded_files, n_processi=1, precedente=None, cache=None, archivio=None,
+                       incrementale=False):
+    """
+    Elabora i file caricati e costruisce il dataset da condividere tra le sessioni.
+
+    Args:
+        chiave (str): Chiave del dataset nel registro.
+        uploaded_files (list): Lista di file caricati dall'utente.
+        n_processi (int): Numero di processi per l'elaborazione parallela dei file (1 = in sequenza).
+        precedente (DatasetCondiviso): Dataset del caricamento precedente della sessione, da cui vengono
+            ripresi il catalogo o le vendite se non sono tra i file caricati.
+        cache (ParquetCache): Cache dei file già elaborati, oppure None.
+        archivio (ArrowCache): Se presente le vendite consolidate sono salvate nell'archivio e rilette
+            in memoria mappata; se l'archivio contiene già il dataset i file non vengono rielaborati.
+        incrementale (bool): Se True vengono elaborati solo i fogli mensili nuovi o modificati rispetto
+            allo storico del dataset precedente (vedi `costruisci_dataset_incrementale`).
+
+    Returns:
+        DatasetCondiviso: Il dataset elaborato.
+    """
+    if incrementale:
+        return costruisci_dataset_incrementale(chiave, uploaded_files, precedente, cache)
+
+    archiviato = dataset_archiviato(chiave, archivio)
+    if archiviato is not None:
+        return archiviato
+
+    # Ogni cartella di lavoro viene letta una sola volta; gli errori sono raccolti file per file
+    main_dataframe, details_dataframe, errori = ingest_files(uploaded_files, n_processes=n_processi, cache=cache)
+    return assembla_dataset(chiave, main_dataframe, details_dataframe, errori, precedente, archivio)
+
+
+def _chiave_archivio(chiave, parte):
+    """
+    Chiave di una parte del dataset nell'archivio Arrow. Come nella cache dei file, la versione
+    dell'elaborazione fa sì che i dataset salvati con un formato precedente non vengano più letti.
+    """
+    return f"{chiave}-v{INGESTION_VERSION}-{parte}"
+
+
+def dataset_archiviato(chiave, archivio):
+    """
+    Restituisce il dataset della chiave rileggendo le vendite dall'archivio in memoria mappata, se presenti.
+
+    Args:
+        chiave (str): Chiave del dataset nel registro.
+        archivio (ArrowCache): Archivio dei dataset consolidati, oppure None.
+
+    Returns:
+        DatasetCondiviso: Il dataset archiviato, oppure None.
+    """
+    main_dataframe = None if archivio is None else archivio.get(_chiave_archivio(chiave, "vendite"))
+    if main_dataframe is None:
+        return None
+    errori = {}
+    details_dataframe = archivio.get(_chiave_archivio(chiave, "dettagli"))
+    details_index = None if details_dataframe is None else _indice_dettagli(details_dataframe, errori)
+    # L'elenco salvato evita di leggere per intero la colonna 'Referente' delle vendite mappate
+    referenze_non_trovate = archivio.get(_chiave_archivio(chiave, "non_trovate"))
+    return _completa_dataset(chiave, main_dataframe, details_dataframe, details_index, errori, referenze_non_trovate)
+
+
+def assembla_dataset(chiave, main_dataframe, details_dataframe, errori, precedente=None, archivio=None):
+    """
+    Costruisce il dataset dalle vendite e dal catalogo già elaborati (vedi `ingest_files`).
+
+    Args:
+        chiave (str): Chiave del dataset nel registro.
+        main_dataframe (pd.DataFrame): Vendite consolidate dei file cliente, oppure None.
+        details_dataframe (pd.DataFrame): Catalogo delle referenze, oppure None.
+        errori (dict): Errori di elaborazione per nome del file; vi si aggiunge un eventuale catalogo non valido.
+        precedente (DatasetCondiviso): Dataset del caricamento precedente della sessione, da cui vengono
+            ripresi il catalogo o le vendite se mancano.
+        archivio (ArrowCache): Se presente le vendite consolidate sono salvate nell'archivio e rilette
+            in memoria mappata.
+
+    Returns:
+        DatasetCondiviso: Il dataset elaborato.
+    """
+    # L'indice del catalogo viene costruito solo quando arriva un nuovo catalogo
+    details_index = None
+    if details_dataframe is not None:
+        details_index = _indice_dettagli(details_dataframe, errori)
+    elif precedente is not None:
+        details_dataframe, details_index = precedente.details_dataframe, precedente.details_index
+    if main_dataframe is None:
+        if precedente is not None:
+            return DatasetCondiviso(chiave, precedente.main_dataframe, details_dataframe, precedente.cubo,
+                                    precedente.indice, errori, details_index, precedente.referenze_non_trovate)
+        return DatasetCondiviso(chiave, details_dataframe=details_dataframe, errori=errori, details_index=details_index)
+
+    # Arricchisce le vendite con il catalogo delle referenze con una ricerca posizionale per codice
+    referenze_non_trovate = None
+    if details_index is not None:
+        main_dataframe, referenze_non_trovate = details_index.enrich(main_dataframe)
+    # I tipi delle colonne vengono normalizzati una sola volta, qui
+    main_dataframe = normalize_schema(main_dataframe)
+
+    if archivio is not None:
+        # La copia in memoria viene sostituita da quella mappata dall'archivio, se il salvataggio riesce
+        archivio.put(_chiave_archivio(chiave, "vendite"), main_dataframe)
+        if details_dataframe is not None:
+            archivio.put(_chiave_archivio(chiave, "dettagli"), details_dataframe)
+        if referenze_non_trovate is not None:
+            archivio.put(_chiave_archivio(chiave, "non_trovate"), referenze_non_trovate)
+        mappato = archivio.get(_chiave_archivio(chiave, "vendite"))
+        if mappato is not None:
+            main_dataframe = mappato
+    return _completa_dataset(chiave, main_dataframe, details_dataframe, details_index, errori, referenze_non_trovate)
+
+
+def costruisci_dataset_incrementale(chiave, uploaded_files, precedente=None, cache=None):
+    """
+    Aggiorna lo storico del dataset precedente con i soli fogli mensili nuovi o modificati dei file caricati.
+
+    Le righe dei fogli elaborati sostituiscono quelle precedenti nelle vendite e nel cubo dei KPI; un nuovo
+    catalogo si applica alle sole righe elaborate. L'archivio in memoria mappata non viene usato.
+
+    Args:
+        chiave (str): Chiave del dataset nel registro.
+        uploaded_files (list): Lista di file caricati dall'utente.
+        precedente (DatasetCondiviso): Dataset del caricamento precedente della sessione, oppure None.
+        cache (ParquetCache): Cache dei file già elaborati, usata per il catalogo, oppure None.
+
+    Returns:
+        DatasetCondiviso: Il dataset aggiornato.
+    """
+    errori = {}
+    details_dataframe = details_index = None
+    file_dettagli = [uploaded_file for uploaded_file in uploaded_files if is_details_file(uploaded_file.name)]
+    if file_dettagli:
+        _, details_dataframe, errori = ingest_files(file_dettagli, cache=cache)
+        if details_dataframe is not None:
+            details_index = _indice_dettagli(details_dataframe, errori)
+    elif precedente is not None:
+        details_dataframe, details_index = precedente.details_dataframe, precedente.details_index
+
+    if precedente is not None and precedente.storico is not None:
+        storico = precedente.storico
+    elif precedente is not None and precedente.main_dataframe is not None:
+        # Dopo un caricamento completo lo storico parte dalle sue vendite, che altrimenti andrebbero perse
+        storico = StoricoVendite.da_dataset(precedente.main_dataframe, precedente.cubo, precedente.indice,
+                                            precedente.referenze_non_trovate, precedente.details_index)
+    else:
+        storico = StoricoVendite()
+    # Il numero di fogli elaborati viene registrato con la misura (vedi la pagina "Prestazioni")
+    with misura("aggiornamento_incrementale", file=len(uploaded_files)) as attributi:
+        storico, errori_storico, attributi['fogli'] = storico.aggiorna(uploaded_files, details_index)
+    errori.update(errori_storico)
+
+    if storico.vendite is None:
+        return DatasetCondiviso(chiave, details_dataframe=details_dataframe, errori=errori,
+                                details_index=details_index, storico=storico)
+
+    # Cubo, indice e report dei codici non trovati sono aggiornati dallo storico con le sole righe modificate
+    return DatasetCondiviso(chiave, storico.vendite, details_dataframe, storico.cubo, storico.indice, errori,
+                            details_index, storico.referenze_non_trovate, storico)
+
+
+def _indice_dettagli(details_dataframe, errori):
+    """
+    Costruisce l'indice del catalogo delle referenze, registrando tra gli errori un catalogo non valido.
+    """
+    try:
+        details_index = DetailsIndex(details_dataframe)
+    except KeyError as e:
+        errori[DETAILS_FILENAME] = f"Errore di colonna: {e}"
+        return None
+    if details_index.duplicates:
+        print(f"Codici 'Referente' ripetuti nel catalogo (vale la prima riga): {details_index.duplicates}")
+    return details_index
+
+
+def _completa_dataset(chiave, main_dataframe, details_dataframe, details_index, errori, referenze_non_trovate=None):
+    """
+    Precalcola il cubo dei KPI e il suo indice e restituisce il dataset.
+    """
+    if referenze_non_trovate is None and details_index is not None:
+        referenze_non_trovate = unmatched_report(main_dataframe, details_index.lookup(main_dataframe['Referente'])[0])
+
+    cubo = indice = None
+    if 'Nome' in main_dataframe.columns:
+        with misura("cubo_e_indice", righe=len(main_dataframe)):
+            cubo = costruisci_cubo_KPI(main_dataframe)
+            indice = IndiceFiltri(cubo)
+    return DatasetCondiviso(chiave, main_dataframe, details_dataframe, cubo, indice, errori,
+                            details_index, referenze_non_trovate)
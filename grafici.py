@@ -0,0 +1,93 @@
+"""
+Figure Plotly riutilizzate tra un rerun e l'altro della dashboard.
+
+Costruire una figura (`go.Figure` e `update_layout`) richiede decine di millisecondi per la validazione
+di tutte le proprietà, mentre tra un rerun e l'altro cambiano solo i dati. `CacheFigure` conserva una figura
+per ogni layout e ne aggiorna solo le proprietà che dipendono dai dati, e solo quando sono cambiate:
+a dati invariati la figura inviata è identica alla precedente e Streamlit trasmette al browser solo
+il riferimento al messaggio già ricevuto (vedi `minCachedMessageSize` in `.streamlit/config.toml`).
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+# Numero massimo di figure conservate per sessione
+MAX_FIGURE = 32
+
+
+def _stessi_dati(dati, altri):
+    """
+    Confronta le proprietà dipendenti dai dati di due chiamate (liste di dizionari per traccia e layout).
+    """
+    if len(dati) != len(altri):
+        return False
+    for proprieta, altre in zip(dati, altri):
+        if proprieta.keys() != altre.keys():
+            return False
+        if not all(np.array_equal(valore, altre[nome]) for nome, valore in proprieta.items()):
+            return False
+    return True
+
+
+class CacheFigure:
+    """
+    Figure Plotly di una sessione, una per layout, aggiornate sul posto.
+
+    Le figure vengono modificate a ogni chiamata: la cache appartiene a una sola sessione
+    e va conservata nel suo stato, non condivisa tra sessioni.
+
+    Args:
+        max_figure (int): Numero massimo di figure conservate; oltre il limite viene eliminata la meno usata.
+    """
+
+    def __init__(self, max_figure=MAX_FIGURE):
+        self.max_figure = max_figure
+        self._figure = OrderedDict()  # chiave del layout -> (dati, figura)
+        self.costruite = 0
+        self.aggiornate = 0
+        self.invariate = 0
+
+    def figura(self, chiave, costruisci, tracce, layout=None):
+        """
+        Restituisce la figura del layout con i dati indicati.
+
+        La figura viene costruita solo la prima volta per la chiave; in seguito vengono assegnate
+        solo le proprietà di `tracce` e `layout`, se diverse da quelle della chiamata precedente.
+
+        Args:
+            chiave (tuple): Identifica il layout: nome del grafico e parametri che ne cambiano la struttura
+                (titolo, numero di tracce, ...).
+            costruisci (callable): Funzione senza argomenti che crea la figura del layout.
+            tracce (list): Per ogni traccia, dizionario delle proprietà che dipendono dai dati, per percorso
+                Plotly (ad esempio {'x': valori, 'marker.color': colori}).
+            layout (dict): Proprietà del layout che dipendono dai dati, per percorso Plotly
+                (ad esempio {'annotations[0].text': testo}).
+
+        Returns:
+            plotly.graph_objects.Figure: La figura aggiornata.
+        """
+        dati = list(tracce) + [layout or {}]
+        voce = self._figure.get(chiave)
+        if voce is not None:
+            self._figure.move_to_end(chiave)
+            if _stessi_dati(dati, voce[0]):
+                self.invariate += 1
+                return voce[1]
+            figura = voce[1]
+            self.aggiornate += 1
+        else:
+            figura = costruisci()
+            self.costruite += 1
+
+        with figura.batch_update():
+            for indice, proprieta in enumerate(tracce):
+                if proprieta:
+                    figura.plotly_restyle({nome: [valore] for nome, valore in proprieta.items()},
+                                          trace_indexes=[indice])
+            if layout:
+                figura.plotly_relayout(layout)
+
+        self._figure[chiave] = (dati, figura)
+        while len(self._figure) > self.max_figure:
+            self._figure.popitem(last=False)
+        return figura
@@ -0,0 +1,174 @@
+"""
+Indici per i filtri della dashboard.
+
+Per ogni valore di Cliente, Nome e grammatura l'indice conserva le posizioni delle righe che lo contengono,
+più un ordinamento delle righe per mese: un filtro diventa un'intersezione di posizioni precalcolate
+invece di un confronto su tutte le righe.
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Dimensioni indicizzate, nell'ordine in cui compaiono nella barra laterale
+DIMENSIONI_FILTRI = ['Cliente', 'Nome', 'Quantita in grammi']
+
+# Valore dei filtri che non applica alcuna selezione
+TUTTI = "Tutti"
+
+
+def _ordina_valori(colonna, posizioni):
+    """
+    Ordina le posizioni per valore come `groupby(sort=True)`: nell'ordine delle categorie per le colonne
+    categoriali, altrimenti in ordine crescente. È l'ordine delle opzioni nella barra laterale.
+
+    Args:
+        colonna (pd.Series): Colonna indicizzata della tabella.
+        posizioni (dict): `{valore: posizioni}`.
+
+    Returns:
+        dict: Lo stesso dizionario, con i valori nell'ordine della colonna.
+    """
+    if isinstance(colonna.dtype, pd.CategoricalDtype):
+        ordine = {valore: i for i, valore in enumerate(colonna.cat.categories)}
+        return dict(sorted(posizioni.items(), key=lambda elemento: ordine[elemento[0]]))
+    return dict(sorted(posizioni.items()))
+
+
+class IndiceFiltri:
+    """
+    Indice invertito delle righe di una tabella (tipicamente il cubo dei KPI) per i filtri della dashboard.
+
+    Args:
+        tabella (pd.DataFrame): Tabella da indicizzare.
+        dimensioni (list): Colonne da indicizzare per valore.
+        colonna_data (str): Colonna con il mese di ogni riga.
+    """
+
+    def __init__(self, tabella, dimensioni=DIMENSIONI_FILTRI, colonna_data='Data_datetime'):
+        self.n_righe = len(tabella)
+        self.dimensioni = list(dimensioni)
+
+        # Posizioni delle righe per ogni valore (i valori mancanti non sono selezionabili)
+        self.posizioni = {
+            dimensione: _ordina_valori(tabella[dimensione], {
+                valore: np.sort(posizioni) for valore, posizioni in
+                tabella.groupby(dimensione, observed=True, sort=False).indices.items()})
+            for dimensione in self.dimensioni
+        }
+
+        # Righe con un mese valido, ordinate per mese
+        date = tabella[colonna_data].to_numpy(dtype='datetime64[ns]')
+        valide = np.flatnonzero(~np.isnat(date))
+        ordine = valide[np.argsort(date[valide], kind='stable')]
+        self.ordine_date = ordine
+        self.date_ordinate = date[ordine]
+
+    def aggiorna(self, tabella, posizioni_precedenti, colonna_data='Data_datetime'):
+        """
+        Restituisce l'indice della tabella aggiornata senza raggruppare di nuovo le righe già indicizzate:
+        vengono indicizzate solo le righe nuove, mentre le posizioni delle altre vengono rimappate.
+
+        La tabella aggiornata contiene prima le righe rimaste, nel loro ordine, e poi le righe nuove
+        (come il cubo restituito da `aggiorna_cubo_KPI`).
+
+        Args:
+            tabella (pd.DataFrame): Tabella aggiornata.
+            posizioni_precedenti (np.ndarray): Posizione di ogni riga precedente nella tabella aggiornata
+                (-1 se rimossa).
+            colonna_data (str): Colonna con il mese di ogni riga.
+
+        Returns:
+            IndiceFiltri: Il nuovo indice; quello corrente non viene modificato.
+        """
+        n_rimaste = int((posizioni_precedenti >= 0).sum())
+        nuove = IndiceFiltri(tabella.iloc[n_rimaste:], self.dimensioni, colonna_data)
+
+        indice = copy.copy(self)
+        indice.n_righe = len(tabella)
+        indice.posizioni = {}
+        for dimensione in self.dimensioni:
+            posizioni = {}
+            for valore, precedenti in self.posizioni[dimensione].items():
+                rimappate = posizioni_precedenti[precedenti]
+                rimappate = rimappate[rimappate >= 0]
+                if rimappate.size:
+                    posizioni[valore] = rimappate
+            # Le righe nuove seguono tutte le rimaste, quindi le posizioni restano ordinate
+            for valore, aggiunte in nuove.posizioni[dimensione].items():
+                aggiunte = aggiunte + n_rimaste
+                posizioni[valore] = np.concatenate([posizioni[valore], aggiunte]) if valore in posizioni else aggiunte
+            indice.posizioni[dimensione] = _ordina_valori(tabella[dimensione], posizioni)
+
+        # Le righe nuove vengono inserite nell'ordinamento per mese, dopo le rimaste dello stesso mese
+        rimappate = posizioni_precedenti[self.ordine_date]
+        rimaste = rimappate >= 0
+        date_rimaste = self.date_ordinate[rimaste]
+        punti = np.searchsorted(date_rimaste, nuove.date_ordinate, side='right')
+        indice.ordine_date = np.insert(rimappate[rimaste], punti, nuove.ordine_date + n_rimaste)
+        indice.date_ordinate = np.insert(date_rimaste, punti, nuove.date_ordinate)
+        return indice
+
+    def _posizioni_date(self, data_inizio, data_fine):
+        """
+        Restituisce, ordinate, le posizioni delle righe con il mese compreso tra le due date.
+        """
+        if data_inizio is None and data_fine is None:
+            return np.arange(self.n_righe)
+
+        inizio = 0 if data_inizio is None else np.searchsorted(
+            self.date_ordinate, np.datetime64(pd.Timestamp(data_inizio), 'ns'), side='left')
+        fine = len(self.date_ordinate) if data_fine is None else np.searchsorted(
+            self.date_ordinate, np.datetime64(pd.Timestamp(data_fine), 'ns'), side='right')
+        return np.sort(self.ordine_date[inizio:fine])
+
+    def seleziona(self, filtri=None, data_inizio=None, data_fine=None):
+        """
+        Restituisce le posizioni delle righe che rispettano tutti i filtri.
+
+        Args:
+            filtri (dict): `{dimensione: valore}`; i valori `"Tutti"` non applicano alcun filtro.
+            data_inizio (pd.Timestamp): Primo giorno incluso (nessun limite se None).
+            data_fine (pd.Timestamp): Ultimo giorno incluso (nessun limite se None).
+
+        Returns:
+            np.ndarray: Posizioni ordinate delle righe selezionate.
+        """
+        insiemi = [
+            self.posizioni[dimensione].get(valore, np.empty(0, dtype=np.intp))
+            for dimensione, valore in (filtri or {}).items() if valore != TUTTI
+        ]
+
+        # Si parte dall'insieme più piccolo, così ogni intersezione lavora su meno posizioni
+        insiemi.sort(key=len)
+        if insiemi:
+            selezione = insiemi[0]
+            for insieme in insiemi[1:]:
+                selezione = np.intersect1d(selezione, insieme, assume_unique=True)
+            if data_inizio is not None or data_fine is not None:
+                selezione = np.intersect1d(selezione, self._posizioni_date(data_inizio, data_fine), assume_unique=True)
+            return selezione
+
+        return self._posizioni_date(data_inizio, data_fine)
+
+    def opzioni(self, dimensione, filtri=None):
+        """
+        Restituisce i valori di una dimensione presenti nelle righe che rispettano gli altri filtri,
+        ad esempio solo i Nome venduti al Cliente selezionato.
+
+        Args:
+            dimensione (str): Dimensione di cui elencare i valori.
+            filtri (dict): Filtri già scelti sulle altre dimensioni.
+
+        Returns:
+            list: Valori disponibili, in ordine.
+        """
+        valori = self.posizioni[dimensione]
+        filtri = {chiave: valore for chiave, valore in (filtri or {}).items()
+                  if chiave != dimensione and valore != TUTTI}
+        if not filtri:
+            return list(valori)
+
+        selezione = self.seleziona(filtri)
+        return [valore for valore, posizioni in valori.items()
+                if np.intersect1d(posizioni, selezione, assume_unique=True).size]
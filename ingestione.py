@@ -0,0 +1,969 @@
+"""
+Lettura ed elaborazione dei file Excel caricati nel cruscotto.
+
+Il modulo non dipende da Streamlit, così da poter essere importato anche dai processi
+usati per il caricamento parallelo.
+"""
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from prestazioni import misura
+
+# Nome del file con il catalogo delle referenze
+DETAILS_FILENAME = "dettagli_referenze.xlsx"
+
+# Versione del formato prodotto dall'elaborazione: va incrementata quando il formato cambia,
+# così che i risultati salvati nella cache con il formato precedente non vengano più usati
+INGESTION_VERSION = 4
+
+# Colonne del catalogo delle referenze
+DETAILS_COLUMNS = ['Referente', 'Nome', 'Quantita in grammi', 'Pezzi in un cartone', 'Ricetta', 'Listino']
+
+# Colonne numeriche dei fogli mensili (possono usare la virgola come separatore decimale)
+NUMERIC_COLUMNS = ['Fatturato_Anno_Prec', 'Cartoni_Venduti_Prec', 'Fatturato', 'Cartoni_Venduti']
+
+# Colonne salvate come categorie e colonne numeriche ridotte a 32 bit dalla normalizzazione dello schema
+CATEGORICAL_COLUMNS = ['Cliente', 'Nome', 'Referente', 'Mese']
+SCHEMA_NUMERIC_COLUMNS = NUMERIC_COLUMNS + [
+    'Pezzi in un cartone', 'Quantita in grammi', 'Ricetta', 'Listino', 'Sconto secondo livello', 'Sconto primo livello'
+]
+
+# Nomi dei fogli mensili, nell'ordine dei mesi
+ITALIAN_MONTHS = [
+    "GENNAIO", "FEBBRAIO", "MARZO", "APRILE", "MAGGIO", "GIUGNO",
+    "LUGLIO", "AGOSTO", "SETTEMBRE", "OTTOBRE", "NOVEMBRE", "DICEMBRE"
+]
+
+# Lunghezza minima di un'abbreviazione del nome del mese ("Gen", "Sett.")
+MIN_MONTH_ABBREVIATION = 3
+
+# Valore di 'Periodo' per le righe di un foglio che non corrisponde a un mese
+INVALID_PERIOD = -1
+
+# Numero di colonne lette dal foglio dei metadati e dai fogli mensili
+METADATA_N_COLUMNS = 4
+MONTHLY_N_COLUMNS = 5
+
+# Numero massimo di righe preallocate prima di leggere un foglio; oltre, gli array vengono raddoppiati
+MAX_PREALLOCATED_ROWS = 65536
+
+
+#Lettura in streaming delle sole colonne necessarie
+def _convert_cell(value):
+    """
+    Converte il valore di una cella come fa `pd.read_excel`: i numeri decimali interi diventano interi.
+    """
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _to_float(value):
+    """
+    Converte il valore di una cella numerica in float, accettando la virgola come separatore decimale.
+    """
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "."))
+    except ValueError:
+        return np.nan
+
+
+def _read_sheet_columns(worksheet, n_columns, numeric_columns=(), max_rows=None):
+    """
+    Legge riga per riga le prime `n_columns` colonne di un foglio aperto in sola lettura.
+
+    I valori vengono scritti in array preallocati: float per le colonne numeriche, object per le altre.
+    Le colonne oltre `n_columns` non vengono mai materializzate, così la memoria occupata non dipende
+    dalla larghezza del foglio.
+
+    Args:
+        worksheet (ReadOnlyWorksheet): Foglio aperto con `openpyxl.load_workbook(..., read_only=True)`.
+        n_columns (int): Numero di colonne da leggere.
+        numeric_columns (list): Nomi delle colonne da convertire in float durante la lettura.
+        max_rows (int): Numero massimo di righe di dati da leggere (tutte se None).
+
+    Returns:
+        pd.DataFrame: DataFrame con l'intestazione del foglio come nomi delle colonne.
+    """
+    rows = worksheet.iter_rows(max_col=n_columns, max_row=None if max_rows is None else max_rows + 1,
+                               values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+
+    names = [f"Unnamed: {j}" if name is None else name for j, name in enumerate(header)]
+    numeric = [name in numeric_columns for name in names]
+
+    # In sola lettura `max_row` deriva dalle dimensioni dichiarate nel foglio e può mancare
+    capacity = max(min(max_rows or worksheet.max_row or 1, MAX_PREALLOCATED_ROWS), 1)
+    arrays = [np.full(capacity, np.nan) if is_numeric else np.full(capacity, None, dtype=object)
+              for is_numeric in numeric]
+
+    # Larghezza effettiva (le colonne vuote a destra vengono scartate) e ultima riga non vuota
+    width = max((j + 1 for j, name in enumerate(header) if name is not None), default=0)
+    n_rows = 0
+    last_row = 0
+    for row in rows:
+        if n_rows == capacity:
+            arrays = [np.concatenate([array, np.full(capacity, np.nan) if is_numeric
+                                      else np.full(capacity, None, dtype=object)])
+                      for array, is_numeric in zip(arrays, numeric)]
+            capacity *= 2
+
+        empty = True
+        for j, value in enumerate(row):
+            if value is None:
+                continue
+            empty = False
+            width = max(width, j + 1)
+            arrays[j][n_rows] = _to_float(value) if numeric[j] else _convert_cell(value)
+
+        n_rows += 1
+        if not empty:
+            last_row = n_rows
+
+    dataframe = pd.DataFrame({j: arrays[j][:last_row] for j in range(width)})
+    dataframe.columns = names[:width]
+    return dataframe.infer_objects()
+
+
+def _open_workbook(source):
+    """
+    Apre la cartella di lavoro in sola lettura e in streaming.
+
+    openpyxl viene importato solo alla prima lettura di un file, così che importare il modulo
+    (ad esempio all'avvio della dashboard) non ne paghi il costo.
+    """
+    import openpyxl
+
+    return openpyxl.load_workbook(source, read_only=True, data_only=True, keep_links=False)
+
+
+def read_customer_workbook(source):
+    """
+    Legge in streaming una cartella di lavoro cliente, limitandosi alle colonne usate dal cruscotto.
+
+    Args:
+        source (UploadedFile | str | bytes-like): Il file da leggere.
+
+    Returns:
+        dict: Fogli nel formato di `pd.read_excel(..., sheet_name=None)`, con la prima riga delle prime
+            4 colonne per il foglio dei metadati e le prime 5 colonne per i fogli mensili.
+    """
+    workbook = _open_workbook(source)
+    try:
+        excel_data = {}
+        for position, worksheet in enumerate(workbook.worksheets):
+            if position == 0:
+                excel_data[worksheet.title] = _read_sheet_columns(worksheet, METADATA_N_COLUMNS, max_rows=1)
+            else:
+                excel_data[worksheet.title] = _read_sheet_columns(worksheet, MONTHLY_N_COLUMNS,
+                                                                  numeric_columns=NUMERIC_COLUMNS)
+        return excel_data
+    finally:
+        workbook.close()
+
+
+def read_details_workbook(source):
+    """
+    Legge in streaming le prime 6 colonne del primo foglio del file `dettagli_referenze.xlsx`.
+
+    Args:
+        source (UploadedFile | str | bytes-like): Il file da leggere.
+
+    Returns:
+        dict: Il solo primo foglio nel formato di `pd.read_excel(..., sheet_name=None)`.
+    """
+    workbook = _open_workbook(source)
+    try:
+        worksheet = workbook.worksheets[0]
+        return {worksheet.title: _read_sheet_columns(worksheet, len(DETAILS_COLUMNS))}
+    finally:
+        workbook.close()
+
+
+def _sheet_fingerprints(workbook):
+    """
+    Calcola l'impronta di ogni foglio dal CRC della sua parte XML nell'archivio .xlsx,
+    senza leggerne le celle.
+
+    Le celle di testo sono salvate nelle stringhe condivise della cartella di lavoro: il loro CRC entra
+    nell'impronta di ogni foglio, così che una modifica alle stringhe invalidi tutti i fogli.
+
+    Args:
+        workbook (openpyxl.Workbook): Cartella di lavoro aperta in sola lettura.
+
+    Returns:
+        dict: Impronta per titolo del foglio, None se non è possibile calcolarla.
+    """
+    archive = getattr(workbook, '_archive', None)
+    if archive is None:
+        return {worksheet.title: None for worksheet in workbook.worksheets}
+
+    parts = {info.filename: info for info in archive.infolist()}
+    strings = next((info.CRC for name, info in parts.items() if name.endswith('sharedStrings.xml')), 0)
+
+    fingerprints = {}
+    for worksheet in workbook.worksheets:
+        info = parts.get(getattr(worksheet, '_worksheet_path', None))
+        fingerprints[worksheet.title] = (None if info is None else
+                                         f"v{INGESTION_VERSION}-{info.CRC:08x}-{info.file_size}-{strings:08x}")
+    return fingerprints
+
+
+def read_customer_workbook_changes(source, known_fingerprints):
+    """
+    Legge in streaming il foglio dei metadati di una cartella di lavoro cliente e i soli fogli mensili
+    nuovi o modificati rispetto alle impronte note.
+
+    Args:
+        source (UploadedFile | str | bytes-like): Il file da leggere.
+        known_fingerprints (dict): Impronte dei fogli già elaborati per (cliente, anno, mese).
+
+    Returns:
+        tuple: (fogli nel formato di `read_customer_workbook` con i metadati e i soli fogli da elaborare;
+            impronte di tutti i fogli mensili del file per (cliente, anno, mese)).
+    """
+    workbook = _open_workbook(source)
+    try:
+        worksheets = workbook.worksheets
+        metadata = _read_sheet_columns(worksheets[0], METADATA_N_COLUMNS, max_rows=1)
+        cliente, anno, sconto_secondo_livello, sconto_primo_livello = _customer_metadata(metadata)
+
+        excel_data = {worksheets[0].title: metadata}
+        fingerprints = {}
+        for title, fingerprint in list(_sheet_fingerprints(workbook).items())[1:]:
+            # Gli sconti del cliente sono riportati su ogni riga: se cambiano, cambiano tutti i fogli
+            if fingerprint is not None:
+                fingerprint = f"{fingerprint}-{sconto_secondo_livello}-{sconto_primo_livello}"
+            key = (cliente, anno, title)
+            fingerprints[key] = fingerprint
+            if fingerprint is None or known_fingerprints.get(key) != fingerprint:
+                excel_data[title] = _read_sheet_columns(workbook[title], MONTHLY_N_COLUMNS,
+                                                        numeric_columns=NUMERIC_COLUMNS)
+        return excel_data, fingerprints
+    finally:
+        workbook.close()
+
+
+def _repeat_as_categorical(values, lengths):
+    """
+    Crea una colonna categoriale ripetendo ogni valore per la lunghezza del rispettivo blocco.
+
+    Args:
+        values (list): Un valore per ciascun blocco.
+        lengths (list): Numero di righe di ciascun blocco.
+
+    Returns:
+        pd.Categorical: Colonna lunga quanto la somma delle lunghezze.
+    """
+    categorical = pd.Categorical(values)
+    codes = np.repeat(categorical.codes, lengths)
+    return pd.Categorical.from_codes(codes, dtype=categorical.dtype)
+
+
+def _stack_monthly_sheets(excel_data, first_sheet, cliente, anno, sconto_secondo_livello, sconto_primo_livello):
+    """
+    Impila le prime 5 colonne dei fogli mensili in un unico DataFrame in una sola passata.
+
+    Args:
+        excel_data (dict): Fogli letti con `pd.read_excel(..., sheet_name=None)`.
+        first_sheet (str): Nome del foglio dei metadati, escluso dall'impilamento.
+        cliente (str): Nome del cliente.
+        anno (int): Anno dei dati.
+        sconto_secondo_livello (float): Sconto di secondo livello del cliente.
+        sconto_primo_livello (float): Sconto di primo livello del cliente.
+
+    Returns:
+        pd.DataFrame: DataFrame con i dati di tutti i fogli mensili.
+    """
+    # Raccoglie i blocchi dei fogli mensili (tutti i fogli eccetto il primo, che è per i metadati):
+    # vengono concatenati una sola volta alla fine invece di ricopiare il DataFrame a ogni foglio
+    blocks = []
+    months = []
+    for sheet_name, sheet_data in excel_data.items():
+        if sheet_name == first_sheet:
+            continue
+
+        # Estrae le prime 5 colonne del foglio
+        blocks.append(sheet_data.iloc[:, :5])
+        months.append(sheet_name)
+
+    consolidated_data = pd.concat(blocks, ignore_index=True)
+
+    # Converte i valori numerici con virgola come separatore decimale (se non lo sono già)
+    for col in NUMERIC_COLUMNS:
+        if col in consolidated_data.columns and not pd.api.types.is_numeric_dtype(consolidated_data[col]):
+            consolidated_data[col] = pd.to_numeric(consolidated_data[col].replace(",", ".", regex=True), errors='coerce')
+
+    # Aggiunge colonne per cliente, anno, mese sconto di primo e secondo livello: i valori costanti
+    # per file o per foglio sono salvati come categorie ripetute per la lunghezza di ogni blocco
+    n_rows = len(consolidated_data)
+    consolidated_data['Cliente'] = _repeat_as_categorical([cliente], [n_rows])
+    consolidated_data['Anno'] = np.full(n_rows, anno)
+    consolidated_data['Mese'] = _repeat_as_categorical(months, [len(block) for block in blocks])
+    consolidated_data['Sconto secondo livello'] = np.full(n_rows, sconto_secondo_livello, dtype=float)
+    consolidated_data['Sconto primo livello'] = np.full(n_rows, sconto_primo_livello, dtype=float)
+
+    return consolidated_data
+
+
+def _customer_metadata(metadata):
+    """
+    Estrae cliente, anno e sconti dal foglio dei metadati di una cartella di lavoro cliente.
+
+    Args:
+        metadata (pd.DataFrame): Primo foglio della cartella di lavoro.
+
+    Returns:
+        tuple: (cliente, anno, sconto di secondo livello, sconto di primo livello).
+    """
+    metadata.columns = metadata.columns.str.strip()  # Rimuove spazi dai nomi delle colonne
+    cliente = metadata.iloc[0, 0]  # Prima colonna, prima riga (Nome cliente)
+
+    # Corregge l'anno, rimuovendo caratteri non numerici e assicurandosi che sia un intero
+    anno = str(metadata.iloc[0, 1]).replace(",", "").strip()  # Rimuove virgole o spazi
+    anno = int(float(anno))  # Converte in intero per evitare errori
+
+    # Controlla se la colonna dello sconto di secondo livello è disponibile
+    if metadata.shape[1] > 2:
+        sconto_secondo_livello = float(metadata.iloc[0, 2])
+    else:
+        sconto_secondo_livello = 0  # Valore predefinito
+
+    # Controlla se la colonna dello sconto di primo livello è disponibile
+    if metadata.shape[1] > 3:
+        sconto_primo_livello = float(metadata.iloc[0, 3])
+    else:
+        sconto_primo_livello = 0  # Valore predefinito
+
+    return cliente, anno, sconto_secondo_livello, sconto_primo_livello
+
+
+def _consolidate_excel_data(excel_data):
+    """
+    Consolida i fogli già letti di una cartella di lavoro cliente.
+
+    A differenza di `process_excel_to_dataframe` non intercetta gli errori, così che il chiamante
+    possa riportarli file per file.
+
+    Args:
+        excel_data (dict): Fogli letti con `pd.read_excel(..., sheet_name=None)`.
+
+    Returns:
+        pd.DataFrame: DataFrame consolidato con i dati richiesti.
+    """
+    # Recupera il primo foglio per ottenere informazioni sul cliente e sull'anno
+    first_sheet = list(excel_data.keys())[0]
+    cliente, anno, sconto_secondo_livello, sconto_primo_livello = _customer_metadata(excel_data[first_sheet])
+
+    # Impila i fogli mensili aggiungendo cliente, anno, mese e sconti
+    consolidated_data = _stack_monthly_sheets(excel_data, first_sheet, cliente, anno,
+                                              sconto_secondo_livello, sconto_primo_livello)
+
+    # Specifica la colonna in cui vuoi eliminare le righe con valori nulli
+    colonna_target = 'Referente'
+
+    # Elimina le righe con valore nullo nella colonna specificata
+    consolidated_data = consolidated_data[consolidated_data[colonna_target].notna()]
+
+    # Trasforma 'Mese' e 'Anno' in 'Data'
+    consolidated_data = combine_month_year_to_date(consolidated_data)
+
+    return consolidated_data
+
+
+#Funzione per leggere il primo file excel
+def process_excel_to_dataframe(uploaded_file):
+    """
+    Legge un file Excel con dati organizzati su più fogli e restituisce un DataFrame consolidato con informazioni
+    sul cliente, anno, mese e le prime 5 colonne dei fogli mensili.
+
+    Args:
+        uploaded_file (UploadedFile | str | dict): File caricato dall'utente, percorso del file Excel oppure
+            i fogli già letti con `pd.read_excel(..., sheet_name=None)`.
+
+    Returns:
+        pd.DataFrame: DataFrame consolidato con i dati richiesti.
+    """
+    try:
+        # Legge tutti i fogli del file Excel (solo se non sono già stati letti dal chiamante)
+        excel_data = uploaded_file if isinstance(uploaded_file, dict) else read_customer_workbook(uploaded_file)
+
+        return _consolidate_excel_data(excel_data)
+
+    except Exception as e:
+        print(f"Errore durante l'elaborazione del file Excel: {e}")
+        return pd.DataFrame()
+
+
+def _extract_details(excel_data):
+    """
+    Estrae le prime 6 colonne del primo foglio del file `dettagli_referenze.xlsx` già letto.
+
+    Args:
+        excel_data (dict): Fogli letti con `pd.read_excel(..., sheet_name=None)`.
+
+    Returns:
+        pd.DataFrame: DataFrame contenente le prime 6 colonne, rinominate per uniformità.
+    """
+    second_data = excel_data[list(excel_data.keys())[0]].iloc[:, :6].copy()
+
+    # Rinomina le colonne per uniformità
+    second_data.columns = DETAILS_COLUMNS
+
+    return second_data
+
+
+#legge il secondo file excel
+def process_second_excel_to_dataframe(file_path):
+    """
+    Legge un secondo file Excel e restituisce un DataFrame con le prime 5 colonne richieste.
+
+    Args:
+        file_path (str | dict): Il percorso del secondo file Excel oppure i fogli già letti
+            con `pd.read_excel(..., sheet_name=None)`.
+
+    Returns:
+        pd.DataFrame: DataFrame contenente le prime 6 colonne.
+    """
+    try:
+        # Legge il file Excel (solo se non è già stato letto dal chiamante)
+        excel_data = file_path if isinstance(file_path, dict) else read_details_workbook(file_path)
+
+        return _extract_details(excel_data)
+
+    except Exception as e:
+        print(f"Errore durante l'elaborazione del secondo file Excel: {e}")
+        return pd.DataFrame()
+
+
+def month_number(sheet_name):
+    """
+    Restituisce il numero del mese (1-12) corrispondente al nome di un foglio mensile.
+
+    Oltre ai nomi esatti ("GENNAIO") sono accettate le varianti più comuni: minuscole, spazi iniziali
+    o finali e abbreviazioni di almeno tre lettere, con o senza punto ("Gen", "sett.").
+
+    Args:
+        sheet_name (str): Nome del foglio.
+
+    Returns:
+        int: Numero del mese, oppure None se il nome non corrisponde a nessun mese.
+    """
+    name = str(sheet_name).strip().rstrip(".").upper()
+    if len(name) < MIN_MONTH_ABBREVIATION:
+        return None
+    for number, month in enumerate(ITALIAN_MONTHS, start=1):
+        if month.startswith(name):
+            return number
+    return None
+
+
+#Funzione per combinare mesi e anni e assegnare a ogni riga la data del mese
+@misura("conversione_date")
+def combine_month_year_to_date(dataframe):
+    """
+    Combina le colonne 'Mese' e 'Anno' nella data del mese ('Data', primo giorno del mese)
+    e nel periodo intero 'Periodo' (anno * 12 + mese - 1).
+
+    Il nome del foglio viene convertito nel numero del mese una sola volta per foglio; le date
+    di tutte le righe sono poi calcolate con operazioni sugli interi, senza passare per le stringhe.
+    Le righe dei fogli il cui nome non corrisponde a un mese hanno 'Data' NaT e 'Periodo' `INVALID_PERIOD`.
+
+    Args:
+        dataframe (pd.DataFrame): Il DataFrame con le colonne 'Mese' (nome del foglio) e 'Anno'.
+
+    Returns:
+        pd.DataFrame: Il DataFrame aggiornato con le colonne 'Data' e 'Periodo' al posto di 'Mese' e 'Anno'.
+    """
+    try:
+        months = dataframe['Mese']
+        if not isinstance(months.dtype, pd.CategoricalDtype):
+            months = months.astype('category')
+
+        # Un numero di mese per foglio (0 se il nome non è riconosciuto), poi ripetuto per le righe tramite i codici
+        numbers = []
+        for sheet_name in months.cat.categories:
+            number = month_number(sheet_name)
+            if number is None:
+                print(f"Il foglio '{sheet_name}' non corrisponde a nessun mese: le sue righe non avranno una data.")
+            numbers.append(number or 0)
+        # Il codice -1 (mese mancante) seleziona l'ultimo elemento, cioè un mese non valido
+        month = np.array(numbers + [0], dtype=np.int64)[months.cat.codes.to_numpy()]
+
+        year = dataframe['Anno'].to_numpy(dtype=np.int64)
+        valid = month > 0
+        period = np.where(valid, year * 12 + month - 1, INVALID_PERIOD)
+
+        # Mesi trascorsi dal gennaio 1970, interpretati direttamente come date mensili
+        months_since_epoch = np.where(valid, period - 1970 * 12, np.iinfo(np.int64).min)
+        dataframe['Data'] = months_since_epoch.astype('datetime64[M]').astype('datetime64[ns]')
+        dataframe['Periodo'] = period.astype(np.int32)
+
+        # Rimuove le colonne 'Mese' e 'Anno'
+        dataframe.drop(columns=['Mese', 'Anno'], inplace=True)
+
+        return dataframe
+
+    except Exception as e:
+        print(f"Errore durante la conversione delle colonne 'Mese' e 'Anno' in 'Data': {e}")
+        return dataframe
+
+
+def _referente_as_string(values):
+    """
+    Converte i codici 'Referente' in stringhe; per le colonne categoriali converte solo le categorie.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        if pd.api.types.is_string_dtype(values.cat.categories):
+            return values
+        return values.cat.rename_categories(values.cat.categories.astype(str))
+    return values.astype(str)
+
+
+def _referente_codes(values):
+    """
+    Restituisce i codici 'Referente' come posizioni in un elenco di valori unici convertiti in stringa.
+
+    La conversione in stringa riguarda solo i valori distinti, non tutte le righe.
+
+    Returns:
+        tuple: (posizioni per riga, -1 per i valori mancanti; pd.Index dei codici come stringhe).
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+
+    # Valori diversi possono diventare la stessa stringa (ad esempio 1000 e "1000")
+    unique_codes, strings = pd.factorize(pd.Index(uniques).astype(str))
+    # L'elemento aggiunto in coda fa corrispondere -1 a -1
+    return np.append(unique_codes, -1)[codes], pd.Index(strings)
+
+
+class DetailsIndex:
+    """
+    Indice del catalogo `dettagli_referenze` per codice 'Referente'.
+
+    Il catalogo cambia di rado: l'indice viene costruito una volta e arricchisce le righe di vendita
+    con una ricerca posizionale vettoriale, senza unire di nuovo l'intero storico.
+
+    Args:
+        details_dataframe (pd.DataFrame): Catalogo con le colonne `DETAILS_COLUMNS`.
+
+    Raises:
+        KeyError: Se manca una delle colonne `DETAILS_COLUMNS`.
+    """
+
+    def __init__(self, details_dataframe):
+        for col in DETAILS_COLUMNS:
+            if col not in details_dataframe.columns:
+                raise KeyError(f"La colonna '{col}' non è presente nel secondo DataFrame.")
+
+        codes, strings = _referente_codes(details_dataframe['Referente'])
+        rows = np.flatnonzero(codes >= 0)
+        codes = codes[rows]
+
+        # A parità di codice vale la prima riga del catalogo; i codici ripetuti vengono segnalati
+        unique_codes, first = np.unique(codes, return_index=True)
+        self.codes = strings[unique_codes]
+        self.rows = np.append(rows[first], -1)  # In coda la posizione dei codici non trovati
+        self.duplicates = list(strings[np.unique(codes[pd.Series(codes).duplicated().to_numpy()])])
+        self.columns = {col: details_dataframe[col].array for col in DETAILS_COLUMNS[1:]}
+
+    def lookup(self, referente):
+        """
+        Restituisce, per ogni codice, la riga del catalogo corrispondente (-1 se il codice non è presente).
+
+        Args:
+            referente (pd.Series): Codici 'Referente' delle righe di vendita.
+
+        Returns:
+            tuple: (posizioni nel catalogo per riga, codici 'Referente' come colonna categoriale di stringhe).
+        """
+        codes, strings = _referente_codes(referente)
+        positions = self.rows[self.codes.get_indexer(strings)]
+        return np.append(positions, -1)[codes], pd.Categorical.from_codes(codes, strings)
+
+    @misura("unione_catalogo")
+    def enrich(self, main_dataframe):
+        """
+        Aggiunge alle righe di vendita le colonne del catalogo, con NaN per i codici non presenti.
+
+        Args:
+            main_dataframe (pd.DataFrame): Righe di vendita con la colonna 'Referente'.
+
+        Returns:
+            tuple: (DataFrame arricchito; report dei codici non trovati restituito da `unmatched_report`).
+        """
+        positions, referente = self.lookup(main_dataframe['Referente'])
+        enriched = main_dataframe.assign(Referente=referente)
+        for col, values in self.columns.items():
+            enriched[col] = pd.api.extensions.take(values, positions, allow_fill=True)
+        return enriched, unmatched_report(enriched, positions)
+
+
+def unmatched_report(main_dataframe, positions):
+    """
+    Elenca i codici 'Referente' delle vendite assenti dal catalogo, che altrimenti finirebbero
+    nei KPI con costi e listini a zero.
+
+    Args:
+        main_dataframe (pd.DataFrame): Righe di vendita con la colonna 'Referente'.
+        positions (np.ndarray): Posizioni nel catalogo restituite da `DetailsIndex.lookup`.
+
+    Returns:
+        pd.DataFrame: Una riga per codice con il numero di righe e il fatturato interessati,
+            in ordine di fatturato decrescente.
+    """
+    unmatched = main_dataframe.loc[positions < 0]
+    if 'Fatturato' in unmatched.columns:
+        fatturato = pd.to_numeric(unmatched['Fatturato'], errors='coerce')
+    else:
+        fatturato = pd.Series(np.nan, index=unmatched.index)
+    report = (pd.DataFrame({'Referente': unmatched['Referente'].astype(object), 'Fatturato': fatturato})
+              .groupby('Referente', dropna=False, sort=False)['Fatturato'].agg(['size', 'sum'])
+              .rename(columns={'size': 'Righe', 'sum': 'Fatturato'}))
+    return report.sort_values('Fatturato', ascending=False).reset_index()
+
+
+#funzione per combinare i due dataframe 
+def merge_with_second_dataframe(main_dataframe, second_dataframe):
+    """
+    Unisce il DataFrame principale con il secondo DataFrame utilizzando la colonna 'Referente' come chiave.
+
+    Args:
+        main_dataframe (pd.DataFrame): Il DataFrame principale contenente la colonna 'Referente'.
+        second_dataframe (pd.DataFrame | DetailsIndex): Il secondo DataFrame contenente i dettagli delle referenze,
+            oppure il suo indice già costruito.
+
+    Returns:
+        pd.DataFrame: DataFrame aggiornato con le colonne 'Nome', 'Quantita in grammi' e 'Pezzi in un cartone' aggiunte.
+    """
+    try:
+        # Verifica se le colonne richieste esistono nel secondo DataFrame e ne costruisce l'indice
+        details_index = second_dataframe if isinstance(second_dataframe, DetailsIndex) else DetailsIndex(second_dataframe)
+        if details_index.duplicates:
+            print(f"Codici 'Referente' ripetuti nel catalogo (vale la prima riga): {details_index.duplicates}")
+
+        # Ricerca posizionale dei codici nel catalogo, al posto dell'unione completa dei due DataFrame
+        merged_dataframe, _ = details_index.enrich(main_dataframe)
+
+        return merged_dataframe
+
+    except KeyError as e:
+        print(f"Errore di colonna: {e}")
+        return main_dataframe
+
+    except Exception as e:
+        print(f"Errore durante l'unione dei DataFrame: {e}")
+        return main_dataframe
+
+
+#Normalizzazione dei tipi delle colonne, eseguita una sola volta al caricamento
+def _downcast_numeric(values):
+    """
+    Converte una colonna in int32 se contiene solo interi rappresentabili, altrimenti in float32.
+    """
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values, errors='coerce')
+    array = values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    if np.isfinite(array).all() and (array == np.round(array)).all() and np.abs(array).max(initial=0) < 2**31:
+        return pd.Series(array.astype(np.int32), index=values.index)
+    return pd.Series(array.astype(np.float32), index=values.index)
+
+
+def normalize_schema(dataframe):
+    """
+    Normalizza una sola volta i tipi delle colonne dopo il caricamento, così che i calcoli successivi
+    non debbano ripetere alcuna conversione.
+
+    'Cliente', 'Nome', 'Referente' e 'Mese' diventano categorie, le colonne numeriche int32 o float32
+    e 'Data' una data nativa (primo giorno del mese), se non lo è già.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame caricato (ed eventualmente unito al catalogo delle referenze).
+
+    Returns:
+        pd.DataFrame: DataFrame con i tipi normalizzati.
+    """
+    dataframe = dataframe.copy()
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in dataframe.columns and not isinstance(dataframe[col].dtype, pd.CategoricalDtype):
+            dataframe[col] = dataframe[col].astype('category')
+
+    for col in SCHEMA_NUMERIC_COLUMNS:
+        if col in dataframe.columns:
+            dataframe[col] = _downcast_numeric(dataframe[col])
+
+    # 'Data' è già una data per i file elaborati da `combine_month_year_to_date`; resta la conversione
+    # delle date salvate come stringhe mm/aaaa
+    if 'Data' in dataframe.columns and not pd.api.types.is_datetime64_any_dtype(dataframe['Data']):
+        dataframe['Data'] = pd.to_datetime(dataframe['Data'], format='%m/%Y', errors='coerce')
+
+    return dataframe
+
+
+def concat_normalized(dataframes, normalize=True):
+    """
+    Concatena DataFrame normalizzati con `normalize_schema` senza perdere le colonne categoriali:
+    le categorie dei diversi DataFrame vengono unite prima della concatenazione.
+
+    Args:
+        dataframes (list): DataFrame normalizzati, con le stesse colonne.
+        normalize (bool): Se False il risultato non viene normalizzato di nuovo, operazione che copia e converte
+            tutte le righe: vengono solo portate a float32 le colonne numeriche int32 in un DataFrame e float32
+            in un altro. Se le colonne dei DataFrame sono diverse il risultato viene comunque normalizzato.
+
+    Returns:
+        pd.DataFrame: DataFrame concatenato e normalizzato.
+    """
+    dataframes = [dataframe for dataframe in dataframes if dataframe is not None]
+    for col in CATEGORICAL_COLUMNS:
+        if all(col in dataframe.columns and isinstance(dataframe[col].dtype, pd.CategoricalDtype)
+               for dataframe in dataframes):
+            categories = dataframes[0][col].cat.categories
+            for dataframe in dataframes[1:]:
+                categories = categories.append(dataframe[col].cat.categories.difference(categories))
+            dataframes = [dataframe.assign(**{col: dataframe[col].cat.set_categories(categories)})
+                          for dataframe in dataframes]
+
+    if not normalize and all(dataframe.columns.equals(dataframes[0].columns) for dataframe in dataframes):
+        for col in SCHEMA_NUMERIC_COLUMNS:
+            if col in dataframes[0].columns and len({dataframe[col].dtype for dataframe in dataframes}) > 1:
+                dataframes = [dataframe.assign(**{col: dataframe[col].astype(np.float32)}) for dataframe in dataframes]
+        return pd.concat(dataframes, ignore_index=True)
+
+    return normalize_schema(pd.concat(dataframes, ignore_index=True))
+
+
+#Funzioni per il caricamento dei file, in sequenza o in parallelo
+def is_details_file(filename):
+    """
+    Indica se il file è il catalogo delle referenze.
+
+    Args:
+        filename (str): Nome del file caricato.
+
+    Returns:
+        bool: True se il file è `dettagli_referenze.xlsx`.
+    """
+    return filename.lower() == DETAILS_FILENAME
+
+
+def ingest_file(filename, source):
+    """
+    Legge una volta sola una cartella di lavoro e la elabora come catalogo o come file cliente.
+
+    Gli errori non vengono intercettati, così che il chiamante possa riportarli per ogni file.
+
+    Args:
+        filename (str): Nome del file caricato.
+        source (UploadedFile | str | bytes-like): Il file da leggere.
+
+    Returns:
+        pd.DataFrame: DataFrame elaborato.
+    """
+    with misura("lettura_file", file=filename):
+        if is_details_file(filename):
+            return _extract_details(read_details_workbook(source))
+        return _consolidate_excel_data(read_customer_workbook(source))
+
+
+def _to_column_buffers(dataframe):
+    """
+    Converte un DataFrame in buffer di colonne compatti da restituire al processo principale.
+
+    Le colonne numeriche vengono trasferite come byte grezzi, le altre come codici interi
+    e valori distinti (`pd.factorize`), evitando di serializzare un DataFrame intero.
+
+    Args:
+        dataframe (pd.DataFrame): Il DataFrame da convertire.
+
+    Returns:
+        tuple: Numero di righe e lista di colonne `(nome, tipo, dtype, dati, valori)`.
+    """
+    columns = []
+    for name in dataframe.columns:
+        values = dataframe[name]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            array = values.to_numpy()
+            columns.append((name, "numeric", array.dtype.str, array.tobytes(), None))
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            # Le categorie vengono trasferite tutte e nello stesso ordine, anche quelle non usate
+            codes = values.cat.codes.to_numpy()
+            columns.append((name, "codes", "category", codes.astype(np.int32).tobytes(), values.cat.categories))
+        else:
+            codes, uniques = pd.factorize(values)
+            columns.append((name, "codes", str(values.dtype), codes.astype(np.int32).tobytes(), uniques))
+    return len(dataframe), columns
+
+
+def _from_column_buffers(buffers):
+    """
+    Ricostruisce il DataFrame a partire dai buffer prodotti da `_to_column_buffers`.
+
+    Args:
+        buffers (tuple): Numero di righe e lista di colonne.
+
+    Returns:
+        pd.DataFrame: Il DataFrame ricostruito.
+    """
+    n_rows, columns = buffers
+    data = {}
+    for name, kind, dtype, raw, uniques in columns:
+        if kind == "numeric":
+            data[name] = np.frombuffer(bytearray(raw), dtype=np.dtype(dtype))
+        else:
+            # Il codice -1 di `pd.factorize` indica un valore mancante e torna NA (NaN, NaT)
+            values = pd.Categorical.from_codes(np.frombuffer(raw, dtype=np.int32), categories=uniques)
+            data[name] = pd.Series(values).astype(dtype)
+    return pd.DataFrame(data, index=pd.RangeIndex(n_rows))
+
+
+def _ingest_file_worker(filename, content):
+    """
+    Funzione eseguita nei processi del pool: elabora un file e restituisce i buffer di colonne.
+
+    Args:
+        filename (str): Nome del file caricato.
+        content (bytes): Contenuto del file.
+
+    Returns:
+        tuple: Buffer di colonne, oppure `None` e il messaggio di errore.
+    """
+    try:
+        dataframe = ingest_file(filename, io.BytesIO(content))
+        return _to_column_buffers(dataframe), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def iter_ingested_files(uploaded_files, n_processes=1, cache=None):
+    """
+    Elabora i file caricati e restituisce ciascun risultato appena è pronto.
+
+    I file già presenti nella cache vengono restituiti per primi; tra i file da leggere il catalogo
+    delle referenze viene elaborato prima dei file cliente, così che i risultati parziali possano già
+    essere uniti al catalogo. Se il chiamante smette di iterare, i file non ancora iniziati non vengono elaborati.
+
+    Args:
+        uploaded_files (list): Lista di file caricati dall'utente.
+        n_processes (int): Numero di processi da usare; con 1 i file vengono elaborati in sequenza.
+        cache (ParquetCache): Cache dei file già elaborati; se presente, solo i file nuovi vengono letti.
+
+    Yields:
+        tuple: (posizione del file in `uploaded_files`, DataFrame elaborato o None, messaggio di errore o None).
+    """
+    filenames = [uploaded_file.name for uploaded_file in uploaded_files]
+
+    # Recupera dalla cache i file già elaborati; gli altri restano da leggere
+    keys = [None] * len(uploaded_files)
+    pending = []
+    for position, (filename, uploaded_file) in enumerate(zip(filenames, uploaded_files)):
+        if cache is not None:
+            namespace = f"{'details' if is_details_file(filename) else 'cliente'}-v{INGESTION_VERSION}"
+            keys[position] = cache.key(uploaded_file.getvalue(), namespace)
+            result = cache.get(keys[position])
+            if result is not None:
+                yield position, result, None
+                continue
+        pending.append(position)
+    pending.sort(key=lambda position: not is_details_file(filenames[position]))
+
+    def completed(position, result, error):
+        if cache is not None and result is not None:
+            cache.put(keys[position], result)
+        return position, result, error
+
+    if n_processes > 1 and len(pending) > 1:
+        # "spawn" evita di duplicare lo stato del server Streamlit nei processi figli
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=min(n_processes, len(pending)), mp_context=context)
+        try:
+            futures = {
+                executor.submit(_ingest_file_worker, filenames[position], uploaded_files[position].getvalue()): position
+                for position in pending
+            }
+            for future in as_completed(futures):
+                buffers, error = future.result()
+                result = None if error is not None else _from_column_buffers(buffers)
+                yield completed(futures[future], result, error)
+        finally:
+            # Se l'iterazione viene interrotta, i file non ancora iniziati vengono annullati
+            executor.shutdown(wait=True, cancel_futures=True)
+    else:
+        for position in pending:
+            try:
+                result, error = ingest_file(filenames[position], uploaded_files[position]), None
+            except Exception as e:
+                result, error = None, f"{type(e).__name__}: {e}"
+            yield completed(position, result, error)
+
+
+def combine_ingested_files(filenames, results):
+    """
+    Unisce i risultati dei file elaborati, nell'ordine dei file, in vendite e catalogo.
+
+    Args:
+        filenames (list): Nomi dei file caricati.
+        results (list): DataFrame elaborato per ciascun file, oppure None.
+
+    Returns:
+        tuple: DataFrame principale (o None) e DataFrame dei dettagli (o None).
+    """
+    dataframes = []
+    details_dataframe = None
+    for filename, result in zip(filenames, results):
+        if result is None:
+            continue
+        if is_details_file(filename):
+            details_dataframe = result
+        else:
+            dataframes.append(result)
+
+    main_dataframe = pd.concat(dataframes, ignore_index=True) if dataframes else None
+
+    return main_dataframe, details_dataframe
+
+
+def ingest_files(uploaded_files, n_processes=1, cache=None):
+    """
+    Elabora i file caricati, in sequenza oppure distribuendoli su un pool di processi.
+
+    I risultati vengono sempre uniti nell'ordine di caricamento dei file, indipendentemente
+    dall'ordine in cui i processi terminano. Un file che non può essere elaborato non interrompe
+    il caricamento degli altri: il suo errore viene riportato in `errors`.
+
+    Args:
+        uploaded_files (list): Lista di file caricati dall'utente.
+        n_processes (int): Numero di processi da usare; con 1 i file vengono elaborati in sequenza.
+        cache (ParquetCache): Cache dei file già elaborati; se presente, solo i file nuovi vengono letti.
+
+    Returns:
+        tuple: DataFrame principale (o None), DataFrame dei dettagli (o None) e dizionario
+            `{nome file: messaggio di errore}`.
+    """
+    filenames = [uploaded_file.name for uploaded_file in uploaded_files]
+    results = [None] * len(uploaded_files)
+    messages = [None] * len(uploaded_files)
+
+    for position, result, error in iter_ingested_files(uploaded_files, n_processes, cache):
+        results[position], messages[position] = result, error
+
+    # Gli errori sono riportati nell'ordine di caricamento dei file
+    errors = {filename: error for filename, error in zip(filenames, messages) if error is not None}
+    main_dataframe, details_dataframe = combine_ingested_files(filenames, results)
+
+    return main_dataframe, details_dataframe, errors
@@ -0,0 +1,533 @@
+"""
+Calcolo dei KPI delle promozioni.
+
+Il calcolo è diviso in più parti: le colonne derivate per riga vengono ridotte a un insieme di
+somme additive (`aggrega_KPI`), dalle quali `calcolo_KPI_base` ricava i KPI che dipendono solo dai
+filtri e `calcolo_KPI_scenario` quelli che dipendono da sconto e incremento.
+Le somme additive permettono di precalcolare un cubo per (Cliente, Nome, grammatura, mese)
+e di rispondere a qualsiasi combinazione di filtri sommando poche celle.
+"""
+import numpy as np
+import pandas as pd
+
+from prestazioni import misura
+
+# Colonne convertite in valori numerici prima del calcolo
+COLONNE_NUMERICHE_KPI = [
+    'Pezzi in un cartone', 'Cartoni_Venduti', 'Cartoni_Venduti_Prec',
+    'Fatturato', 'Fatturato_Anno_Prec', 'Ricetta', 'Listino'
+]
+
+# Colonne sommate negli aggregati: totali e numeratori delle medie per riga
+COLONNE_AGGREGATE = [
+    'Fatturato', 'Fatturato_Anno_Prec', 'Cartoni_Venduti', 'Cartoni_Venduti_Prec',
+    'pezzi_venduti', 'pezzi_venduti_ap', 'costo_totale', 'margine_totale', 'margine_totale_ap',
+    'margine_pezzo', 'margine_pezzo_ap', 'margine_cartone', 'margine_cartone_ap',
+    'Listino', 'Sconto secondo livello', 'Sconto primo livello'
+]
+
+# Nomi di tutti i KPI disponibili in `RisultatoKPI`
+NOMI_KPI = (
+    'fatturato', 'margine_pezzo', 'margine_pezzo_ap', 'margine_cartone', 'margine_cartone_ap', 'margine_totale',
+    'margine_totale_ap', 'cartoni_venduti', 'cartoni_venduti_ap', 'pezzi_venduti', 'pezzi_venduti_ap', 'prezzo_cartone',
+    'prezzo_pezzo', 'costo_cartone', 'costo_pezzo', 'costo_totale', 'prezzo_listino', 'sconto_applicato', 'sconto_secondo_livello',
+    'prezzo_cartone_scontato', 'prezzo_pezzo_scontato', 'fatturato_scontato', 'sconto_prezzo_listino',
+    'margine_pezzo_scontato', 'margine_cartone_scontato', 'margine_totale_scontato', 'fatturato_con_sconto_incremento',
+    'cartoni_venduti_con_incremento', 'margine_totale_scontato_con_incremento', 'fatturato_sconto_secondo_livello',
+    'margine_totale_con_sconto_secondo_livello', 'fatturato_con_sconto_incremento_e_sconto_secondo_livello',
+    'margine_totale_scontato_con_incremento_e_sconto_secondo_livello', 'sconto_primo_livello', 'fatturato_ap_eliminata_promo',
+    'margine_ap_eliminata_promo', 'fatturato_ap_eliminata_promo_con_sconto_secondo_liv',
+    'margine_ap_eliminata_promo_con_sconto_secondo_liv'
+)
+
+# Valori di sconto e incremento della griglia degli scenari (gli stessi dei cursori della dashboard)
+SCONTI_GRIGLIA = np.arange(-70, 71)
+INCREMENTI_GRIGLIA = np.arange(0, 201)
+
+# Dimensioni del cubo dei KPI
+DIMENSIONI_CUBO = ['Cliente', 'Nome', 'Quantita in grammi', 'Data_datetime']
+
+# Colonne del DataFrame lette per costruire il cubo: le altre non vengono toccate
+COLONNE_SORGENTE_CUBO = (['Cliente', 'Nome', 'Quantita in grammi', 'Data'] + COLONNE_NUMERICHE_KPI
+                         + ['Sconto secondo livello', 'Sconto primo livello'])
+
+
+#Funzione per il calcolo delle colonne derivate per riga
+def calcola_colonne_KPI(dataframe):
+    """
+    Converte le colonne numeriche e aggiunge le colonne derivate per riga usate dai KPI.
+
+    Args:
+        dataframe (pd.DataFrame): Il DataFrame contenente i dati.
+
+    Returns:
+        pd.DataFrame: Copia del DataFrame con le colonne derivate.
+    """
+    # Creare una copia esplicita del DataFrame
+    dataframe = dataframe.copy()
+
+    # Conversione delle colonne necessarie in valori numerici (solo se non già normalizzate al caricamento);
+    # i calcoli avvengono in float64 anche se le colonne sono salvate a 32 bit
+    for col in COLONNE_NUMERICHE_KPI:
+        if col in dataframe.columns:
+            valori = dataframe[col]
+            if not pd.api.types.is_numeric_dtype(valori):
+                valori = pd.to_numeric(valori, errors='coerce')
+            dataframe[col] = valori.astype(np.float64).fillna(0)
+
+    # Modifiche al DataFrame usando `.loc`
+    dataframe.loc[:, 'pezzi_venduti'] = dataframe['Pezzi in un cartone'] * dataframe['Cartoni_Venduti']
+    dataframe.loc[:, 'pezzi_venduti_ap'] = dataframe['Pezzi in un cartone'] * dataframe['Cartoni_Venduti_Prec']
+
+    dataframe.loc[:, 'prezzo_pezzo_venduto'] = dataframe['Fatturato'] / dataframe['pezzi_venduti'].replace(0, 1)
+    dataframe.loc[:, 'prezzo_pezzo_venduto_ap'] = dataframe['Fatturato_Anno_Prec'] / dataframe['pezzi_venduti_ap'].replace(0, 1)
+
+    dataframe.loc[:, 'prezzo_cartone_venduto'] = dataframe['Fatturato'] / dataframe['Cartoni_Venduti'].replace(0, 1)
+    dataframe.loc[:, 'prezzo_cartone_venduto_ap'] = dataframe['Fatturato_Anno_Prec'] / dataframe['Cartoni_Venduti_Prec'].replace(0, 1)
+
+    dataframe.loc[:, 'costo_cartone'] = dataframe['Pezzi in un cartone'] * dataframe['Ricetta']
+    dataframe.loc[:, 'costo_totale'] = dataframe['pezzi_venduti'] * dataframe['Ricetta']
+
+    dataframe.loc[:, 'margine_pezzo'] = dataframe['prezzo_pezzo_venduto'] - dataframe['Ricetta']
+    dataframe.loc[:, 'margine_cartone'] = dataframe['prezzo_cartone_venduto'] - dataframe['costo_cartone']
+    dataframe.loc[:, 'margine_totale'] = dataframe['Fatturato'] - dataframe['costo_totale']
+
+    dataframe.loc[:, 'margine_pezzo_ap'] = dataframe['prezzo_pezzo_venduto_ap'] - dataframe['Ricetta']
+    dataframe.loc[:, 'margine_cartone_ap'] = dataframe['prezzo_cartone_venduto_ap'] - dataframe['costo_cartone']
+    dataframe.loc[:, 'margine_totale_ap'] = dataframe['Fatturato_Anno_Prec'] - dataframe['costo_totale']
+
+    return dataframe
+
+
+def aggrega_KPI(dataframe):
+    """
+    Riduce le colonne derivate per riga alle somme additive da cui si ricavano i KPI.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame restituito da `calcola_colonne_KPI` (o righe del cubo dei KPI).
+
+    Returns:
+        pd.Series: Somme delle `COLONNE_AGGREGATE` e numero di righe (`righe`).
+    """
+    aggregati = dataframe[COLONNE_AGGREGATE].sum()
+    aggregati['righe'] = dataframe['righe'].sum() if 'righe' in dataframe.columns else len(dataframe)
+    return aggregati.astype(float)
+
+
+#Formule dei KPI: ogni KPI è calcolato a partire dalle somme o da altri KPI, solo quando viene letto
+_FORMULE_BASE = {
+    # Calcolo dei risultati aggregati (le medie sono calcolate sulle righe)
+    'fatturato': lambda k: k.aggregati['Fatturato'],
+    'margine_pezzo': lambda k: k.aggregati['margine_pezzo'] / k.aggregati['righe'],
+    'margine_pezzo_ap': lambda k: k.aggregati['margine_pezzo_ap'] / k.aggregati['righe'],
+    'margine_cartone': lambda k: k.aggregati['margine_cartone'] / k.aggregati['righe'],
+    'margine_cartone_ap': lambda k: k.aggregati['margine_cartone_ap'] / k.aggregati['righe'],
+    'margine_totale': lambda k: k.aggregati['margine_totale'],
+    'margine_totale_ap': lambda k: k.aggregati['margine_totale_ap'],
+    'cartoni_venduti': lambda k: k.aggregati['Cartoni_Venduti'],
+    'cartoni_venduti_ap': lambda k: k.aggregati['Cartoni_Venduti_Prec'],
+    'pezzi_venduti': lambda k: k.aggregati['pezzi_venduti'],
+    'pezzi_venduti_ap': lambda k: k.aggregati['pezzi_venduti_ap'],
+    'costo_totale': lambda k: k.aggregati['costo_totale'],
+    'prezzo_listino': lambda k: k.aggregati['Listino'] / k.aggregati['righe'],
+    'sconto_secondo_livello': lambda k: k.aggregati['Sconto secondo livello'] / k.aggregati['righe'],
+    'sconto_primo_livello': lambda k: k.aggregati['Sconto primo livello'] / k.aggregati['righe'],
+
+    # Prezzi e costi medi sul totale venduto e sconto applicato l'anno precedente
+    'prezzo_pezzo': lambda k: k.fatturato / k.pezzi_venduti,
+    'prezzo_cartone': lambda k: k.fatturato / k.cartoni_venduti,
+    'costo_pezzo': lambda k: k.costo_totale / k.pezzi_venduti,
+    'costo_cartone': lambda k: k.costo_totale / k.cartoni_venduti,
+    'sconto_applicato': lambda k: (1 - k.prezzo_pezzo / k.prezzo_listino) * 100,   #sconto di primo livello
+
+    #KPI A.p. senza promozioni
+    'fatturato_ap_eliminata_promo': lambda k: (100 - k.sconto_primo_livello) / 100 * (k.pezzi_venduti * k.prezzo_listino),
+    'margine_ap_eliminata_promo': lambda k: k.fatturato_ap_eliminata_promo - k.costo_totale,
+
+    #KPI con sconto di secondo livello
+    'fatturato_sconto_secondo_livello': lambda k: k.fatturato * (100 - k.sconto_secondo_livello) / 100,
+    'margine_totale_con_sconto_secondo_livello': lambda k: k.fatturato_sconto_secondo_livello - k.costo_totale,
+    'fatturato_ap_eliminata_promo_con_sconto_secondo_liv': lambda k: k.fatturato_ap_eliminata_promo * (100 - k.sconto_secondo_livello) / 100,
+    'margine_ap_eliminata_promo_con_sconto_secondo_liv': lambda k: k.fatturato_ap_eliminata_promo_con_sconto_secondo_liv - k.costo_totale,
+}
+
+_FORMULE_SCENARIO = {
+    # Calcolo sconto e margini con sconto e incremento del numero di cartoni
+    'prezzo_cartone_scontato': lambda k: k.prezzo_cartone * (100 - k.sconto) / 100,
+    'prezzo_pezzo_scontato': lambda k: k.prezzo_pezzo * (100 - k.sconto) / 100,   #prezzo scontato con lo sconto inserito nella dashboard
+    'fatturato_scontato': lambda k: k.fatturato * (100 - k.sconto) / 100,
+    'sconto_prezzo_listino': lambda k: (1 - k.prezzo_pezzo_scontato / k.prezzo_listino) * 100,   #sconto finale di primo livello sul fatturato
+    'margine_pezzo_scontato': lambda k: k.prezzo_pezzo_scontato - k.costo_pezzo,
+    'margine_cartone_scontato': lambda k: k.prezzo_cartone_scontato - k.costo_cartone,
+    'margine_totale_scontato': lambda k: k.fatturato_scontato - k.costo_totale,
+    'cartoni_venduti_con_incremento': lambda k: k.cartoni_venduti * (100 + k.incremento) / 100,
+    'fatturato_con_sconto_incremento': lambda k: k.cartoni_venduti_con_incremento * k.prezzo_cartone_scontato,
+    'margine_totale_scontato_con_incremento': lambda k: k.fatturato_con_sconto_incremento - (k.costo_cartone * k.cartoni_venduti_con_incremento),
+
+    #KPI con sconto di secondo livello
+    'fatturato_con_sconto_incremento_e_sconto_secondo_livello': lambda k: k.fatturato_con_sconto_incremento * (100 - k.sconto_secondo_livello) / 100,
+    'margine_totale_scontato_con_incremento_e_sconto_secondo_livello': lambda k: k.fatturato_con_sconto_incremento_e_sconto_secondo_livello - (k.costo_cartone * k.cartoni_venduti_con_incremento),
+}
+
+# KPI che dipendono solo dai filtri e KPI che dipendono anche da sconto e incremento
+NOMI_KPI_BASE = tuple(_FORMULE_BASE)
+NOMI_KPI_SCENARIO = tuple(_FORMULE_SCENARIO)
+
+
+class _KPIPigri:
+    """
+    Base comune dei risultati: ogni KPI è uno slot che viene calcolato dalla sua formula
+    alla prima lettura e poi riutilizzato.
+    """
+
+    __slots__ = ()
+    _formule = {}
+
+    def __getattr__(self, nome):
+        # Chiamato solo se lo slot non è ancora stato valorizzato
+        formula = type(self)._formule.get(nome)
+        if formula is None:
+            raise AttributeError(nome)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            valore = formula(self)
+        setattr(self, nome, valore)
+        return valore
+
+    def valori(self, nomi=None):
+        """
+        Calcola e restituisce solo i KPI richiesti.
+
+        Args:
+            nomi (list): Nomi dei KPI da calcolare (per default tutti quelli disponibili).
+
+        Returns:
+            dict: `{nome KPI: valore}`.
+        """
+        return {nome: getattr(self, nome) for nome in (self._nomi if nomi is None else nomi)}
+
+
+class KPIBase(_KPIPigri):
+    """
+    KPI che dipendono solo dalla selezione dei filtri, calcolati dalle somme di `aggrega_KPI`.
+
+    Può essere memorizzato per selezione: lo spostamento dei cursori richiede solo un nuovo `RisultatoKPI`.
+
+    Args:
+        aggregati (pd.Series): Somme additive delle colonne dei KPI.
+    """
+
+    __slots__ = ('aggregati',) + NOMI_KPI_BASE
+    _formule = _FORMULE_BASE
+    _nomi = NOMI_KPI_BASE
+
+    def __init__(self, aggregati):
+        self.aggregati = aggregati
+
+
+class RisultatoKPI(_KPIPigri):
+    """
+    Risultato del calcolo dei KPI per uno scenario di sconto e incremento.
+
+    I KPI di base sono letti dal `KPIBase` (e calcolati lì una sola volta), quelli dello scenario
+    sono calcolati alla prima lettura. Sconto e incremento possono essere anche array NumPy.
+
+    Args:
+        base (KPIBase): KPI di base della selezione.
+        sconto (float): Percentuale di sconto da applicare.
+        incremento (float): Percentuale di incremento dei cartoni venduti.
+    """
+
+    __slots__ = ('base', 'sconto', 'incremento') + NOMI_KPI_SCENARIO
+    _formule = _FORMULE_SCENARIO
+    _nomi = NOMI_KPI
+
+    def __init__(self, base, sconto, incremento):
+        self.base = base
+        self.sconto = sconto
+        self.incremento = incremento
+
+    def __getattr__(self, nome):
+        if nome in _FORMULE_BASE:
+            return getattr(self.base, nome)
+        return super().__getattr__(nome)
+
+
+#Funzioni per il calcolo dei KPI, in due fasi
+def calcolo_KPI_base(aggregati):
+    """
+    Prima fase del calcolo: prepara i KPI che non dipendono da sconto e incremento.
+
+    Args:
+        aggregati (pd.Series): Somme additive delle colonne dei KPI (`aggrega_KPI`).
+
+    Returns:
+        KPIBase: KPI di base, calcolati alla prima lettura.
+    """
+    return KPIBase(aggregati)
+
+
+def calcolo_KPI_scenario(base, sconto, incremento):
+    """
+    Seconda fase del calcolo: prepara i KPI della promozione a partire dai KPI di base, senza accedere ai dati.
+
+    Args:
+        base (KPIBase): KPI di base restituiti da `calcolo_KPI_base`.
+        sconto (float): Percentuale di sconto da applicare.
+        incremento (float): Percentuale di incremento dei cartoni venduti.
+
+    Returns:
+        RisultatoKPI: KPI dello scenario, calcolati alla prima lettura.
+    """
+    return RisultatoKPI(base, sconto, incremento)
+
+
+def calcolo_KPI_da_aggregati(aggregati, sconto, incremento):
+    """
+    Calcola i KPI principali a partire dalle somme restituite da `aggrega_KPI`.
+
+    Args:
+        aggregati (pd.Series): Somme additive delle colonne dei KPI.
+        sconto (float): Percentuale di sconto da applicare.
+        incremento (float): Percentuale di incremento dei cartoni venduti.
+
+    Returns:
+        RisultatoKPI: KPI calcolati alla prima lettura.
+    """
+    return calcolo_KPI_scenario(calcolo_KPI_base(aggregati), sconto, incremento)
+
+
+@misura("calcolo_KPI")
+def calcolo_KPI(dataframe, sconto, incremento):
+    """
+    Calcola i KPI principali e restituisce i risultati aggregati.
+
+    Args:
+        dataframe (pd.DataFrame): Il DataFrame contenente i dati.
+        sconto (float): Percentuale di sconto da applicare.
+        incremento (float): Percentuale di incremento dei cartoni venduti.
+
+    Returns:
+        RisultatoKPI: KPI calcolati alla prima lettura.
+    """
+    return calcolo_KPI_da_aggregati(aggrega_KPI(calcola_colonne_KPI(dataframe)), sconto, incremento)
+
+
+def calcolo_KPI_per_gruppi(dataframe, chiavi, sconto=0, incremento=0, nomi=None):
+    """
+    Calcola i KPI di ogni gruppo con un'unica operazione vettoriale, invece di una chiamata per gruppo.
+
+    Le somme di tutti i gruppi sono calcolate con un solo groupby; le formule dei KPI sono poi applicate
+    alle colonne delle somme, così che ogni KPI sia calcolato per tutti i gruppi insieme.
+
+    Args:
+        dataframe (pd.DataFrame): Righe di vendita oppure celle del cubo restituito da `costruisci_cubo_KPI`.
+        chiavi (str | list): Colonne per cui raggruppare (ad esempio 'Cliente' oppure ['Cliente', 'Nome']).
+        sconto (float): Percentuale di sconto da applicare a ogni gruppo.
+        incremento (float): Percentuale di incremento dei cartoni venduti di ogni gruppo.
+        nomi (list): KPI da calcolare (per default tutti i `NOMI_KPI`).
+
+    Returns:
+        pd.DataFrame: Una riga per gruppo, indicizzata dalle chiavi, con una colonna per KPI.
+    """
+    chiavi = [chiavi] if isinstance(chiavi, str) else list(chiavi)
+    if 'righe' not in dataframe.columns:
+        # Righe di vendita: le colonne derivate sono calcolate una volta per tutti i gruppi
+        colonne = [col for col in COLONNE_SORGENTE_CUBO if col not in chiavi and col in dataframe.columns]
+        dataframe = calcola_colonne_KPI(dataframe[chiavi + colonne])
+        dataframe['righe'] = 1
+
+    aggregati = dataframe.groupby(chiavi, observed=True)[COLONNE_AGGREGATE + ['righe']].sum().astype(float)
+    kpi = RisultatoKPI(KPIBase(aggregati), sconto, incremento)
+    return pd.DataFrame(kpi.valori(NOMI_KPI if nomi is None else nomi), index=aggregati.index)
+
+
+#Funzioni per la griglia degli scenari
+def calcolo_griglia_scenari(base, sconti=SCONTI_GRIGLIA, incrementi=INCREMENTI_GRIGLIA):
+    """
+    Calcola tutti i KPI per ogni combinazione di sconto e incremento con un'unica operazione vettoriale.
+
+    Le formule dei KPI sono applicate direttamente ad array di sconti
+    (una riga per sconto) e di incrementi (una colonna per incremento), sfruttando il broadcasting di NumPy.
+
+    Args:
+        base (KPIBase): KPI di base restituiti da `calcolo_KPI_base`.
+        sconti (array-like): Percentuali di sconto da valutare.
+        incrementi (array-like): Percentuali di incremento dei cartoni venduti da valutare.
+
+    Returns:
+        dict: `{nome KPI: array di forma (len(sconti), len(incrementi))}`.
+    """
+    sconti = np.asarray(sconti, dtype=float)[:, np.newaxis]
+    incrementi = np.asarray(incrementi, dtype=float)[np.newaxis, :]
+    forma = (sconti.shape[0], incrementi.shape[1])
+
+    valori = calcolo_KPI_scenario(base, sconti, incrementi).valori()
+
+    return {nome: np.broadcast_to(valore, forma) for nome, valore in valori.items()}
+
+
+def curva_pareggio(griglia, incrementi=INCREMENTI_GRIGLIA,
+                   kpi='margine_totale_scontato_con_incremento_e_sconto_secondo_livello',
+                   riferimento='margine_totale_con_sconto_secondo_livello'):
+    """
+    Trova, per ogni sconto della griglia, l'incremento minimo che riporta il margine al livello di riferimento.
+
+    Args:
+        griglia (dict): Griglia restituita da `calcolo_griglia_scenari`.
+        incrementi (array-like): Incrementi usati per calcolare la griglia.
+        kpi (str): KPI della promozione da confrontare.
+        riferimento (str): KPI di riferimento (per default il margine dell'anno precedente con sconto di secondo livello).
+
+    Returns:
+        np.ndarray: Incremento di pareggio per ogni sconto, NaN se non raggiungibile nella griglia.
+    """
+    raggiunto = griglia[kpi] >= griglia[riferimento]
+    primo = raggiunto.argmax(axis=1)
+    return np.where(raggiunto.any(axis=1), np.asarray(incrementi, dtype=float)[primo], np.nan)
+
+
+#Funzioni per il cubo dei KPI
+def classifica_clienti(cubo, indice, nome, grammatura, data_inizio, data_fine, sconto, incremento, senza_promo_ap=False):
+    """
+    Calcola, con un'unica passata su tutti i clienti, i margini dell'anno precedente e della promozione
+    per la selezione corrente dei filtri (escluso il filtro sul cliente).
+
+    Args:
+        cubo (pd.DataFrame): Cubo dei KPI della sessione.
+        indice (IndiceFiltri): Indice delle celle del cubo.
+        nome (str): Nome del prodotto selezionato, oppure "Tutti".
+        grammatura: Grammatura selezionata, oppure "Tutti".
+        data_inizio (pd.Timestamp): Data di inizio selezionata.
+        data_fine (pd.Timestamp): Data di fine selezionata.
+        sconto (float): Percentuale di sconto della promozione.
+        incremento (float): Percentuale di incremento dei cartoni venduti.
+        senza_promo_ap (bool): Se True il margine dell'anno precedente è calcolato eliminando le promozioni.
+
+    Returns:
+        pd.DataFrame: Una riga per cliente, in ordine di margine della promozione decrescente.
+    """
+    margine_ap = ('margine_ap_eliminata_promo_con_sconto_secondo_liv' if senza_promo_ap
+                  else 'margine_totale_con_sconto_secondo_livello')
+    margine_promo = 'margine_totale_scontato_con_incremento_e_sconto_secondo_livello'
+
+    posizioni = indice.seleziona({'Nome': nome, 'Quantita in grammi': grammatura}, data_inizio, data_fine)
+    kpi = calcolo_KPI_per_gruppi(cubo.iloc[posizioni], 'Cliente', sconto, incremento,
+                                 nomi=['fatturato_con_sconto_incremento_e_sconto_secondo_livello', margine_ap, margine_promo])
+
+    classifica = pd.DataFrame({
+        'Cliente': kpi.index.astype(str),
+        'Fatturato promozione': kpi['fatturato_con_sconto_incremento_e_sconto_secondo_livello'].to_numpy(),
+        'Margine A.p.': kpi[margine_ap].to_numpy(),
+        'Margine promozione': kpi[margine_promo].to_numpy(),
+    })
+    classifica['Differenza'] = classifica['Margine promozione'] - classifica['Margine A.p.']
+    return classifica.sort_values('Margine promozione', ascending=False, ignore_index=True)
+
+
+def costruisci_cubo_KPI(dataframe):
+    """
+    Precalcola le somme additive dei KPI per ogni combinazione di Cliente, Nome, grammatura e mese.
+
+    Il cubo viene costruito una sola volta dopo il caricamento; i filtri della dashboard
+    lavorano poi sulle sue celle invece che sulle righe del DataFrame.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame unito con il catalogo delle referenze.
+
+    Returns:
+        pd.DataFrame: Una riga per cella con le `DIMENSIONI_CUBO`, le `COLONNE_AGGREGATE` e `righe`.
+    """
+    dataframe = calcola_colonne_KPI(dataframe[COLONNE_SORGENTE_CUBO])
+    if pd.api.types.is_datetime64_any_dtype(dataframe['Data']):
+        dataframe['Data_datetime'] = dataframe['Data']
+    else:
+        dataframe['Data_datetime'] = pd.to_datetime(dataframe['Data'], format='%m/%Y', errors='coerce')
+    dataframe['righe'] = 1
+
+    cubo = dataframe.groupby(DIMENSIONI_CUBO, observed=True, dropna=False, sort=False)[COLONNE_AGGREGATE + ['righe']].sum()
+    return cubo.reset_index()
+
+
+def aggiorna_cubo_KPI(cubo, righe_rimosse=None, righe_nuove=None, posizioni=False):
+    """
+    Aggiorna il cubo togliendo le somme delle righe rimosse e aggiungendo quelle delle righe nuove.
+
+    Le somme del cubo sono additive: le celle non interessate dalle righe modificate non vengono ricalcolate
+    e il costo dipende dalle righe modificate, non dallo storico. Le celle rimaste restano nel loro ordine,
+    seguite dalle celle nuove.
+
+    Args:
+        cubo (pd.DataFrame): Cubo restituito da `costruisci_cubo_KPI`, oppure None.
+        righe_rimosse (pd.DataFrame): Righe già presenti nel cubo da togliere, oppure None.
+        righe_nuove (pd.DataFrame): Righe da aggiungere, oppure None.
+        posizioni (bool): Se True restituisce anche la posizione di ogni cella del cubo precedente
+            nel cubo aggiornato (-1 se eliminata), da passare a `IndiceFiltri.aggiorna`.
+
+    Returns:
+        pd.DataFrame: Il cubo aggiornato; con `posizioni` la tupla (cubo aggiornato, posizioni).
+    """
+    colonne = COLONNE_AGGREGATE + ['righe']
+    n_precedenti = 0 if cubo is None else len(cubo)
+    parti = [] if cubo is None else [cubo]
+    if righe_rimosse is not None and len(righe_rimosse):
+        rimosse = costruisci_cubo_KPI(righe_rimosse)
+        rimosse[colonne] = -rimosse[colonne]
+        parti.append(rimosse)
+    if righe_nuove is not None and len(righe_nuove):
+        parti.append(costruisci_cubo_KPI(righe_nuove))
+    if len(parti) <= 1:
+        cubo = parti[0] if parti else cubo
+        return (cubo, np.arange(n_precedenti)) if posizioni else cubo
+
+    # Senza ordinamento i gruppi seguono la prima comparsa: le celle del cubo precedente restano le prime
+    cubo = pd.concat(parti, ignore_index=True)
+    cubo = cubo.groupby(DIMENSIONI_CUBO, observed=True, dropna=False, sort=False)[colonne].sum().reset_index()
+
+    # Le celle senza più righe vengono eliminate; le dimensioni testuali tornano categoriali
+    tenute = cubo['righe'].to_numpy() > 0
+    cubo = cubo[tenute].reset_index(drop=True)
+    for col in ['Cliente', 'Nome']:
+        cubo[col] = cubo[col].astype('category')
+    if not posizioni:
+        return cubo
+
+    nuove_posizioni = np.cumsum(tenute) - 1
+    nuove_posizioni[~tenute] = -1
+    return cubo, nuove_posizioni[:n_precedenti]
+
+
+def interroga_cubo_KPI(cubo, cliente="Tutti", nome="Tutti", grammatura="Tutti", data_inizio=None, data_fine=None,
+                       indice=None):
+    """
+    Somma le celle del cubo che rispettano i filtri della dashboard.
+
+    Args:
+        cubo (pd.DataFrame): Cubo restituito da `costruisci_cubo_KPI`.
+        cliente (str): Cliente selezionato, oppure "Tutti".
+        nome (str): Nome del prodotto selezionato, oppure "Tutti".
+        grammatura: Grammatura selezionata, oppure "Tutti".
+        data_inizio (pd.Timestamp): Primo mese incluso (nessun limite se None).
+        data_fine (pd.Timestamp): Ultimo giorno incluso (nessun limite se None).
+        indice (IndiceFiltri): Indice delle celle del cubo; se presente le celle vengono selezionate
+            per posizione invece che confrontando ogni colonna.
+
+    Returns:
+        pd.Series: Somme additive da passare a `calcolo_KPI_da_aggregati`.
+    """
+    if indice is not None:
+        filtri = {'Cliente': cliente, 'Nome': nome, 'Quantita in grammi': grammatura}
+        return aggrega_KPI(cubo.iloc[indice.seleziona(filtri, data_inizio, data_fine)])
+
+    maschera = pd.Series(True, index=cubo.index)
+    if cliente != "Tutti":
+        maschera &= cubo['Cliente'] == cliente
+    if nome != "Tutti":
+        maschera &= cubo['Nome'] == nome
+    if grammatura != "Tutti":
+        maschera &= cubo['Quantita in grammi'] == grammatura
+    if data_inizio is not None:
+        maschera &= cubo['Data_datetime'] >= data_inizio
+    if data_fine is not None:
+        maschera &= cubo['Data_datetime'] <= data_fine
+
+    return aggrega_KPI(cubo[maschera])
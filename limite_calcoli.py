@@ -0,0 +1,76 @@
+"""
+Limite ai calcoli pesanti eseguiti contemporaneamente da tutte le sessioni del server.
+
+Con molti utenti che modificano gli scenari, i calcoli in parallelo si contendono i processori
+e il tempo di risposta di ognuno cresce con il numero di sessioni. Il limite mette in coda i calcoli oltre
+il numero di processori e, mentre attendono, verifica se sono ancora necessari: un calcolo superato da una
+richiesta più recente della stessa sessione viene annullato prima di iniziare.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+# Intervallo (in secondi) tra due verifiche di un calcolo in attesa
+INTERVALLO_VERIFICA = 0.05
+
+
+class LimiteCalcoli:
+    """
+    Semaforo condiviso con verifica periodica dell'annullamento dei calcoli in attesa.
+
+    Args:
+        max_calcoli (int): Numero massimo di calcoli contemporanei (predefinito: numero di processori).
+        intervallo (float): Secondi tra due verifiche di un calcolo in attesa.
+    """
+
+    def __init__(self, max_calcoli=None, intervallo=INTERVALLO_VERIFICA):
+        self.max_calcoli = max_calcoli or os.cpu_count() or 1
+        self.intervallo = intervallo
+        self._semaforo = threading.BoundedSemaphore(self.max_calcoli)
+        self._lock = threading.Lock()
+        self.in_corso = 0
+        self.in_attesa = 0
+        self.annullati = 0
+
+    @contextmanager
+    def calcolo(self, verifica=None):
+        """
+        Esegue il blocco quando c'è un posto libero tra i calcoli contemporanei.
+
+        Args:
+            verifica (callable): Funzione senza argomenti chiamata prima di iniziare e durante l'attesa;
+                solleva un'eccezione se il calcolo non è più necessario, e l'eccezione annulla il calcolo.
+        """
+        with self._lock:
+            self.in_attesa += 1
+        try:
+            if verifica is not None:
+                verifica()
+            while not self._semaforo.acquire(timeout=self.intervallo):
+                if verifica is not None:
+                    verifica()
+        except BaseException:
+            with self._lock:
+                self.in_attesa -= 1
+                self.annullati += 1
+            raise
+
+        with self._lock:
+            self.in_attesa -= 1
+            self.in_corso += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_corso -= 1
+            self._semaforo.release()
+
+    def statistiche(self):
+        """
+        Restituisce calcoli in corso, in attesa e annullati.
+
+        Returns:
+            tuple: (in corso, in attesa, annullati).
+        """
+        with self._lock:
+            return self.in_corso, self.in_attesa, self.annullati
@@ -0,0 +1,211 @@
+"""
+Misura dei tempi e della memoria delle fasi del cruscotto.
+
+Ogni fase (lettura di un file, conversione delle date, filtro, KPI, grafici, ...) viene racchiusa in
+`misura("fase")`: la durata e la crescita del picco di memoria del processo vengono registrate nel registro
+del processo, condiviso da tutte le sessioni, e aggiunte come riga JSON al log strutturato, se configurato.
+Le misure sono associate al rerun in corso (`inizia_rerun`), così da poter ricostruire quanto tempo
+ogni rerun ha speso in ciascuna fase. Il modulo non dipende da Streamlit.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: la memoria non viene misurata
+    resource = None
+
+# Numero massimo di misure conservate in memoria
+MAX_MISURE = 20_000
+
+# Dimensione oltre la quale il log strutturato viene ruotato (il precedente diventa `.1`)
+MAX_BYTE_LOG = 20 * 2**20
+
+# Rerun in corso nel thread: (sessione, identificativo del rerun, inizio del rerun)
+_rerun_corrente = contextvars.ContextVar("rerun_corrente", default=(None, None, None))
+
+
+def _memoria_mb():
+    """
+    Picco di memoria residente del processo in MB, oppure None se non disponibile.
+
+    Leggere il picco non costa quasi nulla, a differenza di tracemalloc: la crescita del picco durante una fase
+    indica quanta memoria in più la fase ha richiesto al sistema.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss è in KB su Linux e in byte su macOS
+    picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return picco / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+class RegistroPrestazioni:
+    """
+    Misure delle fasi del processo, in memoria e (opzionalmente) in un log JSON, una riga per misura.
+
+    Args:
+        max_misure (int): Numero massimo di misure conservate in memoria; le più vecchie vengono eliminate.
+        percorso_log (str): File del log strutturato, oppure None per non scrivere il log.
+    """
+
+    def __init__(self, max_misure=MAX_MISURE, percorso_log=None):
+        self._misure = deque(maxlen=max_misure)
+        self._lock = threading.Lock()
+        self.percorso_log = percorso_log
+
+    def configura_log(self, percorso_log):
+        """
+        Imposta il file del log strutturato, creandone la cartella.
+
+        Args:
+            percorso_log (str): File del log, oppure None per non scrivere il log.
+        """
+        if percorso_log is not None:
+            os.makedirs(os.path.dirname(percorso_log) or ".", exist_ok=True)
+        self.percorso_log = percorso_log
+
+    def registra(self, misura):
+        """
+        Aggiunge una misura al registro e al log.
+
+        Args:
+            misura (dict): Misura con almeno 'fase' e 'durata_ms'.
+        """
+        with self._lock:
+            self._misure.append(misura)
+            if self.percorso_log is None:
+                return
+            try:
+                if os.path.exists(self.percorso_log) and os.path.getsize(self.percorso_log) > MAX_BYTE_LOG:
+                    os.replace(self.percorso_log, f"{self.percorso_log}.1")
+                with open(self.percorso_log, "a", encoding="utf-8") as log:
+                    log.write(json.dumps(misura, default=str) + "\n")
+            except OSError as e:
+                print(f"Impossibile scrivere il log delle prestazioni: {e}")
+                self.percorso_log = None
+
+    def misure(self):
+        """
+        Restituisce le misure conservate.
+
+        Returns:
+            pd.DataFrame: Una riga per misura, con le colonne 'istante', 'sessione', 'rerun', 'fase',
+                'durata_ms', 'memoria_mb' e gli eventuali attributi delle fasi.
+        """
+        with self._lock:
+            misure = list(self._misure)
+        return pd.DataFrame(misure, columns=None if misure else ['istante', 'sessione', 'rerun', 'fase',
+                                                                   'durata_ms', 'memoria_mb'])
+
+    def percentili(self, percentili=(50, 90, 99)):
+        """
+        Calcola per ogni fase numero di misure e percentili della durata, su tutte le sessioni.
+
+        Args:
+            percentili (tuple): Percentili da calcolare.
+
+        Returns:
+            pd.DataFrame: Una riga per fase, in ordine di durata totale decrescente.
+        """
+        misure = self.misure()
+        righe = []
+        for fase, durate in misure.groupby('fase', sort=False)['durata_ms']:
+            valori = np.percentile(durate.to_numpy(), percentili)
+            righe.append({'fase': fase, 'misure': len(durate), 'totale_ms': durate.sum(),
+                          **{f"p{p}_ms": valore for p, valore in zip(percentili, valori)}})
+        colonne = ['fase', 'misure', 'totale_ms'] + [f"p{p}_ms" for p in percentili]
+        return pd.DataFrame(righe, columns=colonne).sort_values('totale_ms', ascending=False, ignore_index=True)
+
+    def ripartizione_rerun(self, n_rerun=20):
+        """
+        Ripartisce la durata degli ultimi rerun tra le fasi.
+
+        Args:
+            n_rerun (int): Numero di rerun più recenti da riportare.
+
+        Returns:
+            pd.DataFrame: Una riga per rerun (indicizzata da sessione e rerun) e una colonna per fase, in ms.
+        """
+        misure = self.misure()
+        misure = misure[misure['rerun'].notna()]
+        ultimi = misure.drop_duplicates('rerun', keep='last').tail(n_rerun)['rerun']
+        misure = misure[misure['rerun'].isin(ultimi)]
+        return misure.pivot_table(index=['sessione', 'rerun'], columns='fase', values='durata_ms',
+                                  aggfunc='sum', fill_value=0, sort=False)
+
+
+# Registro del processo, condiviso da tutte le sessioni
+REGISTRO = RegistroPrestazioni()
+
+
+def inizia_rerun(sessione):
+    """
+    Associa le misure successive del thread a un nuovo rerun della sessione.
+
+    Args:
+        sessione (str): Identificativo della sessione.
+
+    Returns:
+        str: Identificativo del rerun.
+    """
+    rerun = f"{sessione}-{time.time_ns():x}"
+    _rerun_corrente.set((sessione, rerun, time.perf_counter()))
+    return rerun
+
+
+def termina_rerun(registro=None):
+    """
+    Registra la durata complessiva del rerun in corso come fase 'rerun'.
+
+    I rerun interrotti da Streamlit non arrivano a questa chiamata e non hanno la fase 'rerun'.
+
+    Args:
+        registro (RegistroPrestazioni): Registro in cui salvare la misura (predefinito: `REGISTRO`).
+    """
+    sessione, rerun, inizio = _rerun_corrente.get()
+    if rerun is None:
+        return
+    (registro or REGISTRO).registra({
+        'istante': time.time(), 'sessione': sessione, 'rerun': rerun, 'fase': 'rerun',
+        'durata_ms': (time.perf_counter() - inizio) * 1000, 'memoria_mb': None,
+    })
+    _rerun_corrente.set((None, None, None))
+
+
+@contextmanager
+def misura(fase, registro=None, **attributi):
+    """
+    Misura durata e crescita della memoria del blocco e la registra per il rerun in corso.
+
+    La misura viene registrata anche se il blocco termina con un'eccezione (ad esempio un rerun interrotto).
+    Può essere usata anche come decoratore: `@misura("fase")`. Con `with misura("fase") as attributi:`
+    il blocco può aggiungere a `attributi` informazioni note solo al suo termine.
+
+    Args:
+        fase (str): Nome della fase.
+        registro (RegistroPrestazioni): Registro in cui salvare la misura (predefinito: `REGISTRO`).
+        **attributi: Informazioni aggiuntive salvate con la misura (ad esempio il nome del file).
+    """
+    memoria_iniziale = _memoria_mb()
+    inizio = time.perf_counter()
+    try:
+        yield attributi
+    finally:
+        durata_ms = (time.perf_counter() - inizio) * 1000
+        memoria_finale = _memoria_mb()
+        sessione, rerun, _ = _rerun_corrente.get()
+        (registro or REGISTRO).registra({
+            'istante': time.time(), 'sessione': sessione, 'rerun': rerun, 'fase': fase,
+            'durata_ms': durata_ms,
+            'memoria_mb': None if memoria_finale is None else memoria_finale - memoria_iniziale,
+            **attributi,
+        })
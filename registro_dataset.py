@@ -0,0 +1,166 @@
+"""
+Registro dei dataset condiviso da tutte le sessioni del server.
+
+Sessioni che caricano gli stessi file ottengono lo stesso dataset, costruito una sola volta e in sola lettura:
+ogni sessione conserva solo un riferimento e il proprio stato dei filtri. Un dataset viene eliminato
+quando nessuna sessione lo riferisce più.
+"""
+import hashlib
+import threading
+import weakref
+
+
+class DatasetCondiviso:
+    """
+    Dati elaborati a partire da un insieme di file caricati, condivisi in sola lettura tra le sessioni.
+
+    Args:
+        chiave (str): Chiave del dataset nel registro.
+        main_dataframe (pd.DataFrame): Vendite unite al catalogo e normalizzate, oppure None.
+        details_dataframe (pd.DataFrame): Catalogo delle referenze, oppure None.
+        cubo (pd.DataFrame): Cubo dei KPI, oppure None.
+        indice (IndiceFiltri): Indice delle celle del cubo, oppure None.
+        errori (dict): Errori di elaborazione per nome del file.
+        details_index (DetailsIndex): Indice del catalogo per codice 'Referente', oppure None.
+        referenze_non_trovate (pd.DataFrame): Codici 'Referente' delle vendite assenti dal catalogo, oppure None.
+        storico (StoricoVendite): Storico con le impronte dei fogli per l'aggiornamento incrementale, oppure None.
+    """
+
+    def __init__(self, chiave, main_dataframe=None, details_dataframe=None, cubo=None, indice=None, errori=None,
+                 details_index=None, referenze_non_trovate=None, storico=None):
+        self.chiave = chiave
+        self.main_dataframe = main_dataframe
+        self.details_dataframe = details_dataframe
+        self.cubo = cubo
+        self.indice = indice
+        self.errori = errori or {}
+        self.details_index = details_index
+        self.referenze_non_trovate = referenze_non_trovate
+        self.storico = storico
+
+        # Memoria occupata dalle tabelle, calcolata una volta: il dataset non viene più modificato
+        self.nbytes = sum(int(tabella.memory_usage(deep=True).sum())
+                          for tabella in (main_dataframe, details_dataframe, cubo) if tabella is not None)
+
+
+class RiferimentoDataset:
+    """
+    Riferimento di una sessione a un dataset del registro.
+
+    Il riferimento viene rilasciato esplicitamente con `rilascia` oppure automaticamente quando
+    lo stato della sessione che lo contiene viene eliminato.
+    """
+
+    def __init__(self, registro, dataset):
+        self.dataset = dataset
+        self._rilascio = weakref.finalize(self, registro.rilascia, dataset.chiave)
+
+    def __getattr__(self, nome):
+        # Accesso diretto alle tabelle del dataset (main_dataframe, cubo, indice, ...)
+        return getattr(self.__dict__['dataset'], nome)
+
+    def rilascia(self):
+        """
+        Rilascia il riferimento; le chiamate successive non hanno effetto.
+        """
+        self._rilascio()
+
+
+class RegistroDataset:
+    """
+    Registro dei dataset per contenuto, con conteggio dei riferimenti.
+    """
+
+    def __init__(self):
+        self._voci = {}  # chiave -> [dataset, numero di riferimenti]
+        # Rientrante: il rilascio automatico di un riferimento può avvenire durante la garbage collection,
+        # anche mentre il lock è già acquisito dallo stesso thread
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def chiave(contenuti, chiave_precedente=None):
+        """
+        Calcola la chiave del dataset costruito da un insieme di file caricati.
+
+        Args:
+            contenuti (list): Contenuti dei file caricati (bytes), nell'ordine di caricamento.
+            chiave_precedente (str): Chiave del dataset da cui il nuovo dipende, ad esempio quando si caricano
+                le vendite e il catalogo viene da un caricamento precedente.
+
+        Returns:
+            str: Chiave esadecimale.
+        """
+        digest = hashlib.sha256((chiave_precedente or "").encode())
+        for contenuto in contenuti:
+            digest.update(hashlib.sha256(contenuto).digest())
+        return digest.hexdigest()
+
+    def acquisisci(self, chiave, costruisci):
+        """
+        Restituisce un riferimento al dataset della chiave, costruendolo se nessuna sessione lo usa già.
+
+        La costruzione avviene fuori dal lock: se due sessioni costruiscono lo stesso dataset
+        contemporaneamente, viene conservato il primo e il secondo viene scartato.
+
+        Args:
+            chiave (str): Chiave calcolata con `RegistroDataset.chiave`.
+            costruisci (callable): Funzione senza argomenti che restituisce il `DatasetCondiviso`.
+
+        Returns:
+            RiferimentoDataset: Riferimento da conservare nello stato della sessione.
+        """
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is not None:
+                voce[1] += 1
+                return RiferimentoDataset(self, voce[0])
+
+        dataset = costruisci()
+
+        with self._lock:
+            voce = self._voci.setdefault(chiave, [dataset, 0])
+            voce[1] += 1
+            return RiferimentoDataset(self, voce[0])
+
+    def acquisisci_esistente(self, chiave):
+        """
+        Restituisce un riferimento al dataset della chiave solo se è già nel registro.
+
+        Args:
+            chiave (str): Chiave calcolata con `RegistroDataset.chiave`.
+
+        Returns:
+            RiferimentoDataset: Riferimento da conservare nello stato della sessione, oppure None.
+        """
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is None:
+                return None
+            voce[1] += 1
+            return RiferimentoDataset(self, voce[0])
+
+    def rilascia(self, chiave):
+        """
+        Rilascia un riferimento al dataset ed elimina il dataset quando non è più riferito.
+
+        Args:
+            chiave (str): Chiave del dataset.
+        """
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is None:
+                return
+            voce[1] -= 1
+            if voce[1] <= 0:
+                del self._voci[chiave]
+
+    def statistiche(self):
+        """
+        Restituisce numero di dataset, riferimenti totali e memoria occupata dal registro.
+
+        Returns:
+            tuple: (dataset, riferimenti, byte).
+        """
+        with self._lock:
+            voci = list(self._voci.values())
+        return len(voci), sum(riferimenti for _, riferimenti in voci), sum(dataset.nbytes for dataset, _ in voci)
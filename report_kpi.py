@@ -0,0 +1,126 @@
+"""
+Report notturno dei KPI per ogni Cliente, Nome e mese, senza Streamlit.
+
+Legge tutte le cartelle di lavoro cliente e il catalogo `dettagli_referenze.xlsx` (anche su più processi),
+calcola i KPI di ogni gruppo Cliente × Nome × mese in un'unica passata vettoriale e scrive un unico report
+in formato Parquet o CSV (secondo l'estensione del file di uscita).
+
+Uso:
+    python report_kpi.py cartella_file/ --output report.parquet --processi 4 --sconto 10 --incremento 20
+"""
+import argparse
+import io
+import os
+import sys
+
+from cache_parquet import ParquetCache
+from ingestione import DetailsIndex, ingest_files, normalize_schema
+from kpi import calcolo_KPI_per_gruppi
+
+# Chiavi dei gruppi del report
+CHIAVI_REPORT = ['Cliente', 'Nome', 'Data']
+
+
+class FileLocale(io.BytesIO):
+    """
+    File letto dal disco con l'interfaccia dei file caricati in Streamlit (`name` e `getvalue`).
+
+    Args:
+        percorso (str): Percorso del file.
+    """
+
+    def __init__(self, percorso):
+        with open(percorso, "rb") as file:
+            super().__init__(file.read())
+        self.name = os.path.basename(percorso)
+
+
+def trova_file_excel(percorsi):
+    """
+    Elenca i file .xlsx indicati, cercandoli anche nelle cartelle (non ricorsivamente).
+
+    Args:
+        percorsi (list): Percorsi di file o cartelle.
+
+    Returns:
+        list: Percorsi dei file .xlsx, in ordine alfabetico per cartella.
+    """
+    file_excel = []
+    for percorso in percorsi:
+        if os.path.isdir(percorso):
+            file_excel.extend(os.path.join(percorso, nome) for nome in sorted(os.listdir(percorso))
+                              if nome.lower().endswith(".xlsx") and not nome.startswith("~$"))
+        else:
+            file_excel.append(percorso)
+    return file_excel
+
+
+def calcola_report(dataframe, sconto=0, incremento=0):
+    """
+    Calcola il report dei KPI di tutti i gruppi Cliente × Nome × mese in un'unica passata vettoriale.
+
+    Args:
+        dataframe (pd.DataFrame): Vendite unite al catalogo delle referenze.
+        sconto (float): Percentuale di sconto da applicare.
+        incremento (float): Percentuale di incremento dei cartoni venduti.
+
+    Returns:
+        pd.DataFrame: Una riga per gruppo Cliente × Nome × mese, con una colonna per KPI.
+    """
+    report = calcolo_KPI_per_gruppi(dataframe, CHIAVI_REPORT, sconto, incremento).reset_index()
+    return report.sort_values(CHIAVI_REPORT, ignore_index=True)
+
+
+def scrivi_report(report, percorso):
+    """
+    Scrive il report in formato Parquet oppure CSV, secondo l'estensione del file.
+
+    Args:
+        report (pd.DataFrame): Report restituito da `calcola_report`.
+        percorso (str): File di uscita (.parquet oppure .csv).
+    """
+    if percorso.lower().endswith(".csv"):
+        report.to_csv(percorso, index=False)
+    else:
+        report.to_parquet(percorso, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcola i KPI per ogni Cliente, Nome e mese e scrive un unico report.")
+    parser.add_argument("percorsi", nargs="+", help="File .xlsx o cartelle che li contengono (incluso dettagli_referenze.xlsx)")
+    parser.add_argument("--output", "-o", default="report_kpi.parquet", help="File del report (.parquet oppure .csv)")
+    parser.add_argument("--processi", "-p", type=int, default=os.cpu_count() or 1,
+                        help="Numero di processi per la lettura dei file")
+    parser.add_argument("--sconto", type=float, default=0, help="Percentuale di sconto da applicare")
+    parser.add_argument("--incremento", type=float, default=0, help="Percentuale di incremento dei cartoni venduti")
+    parser.add_argument("--cache", action="store_true", help="Usa la cache Parquet dei file già elaborati")
+    args = parser.parse_args(argv)
+
+    file_excel = [FileLocale(percorso) for percorso in trova_file_excel(args.percorsi)]
+    print(f"Lettura di {len(file_excel)} file con {args.processi} processi...")
+    main_dataframe, details_dataframe, errori = ingest_files(file_excel, n_processes=args.processi,
+                                                             cache=ParquetCache() if args.cache else None)
+    for nome_file, errore in errori.items():
+        print(f"Errore nel file {nome_file}: {errore}", file=sys.stderr)
+
+    if main_dataframe is None:
+        print("Nessun file cliente elaborato.", file=sys.stderr)
+        return 1
+    if details_dataframe is None:
+        print("Il catalogo dettagli_referenze.xlsx è necessario per il calcolo dei KPI.", file=sys.stderr)
+        return 1
+
+    main_dataframe, non_trovate = DetailsIndex(details_dataframe).enrich(main_dataframe)
+    if not non_trovate.empty:
+        print(f"{len(non_trovate)} codici Referente non presenti nel catalogo: "
+              f"{', '.join(map(str, non_trovate['Referente']))}", file=sys.stderr)
+    main_dataframe = normalize_schema(main_dataframe)
+
+    report = calcola_report(main_dataframe, args.sconto, args.incremento)
+    scrivi_report(report, args.output)
+    print(f"Report di {len(report)} gruppi scritto in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
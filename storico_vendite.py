@@ -0,0 +1,200 @@
+"""
+Storico delle vendite aggiornabile in modo incrementale.
+
+Lo storico ricorda l'impronta di ogni foglio mensile per (Cliente, Anno, Mese): a ogni nuovo caricamento
+vengono letti e convertiti solo i fogli nuovi o modificati, le cui righe sostituiscono quelle precedenti
+nelle vendite, nel cubo dei KPI, nel suo indice e nel report dei codici non trovati. Il tempo di aggiornamento
+dipende dalla dimensione della modifica, non da quella dello storico.
+"""
+import numpy as np
+import pandas as pd
+
+from indici import IndiceFiltri
+from ingestione import (_consolidate_excel_data, concat_normalized, is_details_file, normalize_schema,
+                        read_customer_workbook_changes, unmatched_report)
+from kpi import aggiorna_cubo_KPI, costruisci_cubo_KPI
+
+
+class StoricoVendite:
+    """
+    Vendite consolidate con l'impronta di ogni foglio mensile da cui provengono.
+
+    Lo storico non viene mai modificato: `aggiorna` restituisce un nuovo storico, così che possa essere
+    condiviso in sola lettura tra le sessioni come i dataset del registro.
+    """
+
+    def __init__(self):
+        self.impronte = {}  # (cliente, anno, mese) -> impronta del foglio
+        self.id_fogli = {}  # (cliente, anno, mese) -> identificativo delle righe del foglio
+        self.vendite = None  # Vendite normalizzate e unite al catalogo
+        self.fogli_righe = np.empty(0, dtype=np.int64)  # Identificativo del foglio di ogni riga di `vendite`
+        self.cubo = None  # Cubo dei KPI delle vendite
+        self.indice = None  # Indice dei filtri sulle celle del cubo
+        self.righe_non_trovate = np.empty(0, dtype=bool)  # Righe di `vendite` con un codice assente dal catalogo
+        self.referenze_non_trovate = None  # Report dei codici non trovati (vedi `unmatched_report`)
+        self.id_base = {}  # (cliente, anno) -> identificativo delle righe di un caricamento completo (vedi `da_dataset`)
+        self._prossimo_id = 0
+
+    @classmethod
+    def da_dataset(cls, vendite, cubo=None, indice=None, referenze_non_trovate=None, details_index=None):
+        """
+        Crea lo storico dalle vendite di un caricamento completo, così che il primo aggiornamento incrementale
+        parta da tutte le vendite già caricate invece che da uno storico vuoto.
+
+        Le impronte dei fogli del caricamento completo non sono note: le righe vengono raggruppate per cliente
+        e anno, e il primo file caricato di un cliente e di un anno ne sostituisce tutte le righe, comprese
+        quelle senza data dello stesso cliente.
+
+        Args:
+            vendite (pd.DataFrame): Vendite normalizzate del caricamento completo.
+            cubo (pd.DataFrame): Cubo dei KPI delle vendite, oppure None.
+            indice (IndiceFiltri): Indice dei filtri sulle celle del cubo, oppure None.
+            referenze_non_trovate (pd.DataFrame): Report dei codici non trovati, oppure None.
+            details_index (DetailsIndex): Indice del catalogo con cui sono state arricchite le vendite, oppure None.
+
+        Returns:
+            StoricoVendite: Lo storico con le vendite del caricamento completo.
+        """
+        storico = cls()
+        storico.vendite, storico.cubo, storico.indice = vendite, cubo, indice
+        storico.referenze_non_trovate = referenze_non_trovate
+        if details_index is not None:
+            storico.righe_non_trovate = details_index.lookup(vendite['Referente'])[0] < 0
+        else:
+            storico.righe_non_trovate = np.zeros(len(vendite), dtype=bool)
+
+        # Un identificativo per ogni cliente e anno; le righe senza data hanno anno -1
+        anni = vendite['Data'].dt.year.fillna(-1).astype(np.int64)
+        codici, chiavi = pd.MultiIndex.from_arrays([vendite['Cliente'], anni]).factorize()
+        storico.fogli_righe = codici.astype(np.int64)
+        storico.id_base = {(cliente, None if anno < 0 else int(anno)): id_righe
+                           for id_righe, (cliente, anno) in enumerate(chiavi)}
+        storico._prossimo_id = len(chiavi)
+        return storico
+
+    def aggiorna(self, uploaded_files, details_index=None):
+        """
+        Elabora i soli fogli mensili nuovi o modificati dei file caricati e restituisce lo storico aggiornato.
+
+        I fogli di un cliente e di un anno che non compaiono più nel file caricato vengono tolti dallo storico;
+        i clienti i cui file non sono stati caricati restano invariati.
+
+        Args:
+            uploaded_files (list): Lista di file caricati dall'utente (il catalogo viene ignorato).
+            details_index (DetailsIndex): Indice del catalogo con cui arricchire le righe nuove, oppure None.
+
+        Returns:
+            tuple: (nuovo `StoricoVendite`; errori di elaborazione per nome del file; numero di fogli elaborati).
+        """
+        storico = StoricoVendite()
+        storico.impronte = dict(self.impronte)
+        storico.id_fogli = dict(self.id_fogli)
+        storico.id_base = dict(self.id_base)
+        storico._prossimo_id = self._prossimo_id
+
+        errori = {}
+        id_rimossi = set()
+        nuove = []
+        id_nuove = []
+        for uploaded_file in uploaded_files:
+            if is_details_file(uploaded_file.name):
+                continue
+            try:
+                excel_data, impronte_file = read_customer_workbook_changes(uploaded_file, storico.impronte)
+
+                # Ogni foglio viene consolidato da solo, così che le sue righe possano essere sostituite
+                first_sheet = next(iter(excel_data))
+                fogli = {chiave[2]: chiave for chiave in impronte_file}
+                righe_fogli = [(fogli[titolo], _consolidate_excel_data({first_sheet: excel_data[first_sheet],
+                                                                        titolo: excel_data[titolo]}))
+                               for titolo in list(excel_data)[1:]]
+            except Exception as e:
+                errori[uploaded_file.name] = str(e)
+                continue
+
+            # Fogli dello stesso cliente e anno non più presenti nel file
+            clienti_anni = {chiave[:2] for chiave in impronte_file}
+            for cliente, anno in clienti_anni:
+                # Righe del caricamento completo da cui è partito lo storico (vedi `da_dataset`)
+                for chiave in [(cliente, anno), (cliente, None)]:
+                    if chiave in storico.id_base:
+                        id_rimossi.add(storico.id_base.pop(chiave))
+            for chiave in [chiave for chiave in storico.impronte
+                           if chiave[:2] in clienti_anni and chiave not in impronte_file]:
+                id_rimossi.add(storico.id_fogli.pop(chiave))
+                del storico.impronte[chiave]
+
+            for chiave, righe in righe_fogli:
+                if chiave in storico.id_fogli:
+                    id_rimossi.add(storico.id_fogli[chiave])
+                storico.id_fogli[chiave] = storico._prossimo_id
+                nuove.append(righe)
+                id_nuove.append(np.full(len(righe), storico._prossimo_id, dtype=np.int64))
+                storico._prossimo_id += 1
+            storico.impronte.update(impronte_file)
+
+        # Solo le righe nuove vengono unite al catalogo e normalizzate
+        righe_nuove = report_nuove = None
+        non_trovate_nuove = np.empty(0, dtype=bool)
+        if nuove:
+            righe_nuove = pd.concat(nuove, ignore_index=True)
+            if details_index is not None:
+                non_trovate_nuove = details_index.lookup(righe_nuove['Referente'])[0] < 0
+                righe_nuove, report_nuove = details_index.enrich(righe_nuove)
+            else:
+                non_trovate_nuove = np.zeros(len(righe_nuove), dtype=bool)
+            righe_nuove = normalize_schema(righe_nuove)
+
+        rimosse = np.isin(self.fogli_righe, list(id_rimossi))
+        righe_rimosse = self.vendite.loc[rimosse] if rimosse.any() else None
+        if righe_nuove is None and righe_rimosse is None:
+            storico.vendite, storico.fogli_righe, storico.cubo = self.vendite, self.fogli_righe, self.cubo
+            storico.indice, storico.righe_non_trovate = self.indice, self.righe_non_trovate
+            storico.referenze_non_trovate = self.referenze_non_trovate
+            return storico, errori, 0
+
+        # Le righe rimaste sono già normalizzate: vengono solo concatenate con quelle nuove
+        rimaste = None if self.vendite is None else self.vendite.loc[~rimosse]
+        storico.vendite = concat_normalized([rimaste, righe_nuove], normalize=False)
+        storico.fogli_righe = np.concatenate([self.fogli_righe[~rimosse]] + id_nuove)
+        storico.righe_non_trovate = np.concatenate([self.righe_non_trovate[~rimosse], non_trovate_nuove])
+
+        report_rimosse = None
+        if righe_rimosse is not None and self.righe_non_trovate[rimosse].any():
+            report_rimosse = unmatched_report(righe_rimosse, np.where(self.righe_non_trovate[rimosse], -1, 0))
+        storico.referenze_non_trovate = _aggiorna_report(self.referenze_non_trovate, report_rimosse, report_nuove)
+
+        if 'Nome' in storico.vendite.columns:
+            if self.cubo is None or self.indice is None:
+                storico.cubo = costruisci_cubo_KPI(storico.vendite)
+                storico.indice = IndiceFiltri(storico.cubo)
+            else:
+                storico.cubo, posizioni = aggiorna_cubo_KPI(self.cubo, righe_rimosse, righe_nuove, posizioni=True)
+                storico.indice = self.indice.aggiorna(storico.cubo, posizioni)
+        return storico, errori, len(nuove)
+
+
+def _aggiorna_report(report, report_rimosse=None, report_nuove=None):
+    """
+    Aggiorna il report dei codici non trovati togliendo quello delle righe rimosse e aggiungendo quello
+    delle righe nuove: righe e fatturato per codice sono somme, quindi le righe rimaste non vengono rilette.
+    Le righe rimaste restano associate al catalogo con cui sono state elaborate.
+
+    Args:
+        report (pd.DataFrame): Report corrente (vedi `unmatched_report`), oppure None.
+        report_rimosse (pd.DataFrame): Report delle righe rimosse, oppure None.
+        report_nuove (pd.DataFrame): Report delle righe nuove, oppure None.
+
+    Returns:
+        pd.DataFrame: Il report aggiornato, oppure None se non ci sono report.
+    """
+    parti = [parte for parte in (report, report_nuove) if parte is not None]
+    if report_rimosse is not None:
+        parti.append(report_rimosse.assign(Righe=-report_rimosse['Righe'], Fatturato=-report_rimosse['Fatturato']))
+    if not parti:
+        return None
+
+    report = (pd.concat(parti, ignore_index=True)
+              .groupby('Referente', dropna=False, sort=False)[['Righe', 'Fatturato']].sum())
+    report = report[report['Righe'] > 0]
+    return report.sort_values('Fatturato', ascending=False).reset_index()
@@ -0,0 +1,9 @@
+"""
+Configurazione dei test: i moduli del cruscotto e il generatore di dati dei benchmark sono importabili
+come nei benchmark.
+"""
+import os
+import sys
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RADICE, os.path.join(RADICE, "benchmarks")]
@@ -0,0 +1,95 @@
+"""
+Test dell'archivio pluriennale: le partizioni mensili conservano le vendite di tutti gli anni e i KPI di un
+intervallo coincidono con il calcolo sulle righe dello stesso intervallo.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from archivio_storico import ArchivioStorico, anno_su_anno, data_da_periodo, periodo_da_data, ultimi_12_mesi
+from dataset import costruisci_dataset
+from genera_dati import genera_dettagli_referenze, genera_fogli_cliente, genera_workbook_cliente, workbook_da_fogli
+from kpi import NOMI_KPI, calcolo_KPI
+
+
+def vendite_anno(anno, clienti=range(2), n_referenze=20):
+    """Vendite di un anno; una parte delle referenze non è nel catalogo e resta senza Nome."""
+    files = [genera_dettagli_referenze(15)] + [genera_workbook_cliente(i, anno, n_referenze) for i in clienti]
+    return costruisci_dataset(f"archivio-{anno}", files).main_dataframe
+
+
+def vendite_periodo(vendite, inizio, fine):
+    return vendite[vendite['Periodo'].between(inizio, fine)]
+
+
+def assert_KPI_uguali(risultato, atteso):
+    for nome in NOMI_KPI:
+        assert np.isclose(getattr(risultato, nome), getattr(atteso, nome), rtol=1e-5, equal_nan=True), nome
+
+
+def test_periodi():
+    assert periodo_da_data("2024-03-15") == 2024 * 12 + 2
+    assert data_da_periodo(2024 * 12 + 2) == pd.Timestamp("2024-03-01")
+    assert anno_su_anno(100, 105) == ((100, 105), (88, 93))
+    assert ultimi_12_mesi(100) == ((89, 100), (77, 88))
+
+
+def test_partizioni_mensili(tmp_path):
+    archivio = ArchivioStorico(str(tmp_path))
+    vendite = pd.concat([vendite_anno(2023), vendite_anno(2024)], ignore_index=True)
+
+    assert archivio.aggiungi(vendite_anno(2023)) == 12
+    assert archivio.aggiungi(vendite_anno(2024)) == 12
+
+    assert archivio.periodi() == list(range(periodo_da_data("2023-01-01"), periodo_da_data("2024-12-01") + 1))
+    assert (tmp_path / "anno=2024" / "mese=03" / "vendite.parquet").exists()
+    assert archivio.versione == 2
+
+    marzo = periodo_da_data("2024-03-01")
+    letto = archivio.carica([marzo, marzo + 100], colonne=['Cliente', 'Fatturato', 'Periodo'])
+    assert list(letto.columns) == ['Cliente', 'Fatturato', 'Periodo']
+    assert (letto['Periodo'] == marzo).all()
+    assert np.isclose(letto['Fatturato'].sum(), vendite_periodo(vendite, marzo, marzo)['Fatturato'].sum())
+    assert archivio.carica([marzo + 100]) is None and archivio.cubo([marzo + 100]) is None
+
+    cubo = archivio.cubo()
+    assert cubo['righe'].sum() == len(vendite)
+    assert cubo['Nome'].isna().any() and isinstance(cubo['Nome'].dtype, pd.CategoricalDtype)
+
+
+def test_aggiungi_sostituisce_solo_i_clienti_caricati(tmp_path):
+    archivio = ArchivioStorico(str(tmp_path))
+    archivio.aggiungi(vendite_anno(2024, clienti=range(3)))
+
+    fogli = genera_fogli_cliente(1, n_referenze=20)
+    fogli["MARZO"].loc[0, "Fatturato"] += 1000.0
+    modificato = costruisci_dataset("modificato", [genera_dettagli_referenze(15),
+                                                   workbook_da_fogli(fogli, "cliente_001.xlsx")]).main_dataframe
+    archivio.aggiungi(modificato)
+
+    atteso = pd.concat([vendite_anno(2024, clienti=[0, 2]), modificato], ignore_index=True)
+    letto = archivio.carica()
+    assert len(letto) == len(atteso)
+    for cliente in ["Cliente 000", "Cliente 001", "Cliente 002"]:
+        assert np.isclose(letto.loc[letto['Cliente'] == cliente, 'Fatturato'].sum(),
+                          atteso.loc[atteso['Cliente'] == cliente, 'Fatturato'].sum())
+
+
+@pytest.mark.parametrize("filtri", [{}, {'cliente': "Cliente 001"}, {'nome': "Prodotto 3", 'grammatura': 500}])
+def test_KPI_periodo_e_confronto_uguali_al_calcolo_sulle_righe(tmp_path, filtri):
+    archivio = ArchivioStorico(str(tmp_path))
+    vendite = pd.concat([vendite_anno(2023), vendite_anno(2024)], ignore_index=True)
+    archivio.aggiungi(vendite)
+
+    maschera = pd.Series(True, index=vendite.index)
+    for colonna, chiave in [('Cliente', 'cliente'), ('Nome', 'nome'), ('Quantita in grammi', 'grammatura')]:
+        if chiave in filtri:
+            maschera &= vendite[colonna] == filtri[chiave]
+    filtrate = vendite[maschera]
+
+    corrente, riferimento = anno_su_anno(periodo_da_data("2024-04-01"), periodo_da_data("2024-09-01"))
+    kpi_corrente, kpi_riferimento = archivio.confronta_periodi(corrente, riferimento, 10, 20, **filtri)
+
+    assert_KPI_uguali(kpi_corrente, calcolo_KPI(vendite_periodo(filtrate, *corrente), 10, 20))
+    assert_KPI_uguali(kpi_riferimento, calcolo_KPI(vendite_periodo(filtrate, *riferimento), 10, 20))
+    assert archivio.calcolo_KPI_periodo(*ultimi_12_mesi(periodo_da_data("2022-12-01"))[0]) is None
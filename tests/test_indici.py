@@ -0,0 +1,98 @@
+"""
+Test dell'indice dei filtri: selezioni, opzioni e aggiornamento devono coincidere con i confronti
+sulle colonne e con un indice ricostruito da zero.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from indici import TUTTI, IndiceFiltri
+
+
+def tabella_celle(n_righe=400, seed=0):
+    """Tabella con le dimensioni del cubo; le categorie dei clienti non sono in ordine alfabetico."""
+    rng = np.random.default_rng(seed)
+    clienti = ["Cliente 002", "Cliente 000", "Cliente 001"]
+    return pd.DataFrame({
+        'Cliente': pd.Categorical(rng.choice(clienti, n_righe), categories=clienti),
+        'Nome': pd.Categorical(rng.choice([f"Prodotto {i}" for i in range(8)], n_righe)),
+        'Quantita in grammi': rng.choice([250.0, 500.0, 1000.0], n_righe),
+        'Data_datetime': pd.to_datetime("2024-01-01") + pd.to_timedelta(rng.integers(0, 12, n_righe) * 31, unit="D"),
+    })
+
+
+def posizioni_attese(tabella, filtri, data_inizio=None, data_fine=None):
+    maschera = pd.Series(True, index=tabella.index)
+    for dimensione, valore in filtri.items():
+        if valore != TUTTI:
+            maschera &= tabella[dimensione] == valore
+    if data_inizio is not None:
+        maschera &= tabella['Data_datetime'] >= data_inizio
+    if data_fine is not None:
+        maschera &= tabella['Data_datetime'] <= data_fine
+    return np.flatnonzero(maschera.to_numpy())
+
+
+def assert_indici_uguali(indice, atteso):
+    assert indice.n_righe == atteso.n_righe
+    for dimensione in atteso.dimensioni:
+        assert list(indice.posizioni[dimensione]) == list(atteso.posizioni[dimensione])
+        for valore, posizioni in atteso.posizioni[dimensione].items():
+            np.testing.assert_array_equal(indice.posizioni[dimensione][valore], posizioni)
+    np.testing.assert_array_equal(indice.date_ordinate, atteso.date_ordinate)
+    np.testing.assert_array_equal(np.sort(indice.ordine_date), np.sort(atteso.ordine_date))
+
+
+@pytest.mark.parametrize("filtri, data_inizio, data_fine", [
+    ({}, None, None),
+    ({'Cliente': "Cliente 001"}, None, None),
+    ({'Cliente': "Cliente 000", 'Nome': "Prodotto 3"}, None, None),
+    ({'Nome': "Prodotto 5", 'Quantita in grammi': 500.0}, pd.Timestamp("2024-03-01"), pd.Timestamp("2024-08-31")),
+    ({'Cliente': TUTTI, 'Nome': TUTTI}, pd.Timestamp("2024-06-01"), None),
+    ({'Cliente': "Cliente 999"}, None, None),
+])
+def test_seleziona_uguale_ai_confronti(filtri, data_inizio, data_fine):
+    tabella = tabella_celle()
+    indice = IndiceFiltri(tabella)
+
+    np.testing.assert_array_equal(indice.seleziona(filtri, data_inizio, data_fine),
+                                  posizioni_attese(tabella, filtri, data_inizio, data_fine))
+
+
+def test_opzioni_seguono_le_categorie_e_gli_altri_filtri():
+    tabella = tabella_celle()
+    indice = IndiceFiltri(tabella)
+
+    assert indice.opzioni('Cliente') == ["Cliente 002", "Cliente 000", "Cliente 001"]
+    assert indice.opzioni('Quantita in grammi') == [250.0, 500.0, 1000.0]
+
+    selezione = tabella[tabella['Cliente'] == "Cliente 000"]
+    attese = [nome for nome in tabella['Nome'].cat.categories if (selezione['Nome'] == nome).any()]
+    assert indice.opzioni('Nome', {'Cliente': "Cliente 000", 'Nome': "Prodotto 1"}) == attese
+
+
+def test_aggiorna_uguale_a_indice_ricostruito():
+    tabella = tabella_celle()
+    indice = IndiceFiltri(tabella)
+
+    # Tolte le righe di un cliente e di un mese, aggiunte righe nuove con un cliente nuovo,
+    # come nel cubo restituito da `aggiorna_cubo_KPI`
+    rimosse = ((tabella['Cliente'] == "Cliente 000") | (tabella['Data_datetime'] == tabella['Data_datetime'].min())).to_numpy()
+    nuove = tabella_celle(60, seed=1)
+    nuove['Cliente'] = nuove['Cliente'].cat.rename_categories({"Cliente 000": "Cliente 003"})
+    aggiornata = pd.concat([tabella[~rimosse], nuove], ignore_index=True)
+    aggiornata['Cliente'] = aggiornata['Cliente'].astype(
+        pd.CategoricalDtype(["Cliente 002", "Cliente 001", "Cliente 003", "Cliente 000"]))
+    aggiornata['Nome'] = aggiornata['Nome'].astype('category')
+
+    posizioni_precedenti = np.cumsum(~rimosse) - 1
+    posizioni_precedenti[rimosse] = -1
+
+    aggiornato = indice.aggiorna(aggiornata, posizioni_precedenti)
+
+    assert_indici_uguali(aggiornato, IndiceFiltri(aggiornata))
+    assert aggiornato.opzioni('Cliente') == ["Cliente 002", "Cliente 001", "Cliente 003"]
+    np.testing.assert_array_equal(aggiornato.seleziona({'Cliente': "Cliente 003"}, pd.Timestamp("2024-05-01")),
+                                  posizioni_attese(aggiornata, {'Cliente': "Cliente 003"}, pd.Timestamp("2024-05-01")))
+    # L'indice precedente non viene modificato
+    assert_indici_uguali(indice, IndiceFiltri(tabella))
@@ -0,0 +1,107 @@
+"""
+Test dell'elaborazione dei file: il risultato non deve dipendere dal numero di processi né dalla cache,
+e l'unione con il catalogo deve segnalare i codici ripetuti e quelli non trovati.
+
+Uso:
+    python -m pytest tests
+"""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from genera_dati import FileCaricato, genera_catalogo, genera_fogli_cliente, workbook_da_fogli
+from cache_parquet import ParquetCache
+from ingestione import DetailsIndex, ingest_files, merge_with_second_dataframe, unmatched_report
+
+
+def file_cliente_con_foglio_non_riconosciuto(indice):
+    """Cartella di lavoro cliente in cui il foglio di gennaio ha un nome che non corrisponde a nessun mese."""
+    fogli = genera_fogli_cliente(indice, n_referenze=30)
+    fogli["Riepilogo"] = fogli.pop("GENNAIO")
+    return workbook_da_fogli(fogli, f"cliente_{indice:03d}.xlsx")
+
+
+def catalogo_con_valori_mancanti():
+    """Catalogo delle referenze con un Nome e una Ricetta mancanti."""
+    catalogo = genera_catalogo(40)
+    catalogo.loc[3, "Nome"] = np.nan
+    catalogo.loc[5, "Ricetta"] = np.nan
+    buffer = io.BytesIO()
+    catalogo.to_excel(buffer, index=False, engine="openpyxl")
+    return FileCaricato(buffer.getvalue(), "dettagli_referenze.xlsx")
+
+
+def file_cliente_con_codici_misti(indice):
+    """Cartella di lavoro cliente con codici 'Referente' sia numerici sia testuali."""
+    fogli = genera_fogli_cliente(indice, n_referenze=30)
+    fogli["MARZO"]['Referente'] = fogli["MARZO"]['Referente'].astype(object)
+    fogli["MARZO"].loc[[0, 1], 'Referente'] = ["A12", "1002"]
+    return workbook_da_fogli(fogli, f"cliente_{indice:03d}.xlsx")
+
+
+def test_elaborazione_parallela_uguale_a_sequenziale():
+    files = [catalogo_con_valori_mancanti()] + [file_cliente_con_foglio_non_riconosciuto(i) for i in range(3)]
+
+    vendite, dettagli, errori = ingest_files(files, n_processes=1)
+    vendite_parallelo, dettagli_parallelo, errori_parallelo = ingest_files(files, n_processes=3)
+
+    # I valori mancanti restano tali anche quando le colonne tornano dai processi del pool
+    assert vendite["Data"].isna().sum() == 90
+    assert dettagli["Nome"].isna().sum() == 1
+    assert vendite.equals(vendite_parallelo)
+    assert dettagli.equals(dettagli_parallelo)
+    assert errori == errori_parallelo
+
+
+def test_cache_salva_i_codici_misti(tmp_path, caplog):
+    catalogo = genera_catalogo(40)
+    catalogo['Referente'] = catalogo['Referente'].astype(object)
+    catalogo.loc[0, 'Referente'] = "A12"
+    files = [file_cliente_con_codici_misti(0)]
+    cache = ParquetCache(str(tmp_path))
+
+    vendite, _, errori = ingest_files(files, cache=cache)
+    vendite_cache, _, errori_cache = ingest_files(files, cache=cache)
+
+    assert not caplog.records
+    assert cache.hits == 1 and errori == errori_cache == {}
+    assert list(vendite_cache['Referente'].iloc[:2]) == ["1000", "1001"]
+    pd.testing.assert_frame_equal(merge_with_second_dataframe(vendite_cache, catalogo),
+                                  merge_with_second_dataframe(vendite, catalogo))
+    unite = merge_with_second_dataframe(vendite_cache, catalogo)
+    assert list(unite.loc[unite['Referente'] == "A12", 'Nome']) == [catalogo.loc[0, 'Nome']]
+
+
+def test_catalogo_con_codici_ripetuti_e_non_trovati():
+    catalogo = genera_catalogo(5)
+    # Il codice 1001 è ripetuto, anche come stringa: vale la prima riga
+    catalogo = pd.concat([catalogo, catalogo.iloc[[1]].assign(Nome="Duplicato")], ignore_index=True)
+    catalogo['Referente'] = catalogo['Referente'].astype(object)
+    catalogo.loc[5, 'Referente'] = "1001"
+    vendite = pd.DataFrame({
+        'Referente': pd.Series([1000, "1001", 1001, 2000, None, 2000, "3000"], dtype=object),
+        'Fatturato': [10.0, 20.0, 30.0, 40.0, 5.0, 60.0, 1.0],
+    })
+
+    indice = DetailsIndex(catalogo)
+    posizioni, referente = indice.lookup(vendite['Referente'])
+    unite, report = indice.enrich(vendite)
+
+    assert indice.duplicates == ["1001"]
+    np.testing.assert_array_equal(posizioni, [0, 1, 1, -1, -1, -1, -1])
+    assert list(referente.astype(object)) == ["1000", "1001", "1001", "2000", np.nan, "2000", "3000"]
+    assert list(unite['Nome'].iloc[:3]) == [catalogo.loc[0, 'Nome'], catalogo.loc[1, 'Nome'], catalogo.loc[1, 'Nome']]
+    assert unite['Nome'].iloc[3:].isna().all()
+
+    # Un codice per riga del report, in ordine di fatturato; i codici mancanti restano NA
+    assert list(report['Referente'].fillna("mancante")) == ["2000", "mancante", "3000"]
+    assert list(report['Righe']) == [2, 1, 1]
+    assert list(report['Fatturato']) == [100.0, 5.0, 1.0]
+    pd.testing.assert_frame_equal(report, unmatched_report(unite, posizioni))
+
+
+def test_catalogo_senza_colonne_obbligatorie():
+    with pytest.raises(KeyError):
+        DetailsIndex(genera_catalogo(5).drop(columns='Listino'))
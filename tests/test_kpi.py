@@ -0,0 +1,116 @@
+"""
+Test dei KPI: il cubo precalcolato, il calcolo per gruppi e la griglia degli scenari devono dare
+gli stessi KPI del calcolo sulle righe di vendita e dello scenario singolo.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset import costruisci_dataset
+from genera_dati import genera_dettagli_referenze, genera_workbook_cliente
+from indici import TUTTI, IndiceFiltri
+from kpi import (NOMI_KPI, calcolo_griglia_scenari, calcolo_KPI, calcolo_KPI_base, calcolo_KPI_da_aggregati,
+                 calcolo_KPI_per_gruppi, calcolo_KPI_scenario, costruisci_cubo_KPI, curva_pareggio, interroga_cubo_KPI)
+
+
+@pytest.fixture(scope="module")
+def vendite():
+    """Vendite di tre clienti; metà delle referenze non è nel catalogo e resta senza Nome."""
+    files = [genera_dettagli_referenze(10)] + [genera_workbook_cliente(i, n_referenze=20) for i in range(3)]
+    return costruisci_dataset("kpi", files).main_dataframe
+
+
+def assert_KPI_uguali(risultato, atteso):
+    for nome in NOMI_KPI:
+        assert np.isclose(getattr(risultato, nome), getattr(atteso, nome), rtol=1e-5, equal_nan=True), nome
+
+
+@pytest.mark.parametrize("cliente, nome, grammatura, data_inizio, data_fine", [
+    (TUTTI, TUTTI, TUTTI, None, None),
+    ("Cliente 001", TUTTI, TUTTI, None, None),
+    (TUTTI, "Prodotto 3", TUTTI, None, None),
+    ("Cliente 002", TUTTI, 500, pd.Timestamp("2024-03-01"), pd.Timestamp("2024-09-30")),
+    (TUTTI, TUTTI, TUTTI, pd.Timestamp("2024-11-01"), None),
+])
+@pytest.mark.parametrize("sconto, incremento", [(0, 0), (15, 40), (-10, 120)])
+def test_cubo_uguale_al_calcolo_sulle_righe(vendite, cliente, nome, grammatura, data_inizio, data_fine,
+                                             sconto, incremento):
+    cubo = costruisci_cubo_KPI(vendite)
+
+    maschera = pd.Series(True, index=vendite.index)
+    if cliente != TUTTI:
+        maschera &= vendite['Cliente'] == cliente
+    if nome != TUTTI:
+        maschera &= vendite['Nome'] == nome
+    if grammatura != TUTTI:
+        maschera &= vendite['Quantita in grammi'] == grammatura
+    if data_inizio is not None:
+        maschera &= vendite['Data'] >= data_inizio
+    if data_fine is not None:
+        maschera &= vendite['Data'] <= data_fine
+    assert maschera.any()
+
+    atteso = calcolo_KPI(vendite[maschera], sconto, incremento)
+    for indice in [None, IndiceFiltri(cubo)]:
+        aggregati = interroga_cubo_KPI(cubo, cliente, nome, grammatura, data_inizio, data_fine, indice=indice)
+        assert_KPI_uguali(calcolo_KPI_da_aggregati(aggregati, sconto, incremento), atteso)
+
+
+def test_cubo_conserva_le_righe_senza_nome(vendite):
+    cubo = costruisci_cubo_KPI(vendite)
+
+    assert vendite['Nome'].isna().any()
+    assert cubo['righe'].sum() == len(vendite)
+    assert cubo.loc[cubo['Nome'].isna(), 'righe'].sum() == vendite['Nome'].isna().sum()
+    assert np.isclose(cubo['Fatturato'].sum(), vendite['Fatturato'].astype(float).sum())
+
+
+@pytest.mark.parametrize("chiavi", ['Cliente', ['Cliente', 'Nome']])
+@pytest.mark.parametrize("da_cubo", [False, True])
+def test_KPI_per_gruppi_uguali_al_calcolo_per_gruppo(vendite, chiavi, da_cubo):
+    tabella = costruisci_cubo_KPI(vendite) if da_cubo else vendite
+
+    kpi = calcolo_KPI_per_gruppi(tabella, chiavi, sconto=10, incremento=30)
+
+    gruppi = vendite.groupby(chiavi, observed=True)
+    assert len(kpi) == gruppi.ngroups
+    for chiave, righe in gruppi:
+        atteso = calcolo_KPI(righe, 10, 30)
+        riga = kpi.loc[chiave]
+        for nome in NOMI_KPI:
+            assert np.isclose(riga[nome], getattr(atteso, nome), rtol=1e-5, equal_nan=True), (chiave, nome)
+
+
+def test_griglia_uguale_agli_scenari_singoli(vendite):
+    base = calcolo_KPI_base(interroga_cubo_KPI(costruisci_cubo_KPI(vendite), "Cliente 000"))
+    sconti, incrementi = np.array([-20, 0, 5, 35]), np.array([0, 10, 75, 200])
+
+    griglia = calcolo_griglia_scenari(base, sconti, incrementi)
+
+    assert set(griglia) == set(NOMI_KPI)
+    for i, sconto in enumerate(sconti):
+        for j, incremento in enumerate(incrementi):
+            scenario = calcolo_KPI_scenario(base, sconto, incremento)
+            for nome in NOMI_KPI:
+                assert griglia[nome].shape == (len(sconti), len(incrementi))
+                assert np.isclose(griglia[nome][i, j], getattr(scenario, nome), equal_nan=True), nome
+
+
+def test_curva_pareggio_primo_incremento_che_raggiunge_il_margine(vendite):
+    base = calcolo_KPI_base(interroga_cubo_KPI(costruisci_cubo_KPI(vendite)))
+    sconti, incrementi = np.arange(0, 41, 5), np.arange(0, 61)
+
+    curva = curva_pareggio(calcolo_griglia_scenari(base, sconti, incrementi), incrementi)
+
+    for sconto, pareggio in zip(sconti, curva):
+        raggiunti = [incremento for incremento in incrementi
+                     if calcolo_KPI_scenario(base, sconto, incremento).margine_totale_scontato_con_incremento_e_sconto_secondo_livello
+                     >= base.margine_totale_con_sconto_secondo_livello]
+        if raggiunti:
+            assert pareggio == raggiunti[0]
+        else:
+            assert np.isnan(pareggio)
+    # Senza sconto il pareggio è immediato; gli sconti più alti non lo raggiungono entro l'incremento massimo
+    assert curva[0] == 0
+    assert np.isnan(curva).any() and not np.isnan(curva).all()
+    assert np.all(np.diff(curva[~np.isnan(curva)]) >= 0)
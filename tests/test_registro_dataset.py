@@ -0,0 +1,69 @@
+"""
+Test del registro dei dataset condiviso: un dataset viene costruito una volta per chiave e resta nel registro
+finché almeno un riferimento non è stato rilasciato, esplicitamente o dalla garbage collection.
+"""
+import gc
+
+import pandas as pd
+
+from registro_dataset import DatasetCondiviso, RegistroDataset
+
+
+def costruttore(chiave, costruiti):
+    def costruisci():
+        costruiti.append(chiave)
+        return DatasetCondiviso(chiave, main_dataframe=pd.DataFrame({'Fatturato': [1.0, 2.0, 3.0]}))
+    return costruisci
+
+
+def test_chiave_dipende_da_contenuti_e_chiave_precedente():
+    chiave = RegistroDataset.chiave([b"vendite", b"catalogo"])
+
+    assert chiave == RegistroDataset.chiave([b"vendite", b"catalogo"])
+    assert chiave != RegistroDataset.chiave([b"catalogo", b"vendite"])
+    assert chiave != RegistroDataset.chiave([b"vendite", b"catalogo"], chiave_precedente="precedente")
+
+
+def test_dataset_costruito_una_volta_e_condiviso():
+    registro, costruiti = RegistroDataset(), []
+
+    primo = registro.acquisisci("a", costruttore("a", costruiti))
+    secondo = registro.acquisisci("a", costruttore("a", costruiti))
+    esistente = registro.acquisisci_esistente("a")
+
+    assert costruiti == ["a"]
+    assert primo.dataset is secondo.dataset is esistente.dataset
+    assert primo.main_dataframe is primo.dataset.main_dataframe
+    assert registro.acquisisci_esistente("b") is None
+    assert registro.statistiche() == (1, 3, primo.dataset.nbytes)
+
+
+def test_rilascio_esplicito_conta_i_riferimenti():
+    registro, costruiti = RegistroDataset(), []
+    primo = registro.acquisisci("a", costruttore("a", costruiti))
+    secondo = registro.acquisisci("a", costruttore("a", costruiti))
+
+    primo.rilascia()
+    primo.rilascia()  # Le chiamate successive non hanno effetto
+    assert registro.statistiche()[:2] == (1, 1)
+
+    secondo.rilascia()
+    assert registro.statistiche() == (0, 0, 0)
+    assert registro.acquisisci_esistente("a") is None
+
+    # Dopo l'eliminazione il dataset viene ricostruito
+    registro.acquisisci("a", costruttore("a", costruiti))
+    assert costruiti == ["a", "a"]
+
+
+def test_rilascio_automatico_alla_eliminazione_del_riferimento():
+    registro = RegistroDataset()
+    stato_sessione = {'dataset': registro.acquisisci("a", costruttore("a", []))}
+    altro = registro.acquisisci("b", costruttore("b", []))
+
+    del stato_sessione['dataset']
+    gc.collect()
+
+    assert registro.acquisisci_esistente("a") is None
+    assert registro.statistiche()[:2] == (1, 1)
+    assert altro.dataset.chiave == "b"
@@ -0,0 +1,137 @@
+"""
+Test dello storico aggiornabile in modo incrementale: i fogli nuovi o modificati sostituiscono le righe
+precedenti senza toccare quelle degli altri clienti, e cubo, indice e report restano uguali a quelli
+di un caricamento completo.
+"""
+import numpy as np
+import pandas as pd
+
+from dataset import costruisci_dataset, costruisci_dataset_incrementale
+from genera_dati import (genera_catalogo, genera_dettagli_referenze, genera_fogli_cliente, genera_workbook_cliente,
+                         workbook_da_fogli)
+from indici import IndiceFiltri
+from ingestione import DetailsIndex
+from kpi import (COLONNE_AGGREGATE, DIMENSIONI_CUBO, aggiorna_cubo_KPI, calcolo_KPI_da_aggregati, costruisci_cubo_KPI,
+                 interroga_cubo_KPI)
+from storico_vendite import StoricoVendite
+
+CLIENTI = ["Cliente 000", "Cliente 001", "Cliente 002"]
+
+
+def file_cliente_modificato(indice, aumento=1000.0):
+    """Cartella di lavoro del cliente con il fatturato della prima riga di marzo aumentato."""
+    fogli = genera_fogli_cliente(indice, n_referenze=20)
+    fogli["MARZO"].loc[0, "Fatturato"] += aumento
+    return workbook_da_fogli(fogli, f"cliente_{indice:03d}.xlsx")
+
+
+def file_cliente_senza_mesi(indice, mesi):
+    """Cartella di lavoro del cliente senza i fogli dei mesi indicati."""
+    fogli = genera_fogli_cliente(indice, n_referenze=20)
+    for mese in mesi:
+        del fogli[mese]
+    return workbook_da_fogli(fogli, f"cliente_{indice:03d}.xlsx")
+
+
+def fatturato(dataset, cliente="Tutti"):
+    return calcolo_KPI_da_aggregati(interroga_cubo_KPI(dataset.cubo, cliente), 0, 0).fatturato
+
+
+def celle_ordinate(cubo):
+    """Celle del cubo in un ordine che non dipende da come è stato costruito."""
+    celle = cubo.astype({'Cliente': str, 'Nome': object})
+    return celle.sort_values(DIMENSIONI_CUBO, ignore_index=True)[DIMENSIONI_CUBO + COLONNE_AGGREGATE + ['righe']]
+
+
+def assert_storico_uguale_a_caricamento_completo(storico, files, catalogo):
+    atteso = costruisci_dataset("atteso", [catalogo] + files)
+
+    assert len(storico.vendite) == len(atteso.main_dataframe)
+    assert len(storico.fogli_righe) == len(storico.righe_non_trovate) == len(storico.vendite)
+    for cliente in atteso.main_dataframe['Cliente'].unique():
+        assert np.isclose(storico.vendite.loc[storico.vendite['Cliente'] == cliente, 'Fatturato'].sum(),
+                          atteso.main_dataframe.loc[atteso.main_dataframe['Cliente'] == cliente, 'Fatturato'].sum())
+    pd.testing.assert_frame_equal(celle_ordinate(storico.cubo), celle_ordinate(atteso.cubo), check_dtype=False)
+    for dimensione in storico.indice.dimensioni:
+        assert sorted(storico.indice.opzioni(dimensione), key=str) == sorted(atteso.indice.opzioni(dimensione), key=str)
+    assert list(storico.indice.opzioni('Cliente')) == list(IndiceFiltri(storico.cubo).opzioni('Cliente'))
+    pd.testing.assert_frame_equal(storico.referenze_non_trovate.sort_values('Referente', ignore_index=True),
+                                  atteso.referenze_non_trovate.sort_values('Referente', ignore_index=True),
+                                  check_dtype=False)
+
+
+def test_incrementale_dopo_caricamento_completo_conserva_gli_altri_clienti():
+    catalogo = genera_dettagli_referenze(30)
+    file_clienti = [genera_workbook_cliente(i, n_referenze=20) for i in range(3)]
+    completo = costruisci_dataset("completo", [catalogo] + file_clienti)
+
+    aggiornato = costruisci_dataset_incrementale("incrementale", [file_cliente_modificato(1)], completo)
+    atteso = costruisci_dataset("atteso", [catalogo, file_clienti[0], file_cliente_modificato(1), file_clienti[2]])
+
+    assert len(aggiornato.main_dataframe) == len(completo.main_dataframe)
+    assert sorted(aggiornato.main_dataframe["Cliente"].unique()) == CLIENTI
+    for cliente in ["Cliente 000", "Cliente 002"]:
+        prima = completo.main_dataframe[completo.main_dataframe["Cliente"] == cliente]
+        dopo = aggiornato.main_dataframe[aggiornato.main_dataframe["Cliente"] == cliente]
+        assert len(dopo) == len(prima)
+        assert np.isclose(fatturato(aggiornato, cliente), fatturato(completo, cliente))
+
+    assert np.isclose(fatturato(aggiornato, "Cliente 001"), fatturato(completo, "Cliente 001") + 1000, rtol=1e-6)
+    assert np.isclose(fatturato(aggiornato), fatturato(atteso), rtol=1e-6)
+    assert aggiornato.indice.opzioni("Cliente") == CLIENTI
+
+
+def test_aggiorna_cubo_uguale_al_cubo_ricostruito():
+    catalogo = genera_dettagli_referenze(15)
+    file_clienti = [genera_workbook_cliente(i, n_referenze=20) for i in range(3)]
+    vendite = costruisci_dataset("cubo", [catalogo] + file_clienti).main_dataframe
+    cubo = costruisci_cubo_KPI(vendite)
+
+    rimosse = ((vendite['Cliente'] == "Cliente 001") & (vendite['Data'].dt.month >= 6)).to_numpy()
+    nuove = costruisci_dataset("nuove", [catalogo, file_cliente_modificato(1)]).main_dataframe
+    # Novembre e dicembre non vengono sostituiti: le loro celle si svuotano
+    nuove = nuove[nuove['Data'].dt.month.between(6, 10)]
+
+    aggiornato, posizioni = aggiorna_cubo_KPI(cubo, vendite[rimosse], nuove, posizioni=True)
+
+    atteso = costruisci_cubo_KPI(pd.concat([vendite[~rimosse], nuove], ignore_index=True))
+    pd.testing.assert_frame_equal(celle_ordinate(aggiornato), celle_ordinate(atteso), check_dtype=False)
+
+    # Le celle rimaste sono le prime, nello stesso ordine; quelle svuotate non hanno più posizione
+    tenute = posizioni >= 0
+    assert np.all(np.diff(posizioni[tenute]) == 1) and posizioni[tenute][0] == 0
+    pd.testing.assert_frame_equal(celle_ordinate(aggiornato.iloc[posizioni[tenute]])[DIMENSIONI_CUBO],
+                                  celle_ordinate(cubo[tenute])[DIMENSIONI_CUBO])
+    svuotate = cubo[~tenute]
+    assert len(svuotate) and (svuotate['Cliente'] == "Cliente 001").all()
+    assert set(svuotate['Data_datetime'].dt.month) == {11, 12}
+
+
+def test_aggiorna_sostituisce_solo_i_fogli_modificati():
+    catalogo = genera_dettagli_referenze(15)
+    indice_catalogo = DetailsIndex(genera_catalogo(15))
+    file_clienti = [genera_workbook_cliente(i, n_referenze=20) for i in range(2)]
+
+    # Clienti nuovi: tutti i fogli vengono aggiunti
+    storico, errori, n_fogli = StoricoVendite().aggiorna(file_clienti, indice_catalogo)
+    assert errori == {} and n_fogli == 24
+    assert_storico_uguale_a_caricamento_completo(storico, file_clienti, catalogo)
+
+    # Stessi file: nessun foglio viene rielaborato e lo storico resta lo stesso
+    invariato, _, n_fogli = storico.aggiorna(file_clienti, indice_catalogo)
+    assert n_fogli == 0 and invariato.vendite is storico.vendite and invariato.cubo is storico.cubo
+
+    # Un foglio modificato sostituisce solo le proprie righe
+    modificati = [file_clienti[0], file_cliente_modificato(1)]
+    modificato, _, n_fogli = storico.aggiorna(modificati, indice_catalogo)
+    assert n_fogli == 1
+    assert_storico_uguale_a_caricamento_completo(modificato, modificati, catalogo)
+
+    # I fogli tolti dal file vengono tolti dallo storico
+    ridotti = [file_clienti[0], file_cliente_senza_mesi(1, ["NOVEMBRE", "DICEMBRE"])]
+    ridotto, _, n_fogli = modificato.aggiorna(ridotti, indice_catalogo)
+    assert n_fogli == 1  # Marzo torna uguale all'originale
+    assert_storico_uguale_a_caricamento_completo(ridotto, ridotti, catalogo)
+
+    # Gli storici precedenti non vengono modificati
+    assert_storico_uguale_a_caricamento_completo(storico, file_clienti, catalogo)